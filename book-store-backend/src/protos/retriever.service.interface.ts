@@ -4,18 +4,72 @@ export interface HybridBookRetrieverService {
   Retrieve(
     request: RetrieveRequest,
   ): Observable<RetrieveResponse>;
+  BatchRetrieve(
+    request: BatchRetrieveRequest,
+  ): Observable<BatchRetrieveResponse>;
+  // Emits one message per stage: FUSED first, then RERANKING, then RERANKED
+  RetrieveStream(
+    request: RetrieveRequest,
+  ): Observable<RetrieveStreamResponse>;
 }
 
 
+export enum Fusion {
+    FUSION_UNSPECIFIED = 0,
+    // Reciprocal rank fusion: uses ranks only
+    RRF = 1,
+    // Distribution-based score fusion: scores scaled by their spread, then summed
+    DBSF = 2,
+}
+
 export interface RetrieveRequest {
     query: string;
     denseTopK: number;
     sparseTopK: number;
     topK: number;
     topN: number;
+    // First-stage fusion of the dense and sparse rankings (default RRF)
+    fusion?: Fusion;
+    // Share of the dense ranking in the fusion, from 0 (sparse only) to 1
+    // (dense only); unset means equal weights
+    denseWeight?: number;
+    // Return the fused ranking without cross-encoder reranking
+    skipRerank?: boolean;
 }
 
 export interface RetrieveResponse {
     bookIds: string[];
     scores: number[];
-}
\ No newline at end of file
+}
+
+export interface BatchRetrieveRequest {
+    queries: string[];
+    denseTopK: number;
+    sparseTopK: number;
+    topK: number;
+    topN: number;
+    fusion?: Fusion;
+    denseWeight?: number;
+}
+
+export interface BatchRetrieveResponse {
+    // One result per query, in request order
+    results: RetrieveResponse[];
+}
+
+// Numeric values: the client loads the proto without the enums: String option
+export enum Stage {
+    STAGE_UNSPECIFIED = 0,
+    FUSED = 1,
+    RERANKING = 2,
+    RERANKED = 3,
+}
+
+export interface RetrieveStreamResponse {
+    stage: Stage;
+    bookIds: string[];
+    scores: number[];
+    // Candidates reranked so far, out of total (RERANKING only)
+    scored: number;
+    total: number;
+}
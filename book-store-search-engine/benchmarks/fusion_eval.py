@@ -0,0 +1,131 @@
+"""Offline comparison of first-stage fusion strategies and dense weights.
+
+For each query the dense and sparse rankings are fetched once at ``--depth``,
+and every fusion strategy and dense weight is replayed on them locally with
+``retriever.fusion``. Relevance grades come from ``--qrels`` when a query is
+labelled there, and otherwise from the CrossEncoder scores of the whole
+candidate pool: grade 3 for its top 3, 2 for the rest of its top-N and 1 down
+to twice N. Against those grades, reranking the whole pool is the ceiling:
+they measure agreement with the reranker, not relevance, so pass ``--qrels``
+whenever reranking itself is being compared.
+
+Reported per strategy and weight (NDCG@N, averaged over queries):
+- ``ndcg_fused``: the fused ranking as is, without reranking
+- ``ndcg_rerank@K``: after reranking only the fused top-K
+- ``skip_rerank_share``: queries where the fused ranking is within
+  ``--tolerance`` of reranking the top ``--baseline-top-k``
+- ``min_top_k``: the smallest K whose NDCG is within ``--tolerance`` of that baseline
+
+Usage (from book-store-search-engine/, with the server's environment variables):
+    python -m benchmarks.fusion_eval [--queries benchmarks/fusion_queries.jsonl] [--qrels qrels.jsonl] [--depth 100] [--top-n 10]
+
+A qrels file has one ``{"query": ..., "relevant": {"<book id>": grade}}`` row per labelled query.
+"""
+import argparse
+import json
+import logging
+import math
+from typing import Any, Dict, List
+from constants.constants import DENSE_FIELD, SPARSE_FIELD
+from retriever.fusion import FUSIONS, fuse, fusion_weights
+
+DENSE_WEIGHTS = [0.0, 0.25, 0.4, 0.5, 0.6, 0.75, 1.0]
+TOP_KS = [10, 20, 30, 50, 100]
+
+
+def load_rows(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def reranker_grades(ce_scores: Dict[Any, float], top_n: int) -> Dict[str, int]:
+    """Graded relevance from the reranker's ranking of the candidate pool."""
+    ranked = sorted(ce_scores, key=lambda i: -ce_scores[i])
+    grades = {}
+    for rank, point_id in enumerate(ranked[:2 * top_n]):
+        grades[str(point_id)] = 3 if rank < 3 else 2 if rank < top_n else 1
+    return grades
+
+
+def ndcg(ranking: List[Any], grades: Dict[str, int], n: int) -> float:
+    dcg = sum((2 ** grades.get(str(i), 0) - 1) / math.log2(rank + 2) for rank, i in enumerate(ranking[:n]))
+    ideal = sorted(grades.values(), reverse=True)[:n]
+    idcg = sum((2 ** g - 1) / math.log2(rank + 2) for rank, g in enumerate(ideal))
+    return dcg / idcg if idcg else 0.0
+
+
+def evaluate_query(retriever, query: str, grades: Dict[str, int] | None, depth: int, top_n: int, top_ks: List[int]) -> Dict[str, Dict[str, float]]:
+    """NDCG of every (fusion, dense weight) for one query, keyed by ``"{fusion}@{weight}"``."""
+    query_emb = retriever.embed_hybrid(query)
+    limits = {"dense_top_k": depth, "sparse_top_k": depth, "top_k": depth}
+    responses = retriever.client.query_batch_points(
+        collection_name=retriever.collection_name,
+        requests=retriever._ranking_requests(query_emb, DENSE_FIELD, SPARSE_FIELD, limits, None, False),
+    )
+    rankings = [[(p.id, p.score) for p in r.points] for r in responses]
+    pool = list({p.id: p for r in responses for p in r.points}.values())
+    ce_scores = dict(zip([p.id for p in pool], retriever._score(query, retriever._rerank_texts(pool))))
+    grades = grades or reranker_grades(ce_scores, top_n)
+
+    results = {}
+    for fusion in FUSIONS:
+        for dense_weight in DENSE_WEIGHTS:
+            fused = [i for i, _ in fuse(fusion, rankings, fusion_weights(dense_weight, has_dense=len(rankings) == 2))]
+            scores = {"ndcg_fused": ndcg(fused, grades, top_n)}
+            for k in top_ks:
+                reranked = sorted(fused[:k], key=lambda i: -ce_scores[i])
+                scores[f"ndcg_rerank@{k}"] = ndcg(reranked, grades, top_n)
+            results[f"{fusion}@{dense_weight}"] = scores
+    return results
+
+
+def summarize(per_query: List[Dict[str, Dict[str, float]]], top_ks: List[int], baseline_top_k: int, tolerance: float) -> Dict[str, Dict[str, Any]]:
+    report = {}
+    for config in per_query[0]:
+        rows = [q[config] for q in per_query]
+        means = {metric: sum(r[metric] for r in rows) / len(rows) for metric in rows[0]}
+        baseline = f"ndcg_rerank@{baseline_top_k}"
+        means["skip_rerank_share"] = sum(r["ndcg_fused"] >= r[baseline] - tolerance for r in rows) / len(rows)
+        means["min_top_k"] = next((k for k in top_ks if means[f"ndcg_rerank@{k}"] >= means[baseline] - tolerance), None)
+        report[config] = {k: round(v, 4) if isinstance(v, float) else v for k, v in means.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default="benchmarks/fusion_queries.jsonl", help="JSONL file of {query} rows.")
+    parser.add_argument("--qrels", help="JSONL file of {query, relevant} rows with human relevance grades.")
+    parser.add_argument("--depth", type=int, default=100, help="Dense and sparse prefetch depth.")
+    parser.add_argument("--top-n", type=int, default=10, help="Cutoff of NDCG and of the reranker grades.")
+    parser.add_argument("--baseline-top-k", type=int, default=50, help="Reranking depth the others are compared with.")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="NDCG difference counted as equal.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    from redis import Redis
+    from main import build_retriever, redis_client_factory
+
+    retriever = build_retriever(redis_client_factory(Redis, decode_responses=True), redis_client_factory(Redis, decode_responses=False))
+    qrels = {row["query"]: {str(k): v for k, v in row["relevant"].items()} for row in load_rows(args.qrels)} if args.qrels else {}
+    if not qrels:
+        logging.warning(
+            "No --qrels given: every query is graded by the same CrossEncoder that reranks, so the rerank "
+            "columns measure agreement with the reranker, not relevance. Use human labels to compare against it."
+        )
+    top_ks = sorted({k for k in TOP_KS if args.top_n <= k <= args.depth} | {args.baseline_top_k})
+    per_query = []
+    for row in load_rows(args.queries):
+        per_query.append(evaluate_query(retriever, row["query"], qrels.get(row["query"]), args.depth, args.top_n, top_ks))
+    report = summarize(per_query, top_ks, args.baseline_top_k, args.tolerance)
+
+    logging.info(f"Fusion evaluation over {len(per_query)} queries (NDCG@{args.top_n}, {len(qrels)} with human labels):")
+    for config, metrics in sorted(report.items(), key=lambda item: -item[1]["ndcg_fused"]):
+        logging.info(f"{config}: {json.dumps(metrics)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
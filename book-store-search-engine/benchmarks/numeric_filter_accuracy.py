@@ -0,0 +1,123 @@
+"""Accuracy of the rule-based numeric filter parser on labelled query sets.
+
+Compares price, rating and rating count bounds from ``parse_numeric_filters``
+with the labels, and with ``--llm`` also those of the LLM extractor and of the
+full extractor (rules first, LLM when needed), so they can be compared on the
+same queries.
+
+Rows may also label the ``authors`` a query names. The rules never extract
+authors, so for them the check is that no query naming an author is resolved
+locally (``authors_dropped`` must be 0). The extractors are scored on author
+exact match, ignoring case.
+
+``numeric_filter_queries.jsonl`` is the set the rules were developed against;
+``numeric_filter_queries_heldout.jsonl`` was written afterwards and is not used
+to tune them, so its numbers are the ones to trust.
+
+Usage (from book-store-search-engine/):
+    python -m benchmarks.numeric_filter_accuracy [--llm] [--queries benchmarks/numeric_filter_queries.jsonl ...]
+"""
+import argparse
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List
+from query_processor.numeric_filter_parser import parse_numeric_filters, is_resolved
+
+NUMERIC_FIELDS = ["price_min", "price_max", "rating_min", "rating_max", "rating_count_min", "rating_count_max"]
+QUERY_FILES = ["benchmarks/numeric_filter_queries.jsonl", "benchmarks/numeric_filter_queries_heldout.jsonl"]
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _numeric(filters: Dict[str, Any]) -> Dict[str, float]:
+    return {k: float(filters[k]) for k in NUMERIC_FIELDS if filters.get(k) is not None}
+
+
+def _authors(authors: List[str] | None) -> List[str]:
+    return sorted(" ".join(a.lower().replace(".", ". ").split()) for a in authors or [])
+
+
+def evaluate(name: str, extract: Callable[[str], Dict[str, Any]], rows: List[Dict[str, Any]], score_authors: bool) -> Dict[str, Any]:
+    """Score an extractor: exact match per query and precision/recall per numeric field, plus authors if ``score_authors``."""
+    exact = tp = fp = fn = authors_exact = 0
+    latencies = []
+    failures = []
+    for row in rows:
+        start = time.perf_counter()
+        filters = extract(row["query"])
+        latencies.append(time.perf_counter() - start)
+        predicted = _numeric(filters)
+        expected = _numeric(row["expected"])
+        exact += predicted == expected
+        tp += sum(1 for k, v in predicted.items() if expected.get(k) == v)
+        fp += sum(1 for k, v in predicted.items() if expected.get(k) != v)
+        fn += sum(1 for k, v in expected.items() if predicted.get(k) != v)
+        authors_match = _authors(filters.get("authors")) == _authors(row.get("authors"))
+        authors_exact += authors_match
+        if predicted != expected or (score_authors and not authors_match):
+            failures.append({"query": row["query"], "expected": expected, "predicted": predicted, "expected_authors": row.get("authors"), "predicted_authors": filters.get("authors")})
+    latencies.sort()
+    report = {
+        "extractor": name,
+        "queries": len(rows),
+        "exact_match": exact / len(rows),
+        "field_precision": tp / (tp + fp) if tp + fp else 1.0,
+        "field_recall": tp / (tp + fn) if tp + fn else 1.0,
+        "p50_latency_ms": latencies[len(latencies) // 2] * 1000,
+        "max_latency_ms": latencies[-1] * 1000,
+        "failures": failures,
+    }
+    if score_authors:
+        report["authors_exact_match"] = authors_exact / len(rows)
+    return report
+
+
+def local_route(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Queries the extractor would answer without the LLM, and those among them that name an author."""
+    resolved = []
+    for row in rows:
+        filters, remainder = parse_numeric_filters(row["query"])
+        if filters and is_resolved(remainder):
+            resolved.append(row)
+    dropped = [row["query"] for row in resolved if row.get("authors")]
+    return {"llm_skipped": len(resolved), "authors_dropped": len(dropped), "dropped_queries": dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", nargs="+", default=QUERY_FILES, help="JSONL files of {query, expected, authors?} rows.")
+    parser.add_argument("--llm", action="store_true", help="Also evaluate the LLM and full extractors (needs CEREBRAS_API_KEY).")
+    args = parser.parse_args()
+
+    extractors = []
+    if args.llm:
+        from query_processor.book_filter_extractor import BookFilterExtractor
+
+        extractors = [
+            ("llm", BookFilterExtractor(local_numeric_parsing=False).extract),
+            ("rules+llm", BookFilterExtractor(local_numeric_parsing=True).extract),
+        ]
+
+    for path in args.queries:
+        rows = load_queries(path)
+        route = local_route(rows)
+        logging.info(f"{path}: LLM skipped for {route['llm_skipped']}/{len(rows)} queries, authors dropped for {route['authors_dropped']}")
+        for query in route["dropped_queries"]:
+            logging.info(f"[rules] author dropped: {query}")
+
+        reports = [evaluate("rules", lambda q: parse_numeric_filters(q)[0], rows, score_authors=False)]
+        reports += [evaluate(name, extract, rows, score_authors=True) for name, extract in extractors]
+        for report in reports:
+            failures = report.pop("failures")
+            logging.info(f"{path}: {json.dumps(report, indent=2)}")
+            for failure in failures:
+                logging.info(f"[{report['extractor']}] mismatch: {json.dumps(failure)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,150 @@
+"""Memory, speed and recall of quantized dense vectors against the unquantized collection.
+
+The dense vectors of the book collection are copied into one scratch
+collection per storage variant (unquantized in RAM, scalar int8 and binary
+quantization with the originals on disk). Each variant is queried with the
+same dense vectors: the embedded ``--queries`` if given, otherwise
+``--sample`` vectors of stored books. The reference top-k is an exact
+(brute-force) search of the unquantized vectors.
+
+Reported per variant and search setting:
+- ``vector_ram_mb``: estimated RAM of the dense vectors (``retriever.quantization.vector_ram_bytes``), without the HNSW graph
+- ``qps`` / ``p50_ms`` / ``p95_ms``: sequential dense searches of ``--top-k`` points
+- ``recall@k``: share of the exact top-k found
+
+Usage (from book-store-search-engine/, with the server's environment variables):
+    python -m benchmarks.quantization_benchmark [--sample 200] [--queries benchmarks/fusion_queries.jsonl] [--top-k 50] [--keep]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+import numpy as np
+from qdrant_client import QdrantClient, models
+from constants.constants import BOOK_COLLECTION_NAME, DENSE_FIELD, DENSE_DIM
+from retriever.quantization import BINARY, NONE, SCALAR, dense_search_params, quantization_config, vector_ram_bytes
+
+# (quantization, originals on disk, search settings as (oversampling, rescore); None is Qdrant's default search)
+VARIANTS = [
+    (NONE, False, [None]),
+    (SCALAR, True, [(1.0, False), (1.0, True), (2.0, True)]),
+    (BINARY, True, [(1.0, False), (2.0, True), (3.0, True), (4.0, True)]),
+]
+
+
+def copy_dense_vectors(client: QdrantClient, target: str, quantization: str, on_disk: bool, page_size: int = 1000) -> int:
+    """Create ``target`` with the given dense storage and copy every dense vector of the book collection into it."""
+    source = client.get_collection(BOOK_COLLECTION_NAME)
+    if client.collection_exists(target):
+        client.delete_collection(target)
+    client.create_collection(
+        collection_name=target,
+        vectors_config={
+            DENSE_FIELD: models.VectorParams(size=DENSE_DIM, distance=models.Distance.COSINE, datatype=models.Datatype.FLOAT16, on_disk=on_disk),
+        },
+        hnsw_config=models.HnswConfigDiff(**source.config.hnsw_config.model_dump()),
+        quantization_config=quantization_config(quantization),
+    )
+    copied, offset = 0, None
+    while True:
+        points, offset = client.scroll(
+            collection_name=BOOK_COLLECTION_NAME, limit=page_size, offset=offset, with_payload=False, with_vectors=[DENSE_FIELD],
+        )
+        points = [p for p in points if DENSE_FIELD in (p.vector or {})]
+        if points:
+            client.upsert(
+                collection_name=target,
+                points=models.Batch(ids=[p.id for p in points], vectors={DENSE_FIELD: [p.vector[DENSE_FIELD] for p in points]}),
+                wait=True,
+            )
+            copied += len(points)
+        if offset is None:
+            break
+    # Quantized vectors and the HNSW graph are built by the optimizer after the upload
+    while client.get_collection(target).status != models.CollectionStatus.GREEN:
+        time.sleep(1)
+    return copied
+
+
+def query_vectors(client: QdrantClient, sample: int, queries: str | None) -> List[List[float]]:
+    """Dense vectors of the ``queries`` file when given, else of ``sample`` random stored books."""
+    if queries:
+        from retriever.embedding_client import build_dense_embedder
+
+        with open(queries) as f:
+            texts = [json.loads(line)["query"] for line in f if line.strip()]
+        embedder = build_dense_embedder(os.getenv("DENSE_BACKEND", "jina"))
+        try:
+            return embedder.embed(texts)
+        finally:
+            embedder.close()
+    points = client.query_points(
+        collection_name=BOOK_COLLECTION_NAME,
+        query=models.SampleQuery(sample=models.Sample.RANDOM),
+        limit=sample,
+        with_vectors=[DENSE_FIELD],
+    ).points
+    return [p.vector[DENSE_FIELD] for p in points if DENSE_FIELD in (p.vector or {})]
+
+
+def search(client: QdrantClient, collection: str, vectors: List[List[float]], top_k: int, params: models.SearchParams | None) -> Dict[str, Any]:
+    latencies, results = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        points = client.query_points(collection_name=collection, query=vector, using=DENSE_FIELD, limit=top_k, search_params=params).points
+        latencies.append(time.perf_counter() - start)
+        results.append([p.id for p in points])
+    return {"results": results, "latencies": latencies}
+
+
+def recall(results: List[List[Any]], exact: List[List[Any]], top_k: int) -> float:
+    return float(np.mean([len(set(r[:top_k]) & set(e[:top_k])) / max(len(e[:top_k]), 1) for r, e in zip(results, exact)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=200, help="Stored book vectors used as queries when --queries is not given.")
+    parser.add_argument("--queries", help="JSONL file of {query} rows, embedded with DENSE_BACKEND.")
+    parser.add_argument("--top-k", type=int, default=50, help="Points per search; the dense prefetch depth of the server.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), timeout=600)
+    vectors = query_vectors(client, args.sample, args.queries)
+    report = {}
+    exact = None
+    for quantization, on_disk, settings in VARIANTS:
+        collection = f"{BOOK_COLLECTION_NAME}_bench_{quantization}"
+        points = copy_dense_vectors(client, collection, quantization, on_disk)
+        if exact is None:
+            exact = search(client, collection, vectors, args.top_k, models.SearchParams(exact=True))["results"]
+        ram_mb = vector_ram_bytes(points, quantization, on_disk)["total"] / 2 ** 20
+        for setting in settings:
+            params = dense_search_params(*setting) if setting else None
+            run = search(client, collection, vectors, args.top_k, params)
+            latencies = np.asarray(run["latencies"]) * 1000
+            name = quantization if setting is None else f"{quantization} (oversampling={setting[0]}, rescore={setting[1]})"
+            report[name] = {
+                "vector_ram_mb": round(ram_mb, 2),
+                "qps": round(len(latencies) / (latencies.sum() / 1000), 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                f"recall@{args.top_k}": round(recall(run["results"], exact, args.top_k), 4),
+            }
+        if not args.keep:
+            client.delete_collection(collection)
+
+    logging.info(f"Quantization benchmark over {len(vectors)} queries and {points} points:")
+    for name, metrics in report.items():
+        logging.info(f"{name}: {json.dumps(metrics)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
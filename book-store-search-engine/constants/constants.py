@@ -1,3 +1,8 @@
 BOOK_COLLECTION_NAME = "book_collection"
 DENSE_FIELD = "description_summary_text"
 SPARSE_FIELD = "description_summary_text_sparse"
+
+DENSE_DIM = 1024
+RERANK_TEXT_FIELD = "rerank_text"
+RERANK_TEXT_VERSION_FIELD = "rerank_text_version"
+SOURCE_UPDATED_AT_FIELD = "source_updated_at"
@@ -1,28 +1,103 @@
+import asyncio
 import grpc
 from concurrent import futures
 import logging
 import os
+import threading
 from grpc_health.v1 import health, health_pb2, health_pb2_grpc
 from redis import Redis
-from qdrant_client import QdrantClient
-from protos.retriever_server import HybridBookRetrieverServicer
+from redis.asyncio import Redis as AsyncRedis
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from protos.retriever_server import HybridBookRetrieverServicer, AsyncHybridBookRetrieverServicer
 from protos.retriever_pb2_grpc import add_HybridBookRetrieverServicer_to_server
 from retriever.hybrid_retriever import HybridRetriever
+from retriever.async_hybrid_retriever import AsyncHybridRetriever
+from retriever.embedding_cache import EmbeddingCache
+from retriever.single_flight import SingleFlight
+from retriever.adaptive_depth import AdaptiveDepth
+from retriever.quantization import dense_search_params
 from query_processor.book_filter_extractor import BookFilterExtractor
+from query_processor.query_classifier import QueryClassifier
+from query_processor.semantic_query_cache import SemanticQueryCache
 import logging
 
 
-
-def serve():
+def build_retriever(redis_client: Redis, binary_redis_client: Redis, async_binary_redis_client: AsyncRedis | None = None) -> HybridRetriever:
     qdrant_client = QdrantClient(url=os.getenv("QDRANT_URL"))
-    redis_client = Redis(
+    embedding_cache = EmbeddingCache(
+        binary_redis_client,
+        async_redis_client=async_binary_redis_client,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", 10000)),
+        dense_dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float16"),
+    )
+
+    query_processor = BookFilterExtractor(
+        local_numeric_parsing=os.getenv("LOCAL_NUMERIC_PARSING", "true").lower() == "true",
+    )
+    single_flight = SingleFlight(
+        redis_client if os.getenv("SINGLE_FLIGHT_REDIS_LOCK", "false").lower() == "true" else None,
+        lock_timeout=float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", 30)),
+        wait_timeout=float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", 30)),
+    )
+    query_classifier = QueryClassifier(
+        model_name=os.getenv("QUERY_CLASSIFIER_MODEL") or None,
+    ) if os.getenv("QUERY_ROUTING", "true").lower() == "true" else None
+    semantic_cache = SemanticQueryCache(
+        max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", 5000)),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        verify_rate=float(os.getenv("SEMANTIC_CACHE_VERIFY_RATE", 0.05)),
+        candidates=int(os.getenv("SEMANTIC_CACHE_CANDIDATES", 5)),
+    ) if os.getenv("SEMANTIC_CACHE", "true").lower() == "true" else None
+    adaptive_depth = AdaptiveDepth(
+        initial_prefetch=int(os.getenv("ADAPTIVE_DEPTH_INITIAL", 25)),
+        initial_top_k=int(os.getenv("ADAPTIVE_DEPTH_INITIAL_TOP_K", 20)),
+        min_overlap=float(os.getenv("ADAPTIVE_DEPTH_MIN_OVERLAP", 0.3)),
+    ) if os.getenv("ADAPTIVE_DEPTH", "false").lower() == "true" else None
+    search_params = dense_search_params(
+        oversampling=float(os.getenv("DENSE_OVERSAMPLING")),
+        rescore=os.getenv("DENSE_RESCORE", "true").lower() == "true",
+    ) if os.getenv("DENSE_OVERSAMPLING") else None
+    return HybridRetriever(
+        qdrant_client,
+        binary_redis_client,
+        query_processor,
+        embedding_cache=embedding_cache,
+        reranker_backend=os.getenv("RERANKER_BACKEND", "torch"),
+        rerank_batching=os.getenv("RERANK_BATCHING", "true").lower() == "true",
+        rerank_max_wait_ms=float(os.getenv("RERANK_MAX_WAIT_MS", 5.0)),
+        query_classifier=query_classifier,
+        speculative_search=os.getenv("SPECULATIVE_SEARCH", "true").lower() == "true",
+        semantic_cache=semantic_cache,
+        search_cache_ttl=int(os.getenv("SEARCH_CACHE_TTL", 60 * 60)),
+        search_cache_min_ttl=int(os.getenv("SEARCH_CACHE_MIN_TTL", 10 * 60)),
+        search_cache_max_ttl=int(os.getenv("SEARCH_CACHE_MAX_TTL", 6 * 60 * 60)),
+        single_flight=single_flight,
+        adaptive_depth=adaptive_depth,
+        dense_search_params=search_params,
+    )
+
+
+def start_warm_up(retriever: HybridRetriever):
+    """Precompute the most popular recent searches in the background while the server starts."""
+    max_queries = int(os.getenv("WARMUP_TOP_N", 50))
+    if max_queries > 0:
+        threading.Thread(target=retriever.warm_up, args=(max_queries,), name="cache-warm-up", daemon=True).start()
+
+
+def redis_client_factory(redis_cls, decode_responses: bool):
+    return redis_cls(
         host=os.getenv("REDIS_HOST"),
         port=int(os.getenv("REDIS_PORT")),
-        decode_responses=True,
+        decode_responses=decode_responses,
     )
 
-    query_processor = BookFilterExtractor()
-    retriever = HybridRetriever(qdrant_client, redis_client, query_processor)
+
+def serve():
+    redis_client = redis_client_factory(Redis, decode_responses=True)
+    # Embeddings and search results are cached as raw bytes, so they need a client that does not decode
+    binary_redis_client = redis_client_factory(Redis, decode_responses=False)
+    retriever = build_retriever(redis_client, binary_redis_client)
+    start_warm_up(retriever)
 
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
 
@@ -42,10 +117,57 @@ def serve():
     try:
         server.wait_for_termination()
     finally:
-        redis_client.flushall()
         redis_client.close()
+        binary_redis_client.close()
+        retriever.dense_embedder.close()
+        if retriever.rerank_scheduler is not None:
+            retriever.rerank_scheduler.close()
+
+
+async def serve_async():
+    """Serve on grpc.aio: concurrency is bounded by I/O wait rather than a thread pool."""
+    redis_client = redis_client_factory(Redis, decode_responses=True)
+    binary_redis_client = redis_client_factory(Redis, decode_responses=False)
+    async_binary_redis_client = redis_client_factory(AsyncRedis, decode_responses=False)
+    retriever = build_retriever(redis_client, binary_redis_client, async_binary_redis_client)
+    start_warm_up(retriever)
+    async_retriever = AsyncHybridRetriever(
+        retriever,
+        AsyncQdrantClient(url=os.getenv("QDRANT_URL")),
+        async_binary_redis_client,
+        cpu_workers=int(os.getenv("CPU_WORKERS", os.cpu_count() or 4)),
+    )
+
+    server = grpc.aio.server()
+
+    health_servicer = health.aio.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    await health_servicer.set("", health_pb2.HealthCheckResponse.SERVING)
+
+    add_HybridBookRetrieverServicer_to_server(
+        AsyncHybridBookRetrieverServicer(async_retriever), server
+    )
+
+    server.add_insecure_port("[::]:50051")
+    await server.start()
+
+    print("Async server started on port 50051")
+
+    try:
+        await server.wait_for_termination()
+    finally:
+        await async_binary_redis_client.aclose()
+        await async_retriever.close()
+        redis_client.close()
+        binary_redis_client.close()
+        retriever.dense_embedder.close()
+        if retriever.rerank_scheduler is not None:
+            retriever.rerank_scheduler.close()
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    serve()
+    if os.getenv("SERVER_MODE", "sync") == "aio":
+        asyncio.run(serve_async())
+    else:
+        serve()
@@ -1,6 +1,21 @@
 import logging
-from fastembed import SparseTextEmbedding
+import os
+from fastembed import SparseTextEmbedding, TextEmbedding
 from sentence_transformers import CrossEncoder
+from retriever.onnx_reranker import OnnxCrossEncoder, export_onnx_reranker, check_parity, DEFAULT_ONNX_DIR
+
+PARITY_QUERIES = [
+    "fantasy novel about a boy at a school of magic",
+    "cheap detective mystery set in london",
+    "history of the second world war",
+]
+PARITY_DOCUMENTS = [
+    "Title: Harry Potter and the Sorcerer's Stone. Description: A young wizard begins his education at Hogwarts. Categories: Fantasy, Young Adult",
+    "Title: The Hound of the Baskervilles. Description: Sherlock Holmes investigates a legendary hound on the moors. Categories: Mystery, Classics",
+    "Title: The Second World War. Description: A one-volume history of the global conflict from 1939 to 1945. Categories: History, Nonfiction",
+    "Title: Clean Code. Description: A handbook of agile software craftsmanship. Categories: Programming, Technology",
+    "Title: The Hobbit. Description: Bilbo Baggins is swept into a quest to reclaim a dragon's treasure. Categories: Fantasy, Classics",
+]
 
 logging.basicConfig(level=logging.INFO)
 
@@ -10,6 +25,11 @@ def download_models():
     logging.info("Downloading FastEmbed sparse model...")
     sparse_model = SparseTextEmbedding(model_name="prithivida/Splade_PP_en_v1")
     logging.info("✓ FastEmbed sparse model downloaded")
+
+    if os.getenv("DENSE_BACKEND") == "fastembed":
+        logging.info("Downloading FastEmbed local dense model...")
+        dense_model = TextEmbedding(model_name=os.getenv("LOCAL_DENSE_MODEL", "jinaai/jina-embeddings-v3"))
+        logging.info("✓ FastEmbed local dense model downloaded")
     
     logging.info("Downloading CrossEncoder reranker model...")
     reranker = CrossEncoder(
@@ -17,6 +37,11 @@ def download_models():
         trust_remote_code=True,
     )
     logging.info("✓ CrossEncoder reranker model downloaded")
+
+    logging.info("Exporting int8 ONNX reranker...")
+    onnx_dir = export_onnx_reranker(output_dir=os.getenv("RERANKER_ONNX_DIR", DEFAULT_ONNX_DIR))
+    parity = check_parity(OnnxCrossEncoder(onnx_dir), reranker, PARITY_QUERIES, PARITY_DOCUMENTS)
+    logging.info(f"✓ ONNX reranker exported, parity with PyTorch: {parity}")
     
     logging.info("All models downloaded successfully!")
 
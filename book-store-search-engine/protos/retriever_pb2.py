@@ -24,17 +24,27 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0fretriever.proto\x12\x06protos\"i\n\x0fRetrieveRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65nse_top_k\x18\x02 \x01(\x05\x12\x14\n\x0csparse_top_k\x18\x03 \x01(\x05\x12\r\n\x05top_k\x18\x04 \x01(\x05\x12\r\n\x05top_n\x18\x05 \x01(\x05\"4\n\x10RetrieveResponse\x12\x10\n\x08\x62ook_ids\x18\x01 \x03(\t\x12\x0e\n\x06scores\x18\x02 \x03(\x02\x32T\n\x13HybridBookRetriever\x12=\n\x08Retrieve\x12\x17.protos.RetrieveRequest\x1a\x18.protos.RetrieveResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0fretriever.proto\x12\x06protos\"\xca\x01\n\x0fRetrieveRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65nse_top_k\x18\x02 \x01(\x05\x12\x14\n\x0csparse_top_k\x18\x03 \x01(\x05\x12\r\n\x05top_k\x18\x04 \x01(\x05\x12\r\n\x05top_n\x18\x05 \x01(\x05\x12\x1e\n\x06\x66usion\x18\x06 \x01(\x0e\x32\x0e.protos.Fusion\x12\x19\n\x0c\x64\x65nse_weight\x18\x07 \x01(\x02H\x00\x88\x01\x01\x12\x13\n\x0bskip_rerank\x18\x08 \x01(\x08\x42\x0f\n\r_dense_weight\"4\n\x10RetrieveResponse\x12\x10\n\x08\x62ook_ids\x18\x01 \x03(\t\x12\x0e\n\x06scores\x18\x02 \x03(\x02\"\xbc\x01\n\x14\x42\x61tchRetrieveRequest\x12\x0f\n\x07queries\x18\x01 \x03(\t\x12\x13\n\x0b\x64\x65nse_top_k\x18\x02 \x01(\x05\x12\x14\n\x0csparse_top_k\x18\x03 \x01(\x05\x12\r\n\x05top_k\x18\x04 \x01(\x05\x12\r\n\x05top_n\x18\x05 \x01(\x05\x12\x1e\n\x06\x66usion\x18\x06 \x01(\x0e\x32\x0e.protos.Fusion\x12\x19\n\x0c\x64\x65nse_weight\x18\x07 \x01(\x02H\x00\x88\x01\x01\x42\x0f\n\r_dense_weight\"B\n\x15\x42\x61tchRetrieveResponse\x12)\n\x07results\x18\x01 \x03(\x0b\x32\x18.protos.RetrieveResponse\"w\n\x16RetrieveStreamResponse\x12\x1c\n\x05stage\x18\x01 \x01(\x0e\x32\r.protos.Stage\x12\x10\n\x08\x62ook_ids\x18\x02 \x03(\t\x12\x0e\n\x06scores\x18\x03 \x03(\x02\x12\x0e\n\x06scored\x18\x04 \x01(\x05\x12\r\n\x05total\x18\x05 \x01(\x05*3\n\x06\x46usion\x12\x16\n\x12\x46USION_UNSPECIFIED\x10\x00\x12\x07\n\x03RRF\x10\x01\x12\x08\n\x04\x44\x42SF\x10\x02*F\n\x05Stage\x12\x15\n\x11STAGE_UNSPECIFIED\x10\x00\x12\t\n\x05\x46USED\x10\x01\x12\r\n\tRERANKING\x10\x02\x12\x0c\n\x08RERANKED\x10\x03\x32\xef\x01\n\x13HybridBookRetriever\x12=\n\x08Retrieve\x12\x17.protos.RetrieveRequest\x1a\x18.protos.RetrieveResponse\x12L\n\rBatchRetrieve\x12\x1c.protos.BatchRetrieveRequest\x1a\x1d.protos.BatchRetrieveResponse\x12K\n\x0eRetrieveStream\x12\x17.protos.RetrieveRequest\x1a\x1e.protos.RetrieveStreamResponse0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'retriever_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_RETRIEVEREQUEST']._serialized_start=27
-  _globals['_RETRIEVEREQUEST']._serialized_end=132
-  _globals['_RETRIEVERESPONSE']._serialized_start=134
-  _globals['_RETRIEVERESPONSE']._serialized_end=186
-  _globals['_HYBRIDBOOKRETRIEVER']._serialized_start=188
-  _globals['_HYBRIDBOOKRETRIEVER']._serialized_end=272
+  _globals['_FUSION']._serialized_start=666
+  _globals['_FUSION']._serialized_end=717
+  _globals['_STAGE']._serialized_start=719
+  _globals['_STAGE']._serialized_end=789
+  _globals['_RETRIEVEREQUEST']._serialized_start=28
+  _globals['_RETRIEVEREQUEST']._serialized_end=230
+  _globals['_RETRIEVERESPONSE']._serialized_start=232
+  _globals['_RETRIEVERESPONSE']._serialized_end=284
+  _globals['_BATCHRETRIEVEREQUEST']._serialized_start=287
+  _globals['_BATCHRETRIEVEREQUEST']._serialized_end=475
+  _globals['_BATCHRETRIEVERESPONSE']._serialized_start=477
+  _globals['_BATCHRETRIEVERESPONSE']._serialized_end=543
+  _globals['_RETRIEVESTREAMRESPONSE']._serialized_start=545
+  _globals['_RETRIEVESTREAMRESPONSE']._serialized_end=664
+  _globals['_HYBRIDBOOKRETRIEVER']._serialized_start=792
+  _globals['_HYBRIDBOOKRETRIEVER']._serialized_end=1031
 # @@protoc_insertion_point(module_scope)
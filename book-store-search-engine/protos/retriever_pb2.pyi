@@ -1,22 +1,51 @@
 from google.protobuf.internal import containers as _containers
+from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from collections.abc import Iterable as _Iterable
-from typing import ClassVar as _ClassVar, Optional as _Optional
+from collections.abc import Iterable as _Iterable, Mapping as _Mapping
+from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
+class Fusion(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    FUSION_UNSPECIFIED: _ClassVar[Fusion]
+    RRF: _ClassVar[Fusion]
+    DBSF: _ClassVar[Fusion]
+
+class Stage(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    STAGE_UNSPECIFIED: _ClassVar[Stage]
+    FUSED: _ClassVar[Stage]
+    RERANKING: _ClassVar[Stage]
+    RERANKED: _ClassVar[Stage]
+FUSION_UNSPECIFIED: Fusion
+RRF: Fusion
+DBSF: Fusion
+STAGE_UNSPECIFIED: Stage
+FUSED: Stage
+RERANKING: Stage
+RERANKED: Stage
+
 class RetrieveRequest(_message.Message):
-    __slots__ = ("query", "dense_top_k", "sparse_top_k", "top_k")
+    __slots__ = ("query", "dense_top_k", "sparse_top_k", "top_k", "top_n", "fusion", "dense_weight", "skip_rerank")
     QUERY_FIELD_NUMBER: _ClassVar[int]
     DENSE_TOP_K_FIELD_NUMBER: _ClassVar[int]
     SPARSE_TOP_K_FIELD_NUMBER: _ClassVar[int]
     TOP_K_FIELD_NUMBER: _ClassVar[int]
+    TOP_N_FIELD_NUMBER: _ClassVar[int]
+    FUSION_FIELD_NUMBER: _ClassVar[int]
+    DENSE_WEIGHT_FIELD_NUMBER: _ClassVar[int]
+    SKIP_RERANK_FIELD_NUMBER: _ClassVar[int]
     query: str
     dense_top_k: int
     sparse_top_k: int
     top_k: int
-    def __init__(self, query: _Optional[str] = ..., dense_top_k: _Optional[int] = ..., sparse_top_k: _Optional[int] = ..., top_k: _Optional[int] = ...) -> None: ...
+    top_n: int
+    fusion: Fusion
+    dense_weight: float
+    skip_rerank: bool
+    def __init__(self, query: _Optional[str] = ..., dense_top_k: _Optional[int] = ..., sparse_top_k: _Optional[int] = ..., top_k: _Optional[int] = ..., top_n: _Optional[int] = ..., fusion: _Optional[_Union[Fusion, str]] = ..., dense_weight: _Optional[float] = ..., skip_rerank: bool = ...) -> None: ...
 
 class RetrieveResponse(_message.Message):
     __slots__ = ("book_ids", "scores")
@@ -25,3 +54,41 @@ class RetrieveResponse(_message.Message):
     book_ids: _containers.RepeatedScalarFieldContainer[str]
     scores: _containers.RepeatedScalarFieldContainer[float]
     def __init__(self, book_ids: _Optional[_Iterable[str]] = ..., scores: _Optional[_Iterable[float]] = ...) -> None: ...
+
+class BatchRetrieveRequest(_message.Message):
+    __slots__ = ("queries", "dense_top_k", "sparse_top_k", "top_k", "top_n", "fusion", "dense_weight")
+    QUERIES_FIELD_NUMBER: _ClassVar[int]
+    DENSE_TOP_K_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_TOP_K_FIELD_NUMBER: _ClassVar[int]
+    TOP_K_FIELD_NUMBER: _ClassVar[int]
+    TOP_N_FIELD_NUMBER: _ClassVar[int]
+    FUSION_FIELD_NUMBER: _ClassVar[int]
+    DENSE_WEIGHT_FIELD_NUMBER: _ClassVar[int]
+    queries: _containers.RepeatedScalarFieldContainer[str]
+    dense_top_k: int
+    sparse_top_k: int
+    top_k: int
+    top_n: int
+    fusion: Fusion
+    dense_weight: float
+    def __init__(self, queries: _Optional[_Iterable[str]] = ..., dense_top_k: _Optional[int] = ..., sparse_top_k: _Optional[int] = ..., top_k: _Optional[int] = ..., top_n: _Optional[int] = ..., fusion: _Optional[_Union[Fusion, str]] = ..., dense_weight: _Optional[float] = ...) -> None: ...
+
+class BatchRetrieveResponse(_message.Message):
+    __slots__ = ("results",)
+    RESULTS_FIELD_NUMBER: _ClassVar[int]
+    results: _containers.RepeatedCompositeFieldContainer[RetrieveResponse]
+    def __init__(self, results: _Optional[_Iterable[_Union[RetrieveResponse, _Mapping]]] = ...) -> None: ...
+
+class RetrieveStreamResponse(_message.Message):
+    __slots__ = ("stage", "book_ids", "scores", "scored", "total")
+    STAGE_FIELD_NUMBER: _ClassVar[int]
+    BOOK_IDS_FIELD_NUMBER: _ClassVar[int]
+    SCORES_FIELD_NUMBER: _ClassVar[int]
+    SCORED_FIELD_NUMBER: _ClassVar[int]
+    TOTAL_FIELD_NUMBER: _ClassVar[int]
+    stage: Stage
+    book_ids: _containers.RepeatedScalarFieldContainer[str]
+    scores: _containers.RepeatedScalarFieldContainer[float]
+    scored: int
+    total: int
+    def __init__(self, stage: _Optional[_Union[Stage, str]] = ..., book_ids: _Optional[_Iterable[str]] = ..., scores: _Optional[_Iterable[float]] = ..., scored: _Optional[int] = ..., total: _Optional[int] = ...) -> None: ...
@@ -39,6 +39,16 @@ class HybridBookRetrieverStub(object):
                 request_serializer=retriever__pb2.RetrieveRequest.SerializeToString,
                 response_deserializer=retriever__pb2.RetrieveResponse.FromString,
                 _registered_method=True)
+        self.BatchRetrieve = channel.unary_unary(
+                '/protos.HybridBookRetriever/BatchRetrieve',
+                request_serializer=retriever__pb2.BatchRetrieveRequest.SerializeToString,
+                response_deserializer=retriever__pb2.BatchRetrieveResponse.FromString,
+                _registered_method=True)
+        self.RetrieveStream = channel.unary_stream(
+                '/protos.HybridBookRetriever/RetrieveStream',
+                request_serializer=retriever__pb2.RetrieveRequest.SerializeToString,
+                response_deserializer=retriever__pb2.RetrieveStreamResponse.FromString,
+                _registered_method=True)
 
 
 class HybridBookRetrieverServicer(object):
@@ -50,6 +60,22 @@ class HybridBookRetrieverServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BatchRetrieve(self, request, context):
+        """Runs many queries with one embedding call, one Qdrant batch query and one
+        reranker pass. Queries are used as is (no LLM filter extraction).
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RetrieveStream(self, request, context):
+        """Same search as Retrieve, streamed: the fused ranking first, then partial
+        rerankings as candidates are scored, then the final reranked results.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_HybridBookRetrieverServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +84,16 @@ def add_HybridBookRetrieverServicer_to_server(servicer, server):
                     request_deserializer=retriever__pb2.RetrieveRequest.FromString,
                     response_serializer=retriever__pb2.RetrieveResponse.SerializeToString,
             ),
+            'BatchRetrieve': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchRetrieve,
+                    request_deserializer=retriever__pb2.BatchRetrieveRequest.FromString,
+                    response_serializer=retriever__pb2.BatchRetrieveResponse.SerializeToString,
+            ),
+            'RetrieveStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.RetrieveStream,
+                    request_deserializer=retriever__pb2.RetrieveRequest.FromString,
+                    response_serializer=retriever__pb2.RetrieveStreamResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'protos.HybridBookRetriever', rpc_method_handlers)
@@ -95,3 +131,57 @@ class HybridBookRetriever(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def BatchRetrieve(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/protos.HybridBookRetriever/BatchRetrieve',
+            retriever__pb2.BatchRetrieveRequest.SerializeToString,
+            retriever__pb2.BatchRetrieveResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RetrieveStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/protos.HybridBookRetriever/RetrieveStream',
+            retriever__pb2.RetrieveRequest.SerializeToString,
+            retriever__pb2.RetrieveStreamResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
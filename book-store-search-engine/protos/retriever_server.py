@@ -1,14 +1,100 @@
 from protos.retriever_pb2_grpc import HybridBookRetrieverServicer as BaseServicer
-from protos.retriever_pb2 import RetrieveRequest, RetrieveResponse
+from protos.retriever_pb2 import (
+    RetrieveRequest,
+    RetrieveResponse,
+    BatchRetrieveRequest,
+    BatchRetrieveResponse,
+    RetrieveStreamResponse,
+    Stage,
+    Fusion,
+)
+import grpc
 import logging
 from qdrant_client import QdrantClient
 import os
 from retriever.hybrid_retriever import HybridRetriever
+from retriever.async_hybrid_retriever import AsyncHybridRetriever
+from retriever.fusion import RRF, DBSF
 from query_processor.book_filter_extractor import BookFilterExtractor
 from redis import Redis
 
 logging.basicConfig(level=logging.INFO)
 
+
+_FUSIONS = {Fusion.RRF: RRF, Fusion.DBSF: DBSF}
+
+
+def _build_kwargs(request: RetrieveRequest | BatchRetrieveRequest) -> dict:
+    """Collect the search parameters that are set (non-zero) on a request.
+
+    Raises:
+        ValueError: If the fusion is unknown or the dense weight is not between 0 and 1.
+    """
+    kwargs = {}
+    if request.dense_top_k != 0:
+        kwargs['dense_top_k'] = request.dense_top_k
+    if request.sparse_top_k != 0:
+        kwargs['sparse_top_k'] = request.sparse_top_k
+    if request.top_k != 0:
+        kwargs['top_k'] = request.top_k
+    if request.top_n != 0:
+        kwargs['top_n'] = request.top_n
+    if request.fusion != Fusion.FUSION_UNSPECIFIED:
+        if request.fusion not in _FUSIONS:
+            raise ValueError(f"Unknown fusion {request.fusion}.")
+        kwargs['fusion'] = _FUSIONS[request.fusion]
+    if request.HasField('dense_weight'):
+        # Also rejects NaN, which would otherwise reach the retriever and the cache key
+        if not 0.0 <= request.dense_weight <= 1.0:
+            raise ValueError(f"dense_weight must be between 0 and 1, got {request.dense_weight}.")
+        # Rounded so float32 noise does not split the search cache
+        kwargs['dense_weight'] = round(request.dense_weight, 4)
+    return kwargs
+
+
+def _request_kwargs(request: RetrieveRequest | BatchRetrieveRequest, context) -> dict:
+    """``_build_kwargs``, failing the call with INVALID_ARGUMENT on bad parameters."""
+    try:
+        return _build_kwargs(request)
+    except ValueError as e:
+        context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+
+async def _arequest_kwargs(request: RetrieveRequest | BatchRetrieveRequest, context) -> dict:
+    try:
+        return _build_kwargs(request)
+    except ValueError as e:
+        await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+
+def _to_response(results: dict) -> RetrieveResponse:
+    book_ids = [str(r['book_id']) for r in results['results']]
+    scores = [r.get('score', 0.0) for r in results['results']]
+    return RetrieveResponse(book_ids=book_ids, scores=scores)
+
+
+def _to_batch_response(queries: list, results: list) -> BatchRetrieveResponse:
+    """Map results of the non-empty queries back to request order."""
+    results = iter(results)
+    return BatchRetrieveResponse(results=[
+        _to_response(next(results)) if query else RetrieveResponse(book_ids=[], scores=[])
+        for query in queries
+    ])
+
+
+_STAGES = {"fused": Stage.FUSED, "reranking": Stage.RERANKING, "reranked": Stage.RERANKED}
+
+
+def _to_stream_response(message: dict) -> RetrieveStreamResponse:
+    return RetrieveStreamResponse(
+        stage=_STAGES[message['stage']],
+        book_ids=[str(r['book_id']) for r in message['results']],
+        scores=[r.get('score', 0.0) for r in message['results']],
+        scored=message.get('scored', 0),
+        total=message.get('total', 0),
+    )
+
+
 class HybridBookRetrieverServicer(BaseServicer):
     def __init__(self, model: HybridRetriever):
         self.model = model
@@ -24,15 +110,9 @@ class HybridBookRetrieverServicer(BaseServicer):
             return RetrieveResponse(book_ids=[], scores=[])
         logging.info('Extract query')
         # Build kwargs dynamically
-        kwargs = {}
-        if request.dense_top_k != 0:
-            kwargs['dense_top_k'] = request.dense_top_k
-        if request.sparse_top_k != 0:
-            kwargs['sparse_top_k'] = request.sparse_top_k
-        if request.top_k != 0:
-            kwargs['top_k'] = request.top_k
-        if request.top_n != 0:
-            kwargs['top_n'] = request.top_n
+        kwargs = _request_kwargs(request, context)
+        if request.skip_rerank:
+            kwargs['rerank'] = False
         logging.info('Start retrieve')
         # Call your hybrid retriever
         results = self.model.search_with_filter(
@@ -40,8 +120,60 @@ class HybridBookRetrieverServicer(BaseServicer):
             **kwargs
         )
 
-        book_ids = [r['book_id'] for r in results['results']]
-        scores = [r.get('score', 0.0) for r in results['results']]
+        logging.info('End retrieve')
+        return _to_response(results)
+
+    def BatchRetrieve(self, request: BatchRetrieveRequest, context):
+        logging.info(f"Batch retrieve of {len(request.queries)} queries")
+        queries = [q for q in request.queries if q]
+        kwargs = _request_kwargs(request, context)
+        results = self.model.search_batch(queries, **kwargs) if queries else []
+        return _to_batch_response(request.queries, results)
+
+    def RetrieveStream(self, request: RetrieveRequest, context):
+        logging.info(request)
+        if not request.query:
+            yield RetrieveStreamResponse(stage=Stage.RERANKED)
+            return
+        kwargs = _request_kwargs(request, context)
+        for message in self.model.search_with_filter_stream(query=request.query, **kwargs):
+            yield _to_stream_response(message)
+        logging.info('End retrieve stream')
+
+
+class AsyncHybridBookRetrieverServicer(BaseServicer):
+    """Servicer for the grpc.aio server; handlers are coroutines."""
+
+    def __init__(self, model: AsyncHybridRetriever):
+        self.model = model
 
+    async def Retrieve(self, request: RetrieveRequest, context):
+        logging.info(request)
+        if not request.query:
+            return RetrieveResponse(book_ids=[], scores=[])
+        kwargs = await _arequest_kwargs(request, context)
+        if request.skip_rerank:
+            kwargs['rerank'] = False
+        results = await self.model.search_with_filter(
+            query=request.query,
+            **kwargs
+        )
         logging.info('End retrieve')
-        return RetrieveResponse(book_ids=book_ids, scores=scores)
+        return _to_response(results)
+
+    async def BatchRetrieve(self, request: BatchRetrieveRequest, context):
+        logging.info(f"Batch retrieve of {len(request.queries)} queries")
+        queries = [q for q in request.queries if q]
+        kwargs = await _arequest_kwargs(request, context)
+        results = await self.model.search_batch(queries, **kwargs) if queries else []
+        return _to_batch_response(request.queries, results)
+
+    async def RetrieveStream(self, request: RetrieveRequest, context):
+        logging.info(request)
+        if not request.query:
+            yield RetrieveStreamResponse(stage=Stage.RERANKED)
+            return
+        kwargs = await _arequest_kwargs(request, context)
+        async for message in self.model.search_with_filter_stream(query=request.query, **kwargs):
+            yield _to_stream_response(message)
+        logging.info('End retrieve stream')
@@ -1,8 +1,9 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from langsmith import traceable
 from pydantic import BaseModel, Field
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_openai import ChatOpenAI
+from query_processor.numeric_filter_parser import parse_numeric_filters, is_resolved
 import os
 import getpass
 import dotenv
@@ -64,12 +65,13 @@ class BookFilterExtractor:
   Now, given a new user query, return your output as a valid JSON object following the BookFilter schema.
     """
 
-    def __init__(self, model_name: str = "qwen-3-235b-a22b-instruct-2507", temperature: float = 0):
+    def __init__(self, model_name: str = "qwen-3-235b-a22b-instruct-2507", temperature: float = 0, local_numeric_parsing: bool = True):
         """Initialize the extractor with a specific LLM.
         
         Args:
             model_name (str, optional): The name of the LLM model to use. Cerebras supported models only. Defaults to "gpt-oss-120b".
             temperature (float, optional): The temperature to use for the LLM. Defaults to 0.
+            local_numeric_parsing (bool, optional): Fill price, rating and rating count bounds with rules, and skip the LLM when nothing else in the query needs it. Defaults to True.
         
         Note: CEREBRAS_API_KEY is required to use the Cerebras API.
         """
@@ -79,6 +81,8 @@ class BookFilterExtractor:
         if not os.environ.get("CEREBRAS_API_KEY"):
             os.environ["CEREBRAS_API_KEY"] = getpass.getpass("Enter your Cerebras API key: ")
 
+        self.model_name = model_name
+        self.local_numeric_parsing = local_numeric_parsing
         self.llm = ChatOpenAI(
             model=model_name,
             api_key=os.environ["CEREBRAS_API_KEY"],
@@ -86,17 +90,52 @@ class BookFilterExtractor:
             temperature=temperature,
         )
 
-    @traceable(run_type='parser', metadata={"model": "qwen-3-235b-a22b-instruct-2507"})
-    def extract(self, query: str) -> Dict[str, Any]:
-        """Convert a natural query into a structured BookFilter dictionary."""
-        logging.info(f"Start extract query: {query}")
-        messages = [
+    def _build_messages(self, query: str):
+        return [
             SystemMessage(content=self.BASE_PROMPT),
             HumanMessage(content=f"Query: {query}")
         ]
 
+    @staticmethod
+    def _to_filter_dict(result: BookFilter) -> Dict[str, Any]:
+        # Return only non-null fields
+        return {k: v for k, v in result.model_dump().items() if v is not None}
+
+    def _parse_locally(self, query: str) -> Tuple[Dict[str, Any], Dict[str, Any] | None]:
+        """Run the rule-based numeric parser.
+
+        Returns the numeric filters found and, when the rest of the query holds
+        nothing the LLM is needed for, the complete filter dictionary.
+        """
+        if not self.local_numeric_parsing:
+            return {}, None
+        numeric_filters, remainder = parse_numeric_filters(query)
+        if numeric_filters and is_resolved(remainder):
+            logging.info(f"Query resolved locally: {numeric_filters}")
+            # No rewrite: the remainder is a fragment ("dystopian fiction with a"),
+            # so search falls back to the raw query
+            return numeric_filters, dict(numeric_filters)
+        return numeric_filters, None
+
+    @traceable(run_type='parser', metadata={"model": "qwen-3-235b-a22b-instruct-2507"})
+    def extract(self, query: str) -> Dict[str, Any]:
+        """Convert a natural query into a structured BookFilter dictionary."""
+        logging.info(f"Start extract query: {query}")
+        numeric_filters, resolved = self._parse_locally(query)
+        if resolved is not None:
+            return resolved
         structured_llm = self.llm.with_structured_output(BookFilter)
-        result = structured_llm.invoke(messages)
+        result = structured_llm.invoke(self._build_messages(query))
+        # Numeric bounds matched by the rules take precedence over the LLM's reading
+        return {**self._to_filter_dict(result), **numeric_filters}
 
-        # Return only non-null fields
-        return {k: v for k, v in result.model_dump().items() if v is not None}
\ No newline at end of file
+    @traceable(run_type='parser', metadata={"model": "qwen-3-235b-a22b-instruct-2507"})
+    async def aextract(self, query: str) -> Dict[str, Any]:
+        """Async variant of ``extract`` for the asyncio server."""
+        logging.info(f"Start extract query: {query}")
+        numeric_filters, resolved = self._parse_locally(query)
+        if resolved is not None:
+            return resolved
+        structured_llm = self.llm.with_structured_output(BookFilter)
+        result = await structured_llm.ainvoke(self._build_messages(query))
+        return {**self._to_filter_dict(result), **numeric_filters}
\ No newline at end of file
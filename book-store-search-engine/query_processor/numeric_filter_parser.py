@@ -0,0 +1,108 @@
+import re
+from typing import Any, Dict, List, Tuple
+from query_processor.query_classifier import CONSTRAINT_PATTERNS, name_like_tokens
+
+# Building blocks
+N = r"(?<![\d.])\d[\d,]*(?:\.\d+)?"
+MONEY = rf"(?:\$\s*{N}(?:\s*(?:dollars?|usd|bucks)\b)?|{N}\s*(?:\$|dollars?\b|usd\b|bucks\b))"
+PRICE_CTX = r"\b(?:price[ds]?|priced|cost(?:s|ing)?|budget)(?:\s+(?:is|of))?"
+COUNT = rf"{N}\s*[km]?\b"
+COUNT_WORD = r"(?:reviews?|ratings|votes|reviewers|readers)\b"
+RATING = r"(?<![\d.])[0-5](?:\.\d+)?(?![\d.,])"
+STARS = r"(?:stars?|star rating)\b"
+RATED = r"\brat(?:ed|ing)(?:\s+(?:is|of))?"
+LESS = r"(?:\bunder|\bbelow|\bless than|\bfewer than|\bcheaper than|\blower than|\bat most|\bno more than|\bup to|\bmax(?:imum)?|\bwithin|<=?)"
+MORE = r"(?:\bover|\babove|\bmore than|\bgreater than|\bhigher than|\bat least|\bmin(?:imum)?|\bfrom|>=?)"
+TO = r"\s*(?:and|to|-)\s*"
+OR_LESS = r"\s*(?:or\s+(?:less|under|below|lower|cheaper)|and\s+under|max)\b"
+OR_MORE = r"(?:\s*(?:or\s+(?:more|above|higher|better|over)|and\s+(?:up|above|over)|minimum)\b|\s*\+)"
+
+# (pattern, field, direction), tried in order; each match is removed from the
+# query before the next pattern runs, so a phrase is only used once
+RULES: List[Tuple[str, str, str]] = [
+    # Prices: need a currency sign or word, or a price word before the amount
+    (rf"(?:\bbetween\s+|\bfrom\s+)?\$?\s*{N}{TO}{MONEY}", "price", "range"),
+    (rf"{PRICE_CTX}\s+(?:between|from)\s+\$?\s*{N}{TO}\$?\s*{N}", "price", "range"),
+    (rf"{LESS}\s*{MONEY}", "price", "max"),
+    (rf"{MONEY}{OR_LESS}", "price", "max"),
+    (rf"{PRICE_CTX}\s+{LESS}\s*\$?\s*{N}", "price", "max"),
+    (rf"{MORE}\s*{MONEY}", "price", "min"),
+    (rf"{MONEY}{OR_MORE}", "price", "min"),
+    (rf"{PRICE_CTX}\s+{MORE}\s*\$?\s*{N}", "price", "min"),
+    # Rating counts: need a count word after the number
+    (rf"(?:\bbetween\s+)?{COUNT}{TO}{COUNT}\s*{COUNT_WORD}", "rating_count", "range"),
+    (rf"{LESS}\s*{COUNT}\s*{COUNT_WORD}", "rating_count", "max"),
+    (rf"{COUNT}\s*{COUNT_WORD}{OR_LESS}", "rating_count", "max"),
+    (rf"{MORE}\s*{COUNT}\s*\+?\s*{COUNT_WORD}", "rating_count", "min"),
+    (rf"{COUNT}\s*\+?\s*{COUNT_WORD}", "rating_count", "min"),
+    # Ratings: need stars or a rating word, and a value between 0 and 5
+    (rf"(?:\bbetween\s+)?{RATING}{TO}{RATING}\s*{STARS}", "rating", "range"),
+    (rf"{RATED}\s+(?:between\s+)?{RATING}{TO}{RATING}", "rating", "range"),
+    (rf"{LESS}\s*{RATING}\s*{STARS}", "rating", "max"),
+    (rf"{RATING}\s*{STARS}{OR_LESS}", "rating", "max"),
+    (rf"{RATED}\s+{LESS}\s*{RATING}(?:\s*/\s*5)?", "rating", "max"),
+    (rf"{MORE}\s*{RATING}\s*\+?\s*{STARS}", "rating", "min"),
+    (rf"{RATING}\s*\+?\s*{STARS}(?:{OR_MORE})?", "rating", "min"),
+    (rf"{RATED}\s+(?:{MORE}\s*)?{RATING}(?:\s*/\s*5)?(?:{OR_MORE})?", "rating", "min"),
+    (rf"{RATING}\s*\+?\s*(?:rated|rating)\b", "rating", "min"),
+]
+COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), field, direction) for pattern, field, direction in RULES]
+NUMBER = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*([km])?\b", re.IGNORECASE)
+CONSTRAINT_CUES = [re.compile(p, re.IGNORECASE) for p in CONSTRAINT_PATTERNS]
+# Connectors left dangling at the ends of a query once a constraint is removed
+EDGE_WORDS = {"with", "and", "or", "for", "which", "that", "is", "are", "of", "at", "price", "priced", "costing", "rated", "having", "has"}
+
+
+def _numbers(text: str) -> List[float]:
+    values = []
+    for digits, suffix in NUMBER.findall(text):
+        value = float(digits.replace(",", ""))
+        if suffix:
+            value *= 1000 if suffix.lower() == "k" else 1000000
+        values.append(value)
+    return values
+
+
+def parse_numeric_filters(query: str) -> Tuple[Dict[str, Any], str]:
+    """Extract price, rating and rating count bounds from a query with rules.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        tuple: BookFilter fields that were found (``price_min``, ``price_max``,
+        ``rating_min``, ``rating_max``, ``rating_count_min``, ``rating_count_max``)
+        and the query with the matched phrases removed.
+    """
+    filters: Dict[str, Any] = {}
+    remainder = query
+    for pattern, field, direction in COMPILED_RULES:
+        while True:
+            match = pattern.search(remainder)
+            if match is None:
+                break
+            values = _numbers(match.group(0))
+            if direction == "range" and len(values) >= 2:
+                filters[f"{field}_min"], filters[f"{field}_max"] = sorted(values[:2])
+            elif values:
+                filters[f"{field}_{direction}"] = values[0]
+            remainder = remainder[:match.start()] + " " + remainder[match.end():]
+    for key in ("rating_count_min", "rating_count_max"):
+        if key in filters:
+            filters[key] = int(filters[key])
+    words = re.sub(r"\s+([,.!?])", r"\1", " ".join(remainder.split())).strip(" ,.").split()
+    while words and words[-1].lower() in EDGE_WORDS:
+        words.pop()
+    while words and words[0].lower() in EDGE_WORDS:
+        words.pop(0)
+    return filters, " ".join(words)
+
+
+def is_resolved(remainder: str) -> bool:
+    """Whether a query stripped by ``parse_numeric_filters`` has no constraint left for the LLM.
+
+    Only remainders made of generic words (function words, book words and
+    genres) qualify: any other word may be an author name, lowercase or not
+    ("stephen king"), which only the LLM extracts.
+    """
+    return not name_like_tokens(remainder) and not any(cue.search(remainder) for cue in CONSTRAINT_CUES)
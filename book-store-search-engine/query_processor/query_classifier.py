@@ -0,0 +1,128 @@
+import logging
+import re
+from typing import List
+import numpy as np
+
+# Routes returned by QueryClassifier.classify
+SKIP = "skip"            # plain lookup, search the raw query without the LLM
+SPECULATE = "speculate"  # search the raw query while the LLM extracts, keep it if no filters come back
+EXTRACT = "extract"      # constraints are likely, extract before searching
+
+# Phrases that point at a BookFilter field (price, rating, popularity or author)
+CONSTRAINT_PATTERNS = [
+    r"\$\s*\d",
+    r"\d+(\.\d+)?\s*(\$|dollars?|usd|bucks)\b",
+    r"\b(price[ds]?|pricing|cost(s|ing)?|cheap(er|est)?|expensive|afford\w*|budget|free)\b",
+    r"\b(under|below|less than|more than|over|above|at least|at most|between|no more than)\s*\$?\d",
+    r"\b(rat(ed|ing|ings)|stars?|reviews?|reviewed|best[- ]?sell(ers?|ing)|popular|top[- ]rated|highly|acclaimed)\b",
+    r"\b(by|written by|authors?|authored|writer)\b",
+]
+
+# Words that cannot be part of an author name: function words, book words and
+# genres. Any other word may be a name ("stephen king", "tolkien books"), and
+# only the LLM extracts authors, so such queries are never answered without it.
+GENERIC_WORDS = frozenset("""
+    a about after against all also an and any as at be before best book books but by can collection
+    collections do every for from good great guide guides has have how i in into is it its like
+    me my new no not novel novels of on or other read reads reading series set some something
+    story stories that the their them these this those to top up want what where which who with
+    without world year years you your
+    adventure adventures art biography biographies business children childrens classic classics
+    comedy comic comics contemporary cookbook cookbooks cooking cozy crime drama dystopian economics
+    epic erotica essays fairy fantasy fiction finance graphic health historical history horror
+    humor kids literary literature love magic memoir memoirs mystery mysteries mythology nonfiction
+    paranormal philosophy poetry politics psychology religion romance romantic science sci-fi scifi
+    self-help self help short spiritual sports suspense technology teen thriller thrillers travel
+    true war western young adult ya
+    above at least below between cheap cheaper cost costs dollar dollars bucks expensive highly less
+    max min more most over popular price priced pricey rated rating ratings review reviews star stars
+    than under usd author authors writer written wrote
+""".split())
+NAME_TOKEN = re.compile(r"[^\W\d_][\w.'-]*")
+
+
+def name_like_tokens(text: str) -> List[str]:
+    """Lowercased words of ``text`` that may belong to an author name, i.e. are not generic words."""
+    tokens = []
+    for token in NAME_TOKEN.findall(text.lower()):
+        token = token.strip(".'-")
+        if token.endswith("'s"):
+            token = token[:-2]
+        if token and token not in GENERIC_WORDS and token.rstrip("s") not in GENERIC_WORDS:
+            tokens.append(token)
+    return tokens
+
+
+class QueryClassifier:
+    """Cheap local decision of whether a query needs LLM filter extraction.
+
+    Rules catch explicit constraints (prices, ratings, popularity, authors).
+    Queries without a constraint cue are searched speculatively or, when a
+    small embedding model is configured, matched against example queries of
+    both kinds. A query is only skipped when every word is generic: any other
+    word may be an author name ("stephen king"), and skipping would lose the
+    author filter, so such queries are at most speculated.
+    """
+
+    CONSTRAINT_EXAMPLES = [
+        "a cheap novel I can afford",
+        "something everyone loves with great reviews",
+        "a famous classic that lots of readers liked",
+        "books from my favourite writer",
+        "a well regarded mystery that is not too pricey",
+    ]
+    PLAIN_EXAMPLES = [
+        "a story about a boy who goes to a school of magic",
+        "novels set in ancient rome",
+        "science fiction with space travel and aliens",
+        "learning to cook italian food",
+        "history of the second world war",
+    ]
+
+    def __init__(self, model_name: str | None = None, max_plain_tokens: int = 4, margin: float = 0.05):
+        """Initialize the classifier.
+
+        Args:
+            model_name (str, optional): FastEmbed text model used for queries the rules cannot settle, e.g. "BAAI/bge-small-en-v1.5". Defaults to None (rules only).
+            max_plain_tokens (int, optional): Queries up to this many words, all generic and without a constraint cue, are plain lookups. Defaults to 4.
+            margin (float, optional): Cosine similarity lead needed for the model to route a query. Defaults to 0.05.
+        """
+        self.max_plain_tokens = max_plain_tokens
+        self.margin = margin
+        self._patterns = [re.compile(p, re.IGNORECASE) for p in CONSTRAINT_PATTERNS]
+        self.model = None
+        if model_name:
+            from fastembed import TextEmbedding
+
+            self.model = TextEmbedding(model_name=model_name)
+            self._constraint_examples = self._embed(self.CONSTRAINT_EXAMPLES)
+            self._plain_examples = self._embed(self.PLAIN_EXAMPLES)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.array(list(self.model.embed(texts)), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def has_constraint_cue(self, query: str) -> bool:
+        return any(p.search(query) for p in self._patterns)
+
+    def classify(self, query: str) -> str:
+        """Return SKIP, SPECULATE or EXTRACT for a query."""
+        if self.has_constraint_cue(query):
+            route = EXTRACT
+        elif len(query.split()) <= self.max_plain_tokens:
+            route = SKIP
+        elif self.model is None:
+            route = SPECULATE
+        else:
+            vector = self._embed([query])[0]
+            lead = float(np.max(self._constraint_examples @ vector) - np.max(self._plain_examples @ vector))
+            if lead > self.margin:
+                route = EXTRACT
+            elif lead < -self.margin:
+                route = SKIP
+            else:
+                route = SPECULATE
+        if route == SKIP and name_like_tokens(query):
+            route = SPECULATE
+        logging.info(f"Query route: {route}")
+        return route
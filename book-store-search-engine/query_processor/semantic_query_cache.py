@@ -0,0 +1,124 @@
+import random
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from query_processor.query_classifier import name_like_tokens
+
+# Words that set the direction of a numeric constraint, so "under $10" and
+# "over $10" never share a cache entry
+DIRECTION_WORDS = {
+    "under": "<", "below": "<", "less": "<", "cheaper": "<", "max": "<", "most": "<", "within": "<",
+    "over": ">", "above": ">", "more": ">", "least": ">", "min": ">", "plus": ">", "+": ">",
+    "between": "<>",
+}
+GUARD_TOKEN = re.compile(r"\d+(?:\.\d+)?|\+|[a-z]+")
+
+
+def constraint_signature(query: str) -> Tuple[str, ...]:
+    """Numbers, comparison directions and possible name words of a query, which must match for a cache hit.
+
+    Embeddings of "books by stephen king" and "books by stephen fry" are close
+    enough to pass the similarity threshold, so every word that may be part of
+    an author name (``name_like_tokens``) is part of the signature too.
+    """
+    signature = []
+    for token in GUARD_TOKEN.findall(query.lower()):
+        if token[0].isdigit():
+            signature.append(str(float(token)))
+        elif token in DIRECTION_WORDS:
+            signature.append(DIRECTION_WORDS[token])
+    signature.extend(f"name:{token}" for token in set(name_like_tokens(query)))
+    return tuple(sorted(signature))
+
+
+class SemanticQueryCache:
+    """In-process nearest-neighbour cache of structured query extractions.
+
+    Stores (query embedding, BookFilter dict) pairs and answers a new query with
+    the extraction of the most similar of its ``candidates`` nearest past queries
+    whose cosine similarity is above ``threshold`` and that carry the same
+    numbers, comparison directions and possible name words. The index is a fixed-size normalized matrix searched with one
+    matrix-vector product; when full, the oldest entries are overwritten.
+
+    A ``verify_rate`` fraction of hits is flagged for verification against the
+    LLM; callers report the outcome through ``record_verification`` so the
+    false-hit rate can be monitored.
+    """
+
+    def __init__(self, max_entries: int = 5000, threshold: float = 0.95, verify_rate: float = 0.05, candidates: int = 5):
+        """Initialize the cache.
+
+        Args:
+            max_entries (int, optional): Maximum number of stored extractions. Defaults to 5000.
+            threshold (float, optional): Minimum cosine similarity for a hit. Defaults to 0.95.
+            verify_rate (float, optional): Fraction of hits to verify against the LLM. Defaults to 0.05.
+            candidates (int, optional): Nearest past queries checked against the guard signature. Defaults to 5.
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.verify_rate = verify_rate
+        self.candidates = candidates
+        self._vectors: np.ndarray | None = None
+        self._entries: List[Tuple[str, Tuple[str, ...], Dict[str, Any]] | None] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "guard_rejections": 0, "verified": 0, "false_hits": 0}
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, query: str, vector: List[float]) -> Tuple[Dict[str, Any], bool] | None:
+        """Look up the extraction of the nearest past query.
+
+        Returns:
+            tuple | None: ``(structured_query, verify)`` on a hit, where ``verify``
+            asks the caller to check this hit against the LLM; None on a miss.
+        """
+        vector = self._normalize(vector)
+        with self._lock:
+            self._counters["lookups"] += 1
+            if not self._size:
+                return None
+            similarities = self._vectors[:self._size] @ vector
+            k = min(self.candidates, self._size)
+            nearest = np.argpartition(-similarities, k - 1)[:k]
+            nearest = [int(i) for i in nearest[np.argsort(-similarities[nearest])] if similarities[i] >= self.threshold]
+            if not nearest:
+                return None
+            query_signature = constraint_signature(query)
+            match = next((i for i in nearest if self._entries[i][1] == query_signature), None)
+            if match is None:
+                self._counters["guard_rejections"] += 1
+                return None
+            structured_query = self._entries[match][2]
+            self._counters["hits"] += 1
+        return dict(structured_query), random.random() < self.verify_rate
+
+    def put(self, query: str, vector: List[float], structured_query: Dict[str, Any]):
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._vectors[self._next] = vector
+            self._entries[self._next] = (query, constraint_signature(query), dict(structured_query))
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def record_verification(self, correct: bool):
+        with self._lock:
+            self._counters["verified"] += 1
+            if not correct:
+                self._counters["false_hits"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return counters plus hit rate and the false-hit rate among verified hits."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats["entries"] = self._size
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["false_hit_rate"] = stats["false_hits"] / stats["verified"] if stats["verified"] else 0.0
+        return stats
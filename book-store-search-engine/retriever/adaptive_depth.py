@@ -0,0 +1,103 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+DEPTH_KEYS = ("dense_top_k", "sparse_top_k", "top_k")
+
+
+class AdaptiveDepth:
+    """Per-request candidate depth for hybrid retrieval and reranking.
+
+    Retrieval starts with shallow dense and sparse prefetches and a short fused
+    list, and widens all three by ``growth`` (up to the depths the request
+    asked for) only when:
+
+    - dense and sparse disagree: the overlap of their top ids is below
+      ``min_overlap``, so fusion is not confident and a deeper pool is needed;
+    - filters pruned the candidates: fusion returned fewer points than asked
+      for, and the previous round returned fewer still.
+
+    Reranking is cascaded: candidates are scored in fused order, one chunk at a
+    time, and scoring stops once the top-N has not changed for ``patience``
+    chunks in a row.
+    """
+
+    def __init__(
+        self,
+        initial_prefetch: int = 25,
+        initial_top_k: int = 20,
+        growth: float = 2.0,
+        min_overlap: float = 0.3,
+        rerank_chunk_size: int = 10,
+        patience: int = 1,
+    ):
+        """Initialize the policy.
+
+        Args:
+            initial_prefetch (int, optional): Dense and sparse prefetch depth of the first round. Defaults to 25.
+            initial_top_k (int, optional): Fused candidates of the first round. Defaults to 20.
+            growth (float, optional): Factor applied to all depths when widening. Defaults to 2.0.
+            min_overlap (float, optional): Dense/sparse overlap below which the depth is widened. Defaults to 0.3.
+            rerank_chunk_size (int, optional): Candidates scored per cascade step after the first top-N. Defaults to 10.
+            patience (int, optional): Chunks without a top-N change after which reranking stops. Defaults to 1.
+        """
+        self.initial_prefetch = initial_prefetch
+        self.initial_top_k = initial_top_k
+        self.growth = growth
+        self.min_overlap = min_overlap
+        self.rerank_chunk_size = rerank_chunk_size
+        self.patience = patience
+
+    def settings(self) -> Dict[str, float]:
+        return dict(vars(self))
+
+    def initial(self, limits: Dict[str, int]) -> Dict[str, int]:
+        """First-round depths, never deeper than the request's ``limits``."""
+        return {
+            "dense_top_k": min(limits["dense_top_k"], self.initial_prefetch),
+            "sparse_top_k": min(limits["sparse_top_k"], self.initial_prefetch),
+            "top_k": min(limits["top_k"], self.initial_top_k),
+        }
+
+    @staticmethod
+    def overlap(dense_ids: List[Any], sparse_ids: List[Any]) -> float:
+        """Share of the shorter list that also appears in the other one."""
+        if not dense_ids or not sparse_ids:
+            return 1.0
+        return len(set(dense_ids) & set(sparse_ids)) / min(len(dense_ids), len(sparse_ids))
+
+    def widen(
+        self,
+        depth: Dict[str, int],
+        limits: Dict[str, int],
+        overlap: float | None,
+        fused: int,
+        previous_fused: int | None,
+    ) -> Tuple[Dict[str, int] | None, str]:
+        """Decide whether to run another, deeper round.
+
+        Args:
+            depth (dict): Depths of the round that just ran.
+            limits (dict): Deepest depths the request allows.
+            overlap (float | None): Dense/sparse overlap of that round, None without dense results.
+            fused (int): Points fusion returned in that round.
+            previous_fused (int | None): Points fusion returned in the round before, None after the first.
+
+        Returns:
+            tuple: The next depths, or None to stop, and the reason.
+        """
+        if overlap is not None and overlap < self.min_overlap:
+            reason = "disagreement"
+        elif fused < depth["top_k"] and (previous_fused is None or fused > previous_fused):
+            reason = "filtered"
+        else:
+            return None, "confident"
+        wider = {key: min(limits[key], math.ceil(depth[key] * self.growth)) for key in DEPTH_KEYS}
+        if wider == depth:
+            return None, f"{reason}, at limit"
+        return wider, reason
+
+    def first_chunk(self, top_n: int) -> int:
+        return max(top_n, self.rerank_chunk_size)
+
+    def settled(self, unchanged_chunks: int) -> bool:
+        return unchanged_chunks >= self.patience
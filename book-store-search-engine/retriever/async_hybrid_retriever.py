@@ -0,0 +1,499 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+from langsmith import traceable
+from qdrant_client import AsyncQdrantClient, models
+from redis.asyncio import Redis as AsyncRedis
+from constants.constants import DENSE_FIELD, SPARSE_FIELD
+from query_processor.query_classifier import SKIP, SPECULATE, EXTRACT
+from retriever.embedding_client import CircuitOpenError, EmbeddingError
+from retriever.fusion import RRF
+from retriever.hybrid_retriever import (
+    HybridRetriever,
+    RERANK_STAGE_PAYLOAD,
+    RERANK_TEXT_PAYLOAD,
+    LEGACY_RERANK_TEXT_PAYLOAD,
+    _payload_bytes,
+)
+from retriever.search_cache import binary_client
+
+
+class AsyncHybridRetriever:
+    """Asyncio pipeline for the grpc.aio server.
+
+    Redis, the LLM, the dense embedding API and Qdrant are awaited on async
+    clients, so one event loop can keep many searches in flight while they wait
+    on I/O. SPLADE inference and reranking are CPU bound and run on a bounded
+    executor. Models, caches and query building are shared with the wrapped
+    ``HybridRetriever``.
+    """
+
+    def __init__(
+        self,
+        retriever: HybridRetriever,
+        qdrant_client: AsyncQdrantClient,
+        redis_client: AsyncRedis,
+        cpu_workers: int = 4,
+    ):
+        """Initialize the async pipeline.
+
+        Args:
+            retriever (HybridRetriever): Retriever owning the models and caches.
+            qdrant_client (AsyncQdrantClient): Async Qdrant client.
+            redis_client (AsyncRedis): Async Redis client of the search cache and of cross-replica single-flight locks; if it decodes responses, the search cache uses a binary client with the same connection settings.
+            cpu_workers (int, optional): Threads for SPLADE and reranking. Defaults to 4.
+        """
+        self.retriever = retriever
+        self.client = qdrant_client
+        self.search_cache = retriever.search_cache
+        self.search_cache.async_redis_client = binary_client(redis_client)
+        self.single_flight = retriever.single_flight
+        if self.single_flight.redis_client is not None:
+            # Cross-replica locking was enabled for the sync client; use the async one here
+            self.single_flight.async_redis_client = redis_client
+        self.collection_name = retriever.collection_name
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="cpu-bound")
+        self._refresh_tasks = set()
+
+    async def _run_cpu(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.cpu_executor, fn, *args)
+
+    async def _timed(self, coro):
+        start = time.perf_counter()
+        result = await coro
+        return result, time.perf_counter() - start
+
+    async def _embed_dense_or_none(self, text: str) -> List[float] | None:
+        r = self.retriever
+        cache = r.embedding_cache
+        dense = await cache.aget_dense(r.dense_embedder.name, r.task, text)
+        if dense is not None:
+            return dense
+        try:
+            dense = (await r.dense_embedder.aembed([text]))[0]
+        except CircuitOpenError:
+            logging.warning("Dense embedding circuit open, using sparse-only retrieval.")
+            return None
+        except EmbeddingError as e:
+            logging.warning(f"Dense embedding failed ({e}), using sparse-only retrieval.")
+            return None
+        await cache.aset_dense(r.dense_embedder.name, r.task, text, dense)
+        return dense
+
+    async def _embed_sparse_cached(self, text: str) -> Dict[str, List[float]]:
+        r = self.retriever
+        sparse = await r.embedding_cache.aget_sparse(r.sparse_model_name, text)
+        if sparse is None:
+            sparse = await self._run_cpu(r.embed_sparse, text)
+            await r.embedding_cache.aset_sparse(r.sparse_model_name, text, sparse)
+        return sparse
+
+    async def embed_hybrid(self, text: str) -> Dict[str, Any]:
+        """Embed a text with both models concurrently. See ``HybridRetriever.embed_hybrid``."""
+        start = time.perf_counter()
+        (dense, dense_time), (sparse, sparse_time) = await asyncio.gather(
+            self._timed(self._embed_dense_or_none(text)),
+            self._timed(self._embed_sparse_cached(text)),
+        )
+        timings = {"dense": dense_time, "sparse": sparse_time, "total": time.perf_counter() - start}
+        logging.info(f"Embedding took {timings['total']:.3f}s (dense {dense_time:.3f}s, sparse {sparse_time:.3f}s, async).")
+        return {"dense": dense, "sparse": sparse, "timings": timings}
+
+    async def _embed_dense_batch_or_none(self, texts: List[str]) -> List[List[float] | None]:
+        r = self.retriever
+        cache = r.embedding_cache
+        vectors = [await cache.aget_dense(r.dense_embedder.name, r.task, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if not missing:
+            return vectors
+        try:
+            embedded = await r.dense_embedder.aembed([texts[i] for i in missing])
+        except CircuitOpenError:
+            logging.warning("Dense embedding circuit open, using sparse-only retrieval.")
+            return vectors
+        except EmbeddingError as e:
+            logging.warning(f"Dense embedding failed ({e}), using sparse-only retrieval.")
+            return vectors
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+            await cache.aset_dense(r.dense_embedder.name, r.task, texts[i], vector)
+        return vectors
+
+    async def _embed_sparse_batch_cached(self, texts: List[str]) -> List[Dict[str, List[float]]]:
+        r = self.retriever
+        vectors = [await r.embedding_cache.aget_sparse(r.sparse_model_name, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            embedded = await self._run_cpu(r.embed_sparse_batch, [texts[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                await r.embedding_cache.aset_sparse(r.sparse_model_name, texts[i], vector)
+        return vectors
+
+    @traceable(run_type="retriever")
+    async def retrieve(
+        self,
+        query: str,
+        dense_field: str = DENSE_FIELD,
+        sparse_field: str = SPARSE_FIELD,
+        dense_top_k: int = 100,
+        sparse_top_k: int = 100,
+        top_k: int = 50,
+        with_payload: bool | List[str] = RERANK_STAGE_PAYLOAD,
+        fusion: str = RRF,
+        dense_weight: float = 0.5,
+        **filters
+    ):
+        """Async variant of ``HybridRetriever.retrieve``."""
+        r = self.retriever
+        query_emb = await self.embed_hybrid(query)
+        query_filter = r._build_filter(**filters)
+        limits = {"dense_top_k": dense_top_k, "sparse_top_k": sparse_top_k, "top_k": top_k}
+
+        if r.adaptive_depth is not None and with_payload is not False:
+            retrieved_points = await self._retrieve_adaptive(
+                query, query_emb, dense_field, sparse_field, limits, query_filter, with_payload, fusion, dense_weight
+            )
+        else:
+            responses = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=r._round_requests(
+                    query_emb, dense_field, sparse_field, limits, query_filter, with_payload, fusion, dense_weight
+                ),
+            )
+            retrieved_points, _ = r._round_points(responses, top_k, fusion, dense_weight)
+
+        return {
+            "retrieved_points": retrieved_points,
+            "used_filter": filters,
+            "timings": query_emb["timings"],
+            "degraded": query_emb["dense"] is None,
+            "payload_bytes": {"retrieve": _payload_bytes(retrieved_points)},
+        }
+
+    async def _retrieve_adaptive(
+        self,
+        query: str,
+        query_emb: Dict[str, Any],
+        dense_field: str,
+        sparse_field: str,
+        limits: Dict[str, int],
+        query_filter: models.Filter | None,
+        with_payload: bool | List[str],
+        fusion: str,
+        dense_weight: float,
+    ) -> List[Any]:
+        r = self.retriever
+        depth = r.adaptive_depth.initial(limits)
+        rounds: List[Dict[str, Any]] = []
+        while depth is not None:
+            responses = await self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=r._round_requests(
+                    query_emb, dense_field, sparse_field, depth, query_filter, with_payload, fusion, dense_weight, with_rankings=True
+                ),
+            )
+            points, rankings = r._round_points(responses, depth["top_k"], fusion, dense_weight)
+            depth = r._next_depth(rounds, depth, limits, len(points), rankings)
+        logging.info(f"Adaptive depth for '{query}' (limits {limits}): {rounds}")
+        return points
+
+    async def _rerank_texts(self, retrieved_points, payload_bytes: Dict[str, int]) -> List[str]:
+        r = self.retriever
+        texts, missing = r._cached_rerank_texts(retrieved_points)
+        if missing:
+            records = await self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=missing,
+                with_payload=RERANK_TEXT_PAYLOAD,
+            )
+            payload_bytes["rerank_text"] = _payload_bytes(records)
+            legacy = r._absorb_rerank_text_records(records, texts)
+            if legacy:
+                records = await self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=legacy,
+                    with_payload=LEGACY_RERANK_TEXT_PAYLOAD,
+                )
+                payload_bytes["rerank_text_legacy"] = _payload_bytes(records)
+                for record in records:
+                    texts[record.id] = r._format_book(record.payload)
+        return [texts.get(p.id, "") for p in retrieved_points]
+
+    @traceable(run_type="chain", metadata={"reranker": "jinai-reranker-v2-base-multilingual"})
+    async def rerank(self, query: str, retrieved_points, top_k: int = 10, payload_bytes: Dict[str, int] | None = None) -> List[Dict[str, Any]]:
+        """Async variant of ``HybridRetriever.rerank``."""
+        r = self.retriever
+        docs = await self._rerank_texts(retrieved_points, payload_bytes if payload_bytes is not None else {})
+        if r.adaptive_depth is not None:
+            return await self._cascaded_rerank(query, retrieved_points, docs, top_k)
+        if r.rerank_scheduler is not None:
+            # The scheduler already batches on its own thread; just await its future
+            scores = await asyncio.wrap_future(r.rerank_scheduler.submit(query, docs))
+        else:
+            scores = await self._run_cpu(lambda: r.reranker.predict([(query, doc) for doc in docs], show_progress_bar=False))
+        return r._rank_by_scores(retrieved_points, docs, scores, top_k)
+
+    async def _cascaded_rerank(self, query: str, retrieved_points, docs: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """Async variant of ``HybridRetriever._cascaded_rerank``."""
+        r = self.retriever
+        scores: List[float] = []
+        ranked: List[Dict[str, Any]] = []
+        unchanged = 0
+        chunk_size = r.adaptive_depth.first_chunk(top_k)
+        while len(scores) < len(docs):
+            scores.extend(await self._score(query, docs[len(scores):len(scores) + chunk_size]))
+            chunk_size = r.adaptive_depth.rerank_chunk_size
+            previous, ranked = ranked, r._rank_by_scores(retrieved_points, docs, scores, top_k)
+            unchanged = unchanged + 1 if [x["book_id"] for x in ranked] == [x["book_id"] for x in previous] else 0
+            if r.adaptive_depth.settled(unchanged):
+                break
+        logging.info(f"Cascaded rerank scored {len(scores)}/{len(docs)} candidates.")
+        return ranked
+
+    async def search(self, query: str, top_n: int = 10, rerank: bool = True, **kwargs) -> Dict[str, Any]:
+        """Async variant of ``HybridRetriever.search``."""
+        if rerank:
+            retrieved = await self.retrieve(query, **kwargs)
+            payload_bytes = retrieved["payload_bytes"]
+            results = await self.rerank(query, retrieved["retrieved_points"], top_k=top_n, payload_bytes=payload_bytes)
+        else:
+            kwargs["top_k"] = top_n
+            retrieved = await self.retrieve(query, with_payload=False, **kwargs)
+            payload_bytes = retrieved["payload_bytes"]
+            results = [{"book_id": p.id, "score": p.score} for p in retrieved["retrieved_points"]]
+        logging.info(f"Qdrant payload bytes per stage: {payload_bytes}")
+        return {"results": results, "used_query": query, "used_filter": retrieved["used_filter"], "degraded": retrieved["degraded"]}
+
+    async def search_batch(
+        self,
+        queries: List[str],
+        top_n: int = 10,
+        dense_field: str = DENSE_FIELD,
+        sparse_field: str = SPARSE_FIELD,
+        dense_top_k: int = 100,
+        sparse_top_k: int = 100,
+        top_k: int = 50,
+        fusion: str = RRF,
+        dense_weight: float = 0.5,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """Async variant of ``HybridRetriever.search_batch``."""
+        r = self.retriever
+        start_time = time.time()
+        dense, sparse = await asyncio.gather(
+            self._embed_dense_batch_or_none(queries),
+            self._embed_sparse_batch_cached(queries),
+        )
+        query_embs = [{"dense": d, "sparse": s} for d, s in zip(dense, sparse)]
+        depth = {"dense_top_k": dense_top_k, "sparse_top_k": sparse_top_k, "top_k": top_k}
+        query_filter = r._build_filter(**filters)
+        requests = [
+            r._round_requests(emb, dense_field, sparse_field, depth, query_filter, RERANK_STAGE_PAYLOAD, fusion, dense_weight)
+            for emb in query_embs
+        ]
+        responses = await self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[request for group in requests for request in group],
+        )
+        points_per_query = [
+            r._round_points(group, top_k, fusion, dense_weight)[0]
+            for group in r._split(responses, [len(group) for group in requests])
+        ]
+        sizes = [len(points) for points in points_per_query]
+        all_points = [p for points in points_per_query for p in points]
+        docs_per_query = r._split(await self._rerank_texts(all_points, {}), sizes)
+        if r.rerank_scheduler is not None:
+            scores_per_query = await asyncio.gather(*[
+                asyncio.wrap_future(r.rerank_scheduler.submit(q, docs))
+                for q, docs in zip(queries, docs_per_query)
+            ])
+        else:
+            pairs = [(q, doc) for q, docs in zip(queries, docs_per_query) for doc in docs]
+            scores = await self._run_cpu(lambda: r.reranker.predict(pairs, show_progress_bar=False) if pairs else [])
+            scores_per_query = r._split(list(scores), sizes)
+        logging.info(f"Batch search of {len(queries)} queries took {time.time() - start_time:.2f} seconds.")
+        return [
+            {
+                "results": r._rank_by_scores(points, docs, scores, top_n),
+                "used_query": query,
+                "degraded": emb["dense"] is None,
+            }
+            for query, emb, points, docs, scores in zip(queries, query_embs, points_per_query, docs_per_query, scores_per_query)
+        ]
+
+    async def _cached_structured_query(self, query: str) -> Dict[str, Any] | None:
+        r = self.retriever
+        structured_query = await self.search_cache.aget_structured(query)
+        if structured_query is not None:
+            logging.info('Cache hit (structured query).')
+            return structured_query
+        if r.semantic_cache is not None:
+            vector = await self._embed_dense_or_none(query)
+            hit = r.semantic_cache.get(query, vector) if vector is not None else None
+            if hit is not None:
+                logging.info('Semantic cache hit (structured query).')
+                structured_query, verify = hit
+                if verify:
+                    r._extract_executor.submit(r._verify_semantic_hit, query, structured_query)
+                return structured_query
+        logging.info('Cache miss (structured query).')
+        return None
+
+    async def _extract_structured_query(self, query: str) -> Dict[str, Any]:
+        r = self.retriever
+        structured_query = await r.query_processor.aextract(query)
+        await self.search_cache.aset_structured(query, structured_query)
+        if r.semantic_cache is not None:
+            vector = await self._embed_dense_or_none(query)
+            if vector is not None:
+                r.semantic_cache.put(query, vector, structured_query)
+        return structured_query
+
+    async def _route(self, query: str) -> str:
+        if self.retriever.query_classifier is None:
+            return EXTRACT
+        return await self._run_cpu(self.retriever.query_classifier.classify, query)
+
+    async def _search_structured(self, query: str, structured_query: Dict[str, Any], top_n: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs.update(structured_query)
+        return await self.search(structured_query.get("rewrite_query", query), top_n=top_n, **kwargs)
+
+    async def _score(self, query: str, docs: List[str]) -> List[float]:
+        r = self.retriever
+        if not docs:
+            return []
+        if r.rerank_scheduler is not None:
+            return list(await asyncio.wrap_future(r.rerank_scheduler.submit(query, docs)))
+        return list(await self._run_cpu(lambda: r.reranker.predict([(query, doc) for doc in docs], show_progress_bar=False)))
+
+    async def search_with_filter(self, query: str, top_n: int = 10, **kwargs) -> Dict[str, Any]:
+        """Async variant of ``HybridRetriever.search_with_filter``."""
+        logging.info('Start search with filter.')
+        start_time = time.time()
+        params = dict(kwargs)
+        cached_result = await self._cached_result(query, top_n, kwargs, params)
+        if cached_result is not None:
+            return cached_result
+
+        result = await self.single_flight.ado(
+            self.search_cache.result_key(query, top_n, params),
+            lambda: self._search_with_filter_uncached(query, top_n, kwargs, params),
+            lookup=lambda: self._published_result(query, top_n, params),
+        )
+        logging.info(f"Search cache stats: {self.search_cache.stats()}")
+        logging.info(f"Single-flight stats: {self.single_flight.stats()}")
+        logging.info(f"Embedding cache stats: {self.retriever.embedding_cache.stats()}")
+        if self.retriever.semantic_cache is not None:
+            logging.info(f"Semantic query cache stats: {self.retriever.semantic_cache.stats()}")
+        logging.info(f"Search with filter took {time.time() - start_time:.2f} seconds.")
+        return result
+
+    async def _cached_result(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any] | None:
+        cached = await self.search_cache.aget_result(query, top_n, params)
+        if cached is None:
+            return None
+        result, stale = cached
+        if stale and await self.search_cache.aclaim_refresh(query, top_n, params):
+            logging.info('Cache hit (stale search result), refreshing in the background.')
+            task = asyncio.create_task(self._refresh_result(query, top_n, dict(kwargs), params))
+            # Keep a reference until done, the event loop only holds weak ones
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        else:
+            logging.info('Cache hit (search result).')
+        return result
+
+    async def _published_result(self, query: str, top_n: int, params: Dict[str, Any]) -> Dict[str, Any] | None:
+        cached = await self.search_cache.aget_result(query, top_n, params, record=False)
+        return cached[0] if cached is not None and not cached[1] else None
+
+    async def _refresh_result(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]):
+        try:
+            await self.single_flight.ado(
+                self.search_cache.result_key(query, top_n, params),
+                lambda: self._search_with_filter_uncached(query, top_n, kwargs, params),
+            )
+        except Exception:
+            logging.exception(f"Background refresh of '{query}' failed.")
+
+    async def _search_with_filter_uncached(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        structured_query = await self._cached_structured_query(query)
+        if structured_query is not None:
+            result = await self._search_structured(query, structured_query, top_n, kwargs)
+        else:
+            route = await self._route(query)
+            if route == SKIP:
+                result = await self.search(query, top_n=top_n, **kwargs)
+            elif route == SPECULATE and self.retriever.speculative_search:
+                result, structured_query = await asyncio.gather(
+                    self.search(query, top_n=top_n, **kwargs),
+                    self._extract_structured_query(query),
+                )
+                if self.retriever._has_filters(structured_query):
+                    logging.info('Speculative search discarded, filters were extracted.')
+                    result = await self._search_structured(query, structured_query, top_n, kwargs)
+            else:
+                result = await self._search_structured(query, await self._extract_structured_query(query), top_n, kwargs)
+
+        if not result["degraded"]:
+            await self.search_cache.aset_result(query, top_n, params, result)
+        return result
+
+    async def search_with_filter_stream(self, query: str, top_n: int = 10, rerank_chunk_size: int = 16, **kwargs):
+        """Async variant of ``HybridRetriever.search_with_filter_stream``."""
+        r = self.retriever
+        start_time = time.time()
+        params = dict(kwargs)
+        cached_result = await self._cached_result(query, top_n, kwargs, params)
+        if cached_result is not None:
+            yield {"stage": "reranked", **cached_result}
+            return
+
+        structured_query = await self._cached_structured_query(query)
+        if structured_query is None:
+            structured_query = {} if await self._route(query) == SKIP else await self._extract_structured_query(query)
+        kwargs.update(structured_query)
+        used_query = structured_query.get("rewrite_query", query)
+
+        retrieved = await self.retrieve(used_query, **kwargs)
+        points = retrieved["retrieved_points"]
+        yield {
+            "stage": "fused",
+            "results": [{"book_id": p.id, "score": p.score} for p in points[:top_n]],
+            "used_query": used_query,
+            "used_filter": retrieved["used_filter"],
+            "degraded": retrieved["degraded"],
+        }
+        logging.info(f"Fused results streamed after {time.time() - start_time:.2f} seconds.")
+
+        docs = await self._rerank_texts(points, retrieved["payload_bytes"])
+        scores: List[float] = []
+        for chunk_start in range(0, len(docs), rerank_chunk_size):
+            scores.extend(await self._score(used_query, docs[chunk_start:chunk_start + rerank_chunk_size]))
+            if len(scores) < len(docs):
+                yield {
+                    "stage": "reranking",
+                    "results": r._rank_by_scores(points, docs, scores, top_n),
+                    "scored": len(scores),
+                    "total": len(docs),
+                }
+
+        result = {
+            "results": r._rank_by_scores(points, docs, scores, top_n),
+            "used_query": used_query,
+            "used_filter": retrieved["used_filter"],
+            "degraded": retrieved["degraded"],
+        }
+        if not result["degraded"]:
+            await self.search_cache.aset_result(query, top_n, params, result)
+        logging.info(f"Qdrant payload bytes per stage: {retrieved['payload_bytes']}")
+        logging.info(f"Streaming search with filter took {time.time() - start_time:.2f} seconds.")
+        yield {"stage": "reranked", **result}
+
+    async def close(self):
+        await self.retriever.dense_embedder.aclose()
+        await self.client.close()
+        self.cpu_executor.shutdown(wait=False)
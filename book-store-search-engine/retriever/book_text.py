@@ -0,0 +1,47 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+def format_book(payload: Dict[str, Any]) -> str:
+    """Format a book payload into the document text scored by the reranker."""
+    title = payload.get("title", "")
+    desc = payload.get("description_summary", "")
+    cats = payload.get("categories") or []
+    return f"Title: {title}. Description: {desc}. Categories: {', '.join(cats)}"
+
+
+def rerank_text_version(text: str) -> str:
+    """Short content hash identifying a version of a book's reranker text."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+class RerankTextCache:
+    """Bounded, thread-safe LRU of reranker document texts keyed by (book id, version).
+
+    The version changes whenever the text does, so stale entries are never
+    served; they simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[Any, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, book_id, version: str) -> str | None:
+        with self._lock:
+            text = self._entries.get((book_id, version))
+            if text is not None:
+                self._entries.move_to_end((book_id, version))
+            return text
+
+    def put(self, book_id, version: str, text: str):
+        with self._lock:
+            self._entries[(book_id, version)] = text
+            self._entries.move_to_end((book_id, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import struct
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List
+import numpy as np
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+
+class EmbeddingCache:
+    """Two-tier cache for query embeddings.
+
+    Vectors are keyed by (model, task, normalized text), independently of the
+    search parameters, so paging or changing filters reuses the embeddings of
+    an identical query. A bounded in-process LRU sits in front of Redis, and
+    both tiers store the same raw little-endian bytes instead of JSON lists,
+    so a vector reads back identically from either tier.
+
+    Redis clients must be created with ``decode_responses=False``. The ``a*``
+    methods use ``async_redis_client`` and share the LRU with the sync ones.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis | None = None,
+        async_redis_client: AsyncRedis | None = None,
+        max_entries: int = 10000,
+        ttl: int = 24 * 60 * 60,
+        dense_dtype: str = "float16",
+        key_prefix: str = "emb",
+    ):
+        """Initialize the cache.
+
+        Args:
+            redis_client (Redis, optional): Binary Redis client for the shared tier. Defaults to None (in-process only).
+            async_redis_client (AsyncRedis, optional): Binary asyncio Redis client used by the async methods. Defaults to None.
+            max_entries (int, optional): Maximum number of vectors kept in the in-process LRU. Defaults to 10000.
+            ttl (int, optional): Redis expiry in seconds. Defaults to one day.
+            dense_dtype (str, optional): "float16" or "float32" storage for dense vectors. Defaults to "float16".
+            key_prefix (str, optional): Redis key prefix. Defaults to "emb".
+        """
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dense_dtype = np.dtype(dense_dtype).newbyteorder("<")
+        self.key_prefix = key_prefix
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            kind: {"lru_hits": 0, "redis_hits": 0, "misses": 0}
+            for kind in ("dense", "sparse")
+        }
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def _key(self, kind: str, model: str, task: str, text: str) -> str:
+        digest = hashlib.sha1(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{kind}:{model}:{task}:{digest}"
+
+    # --- Binary encoding ---
+    def _encode_dense(self, vector: List[float]) -> bytes:
+        return np.asarray(vector, dtype=self.dense_dtype).tobytes()
+
+    def _decode_dense(self, data: bytes) -> List[float]:
+        return np.frombuffer(data, dtype=self.dense_dtype).astype(np.float32).tolist()
+
+    @staticmethod
+    def _encode_sparse(sparse: Dict[str, List]) -> bytes:
+        indices = np.asarray(sparse["indices"], dtype="<u4")
+        values = np.asarray(sparse["values"], dtype="<f4")
+        return struct.pack("<I", len(indices)) + indices.tobytes() + values.tobytes()
+
+    @staticmethod
+    def _decode_sparse(data: bytes) -> Dict[str, List]:
+        (n,) = struct.unpack_from("<I", data)
+        indices = np.frombuffer(data, dtype="<u4", count=n, offset=4)
+        values = np.frombuffer(data, dtype="<f4", count=n, offset=4 + 4 * n)
+        return {"indices": indices.tolist(), "values": values.tolist()}
+
+    # --- Tiers ---
+    def _get_local(self, kind: str, key: str, decode):
+        with self._lock:
+            data = self._lru.get(key)
+            if data is None:
+                return None
+            self._lru.move_to_end(key)
+            self._counters[kind]["lru_hits"] += 1
+        return decode(data)
+
+    def _record_remote(self, kind: str, key: str, data: bytes | None, decode):
+        with self._lock:
+            if data is None:
+                self._counters[kind]["misses"] += 1
+                return None
+            self._counters[kind]["redis_hits"] += 1
+            self._put_local(key, data)
+        return decode(data)
+
+    def _get(self, kind: str, key: str, decode):
+        value = self._get_local(kind, key, decode)
+        if value is not None:
+            return value
+        data = None
+        if self.redis_client is not None:
+            try:
+                data = self.redis_client.get(key)
+            except RedisError as e:
+                logging.warning(f"Embedding cache read failed: {e}")
+        return self._record_remote(kind, key, data, decode)
+
+    async def _aget(self, kind: str, key: str, decode):
+        value = self._get_local(kind, key, decode)
+        if value is not None:
+            return value
+        data = None
+        if self.async_redis_client is not None:
+            try:
+                data = await self.async_redis_client.get(key)
+            except RedisError as e:
+                logging.warning(f"Embedding cache read failed: {e}")
+        return self._record_remote(kind, key, data, decode)
+
+    def _set(self, key: str, value, encode):
+        data = encode(value)
+        with self._lock:
+            self._put_local(key, data)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(key, self.ttl, data)
+            except RedisError as e:
+                logging.warning(f"Embedding cache write failed: {e}")
+
+    async def _aset(self, key: str, value, encode):
+        data = encode(value)
+        with self._lock:
+            self._put_local(key, data)
+        if self.async_redis_client is not None:
+            try:
+                await self.async_redis_client.setex(key, self.ttl, data)
+            except RedisError as e:
+                logging.warning(f"Embedding cache write failed: {e}")
+
+    def _put_local(self, key: str, data: bytes):
+        self._lru[key] = data
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    # --- Public API ---
+    def get_dense(self, model: str, task: str, text: str) -> List[float] | None:
+        return self._get("dense", self._key("dense", model, task, text), self._decode_dense)
+
+    def set_dense(self, model: str, task: str, text: str, vector: List[float]):
+        self._set(self._key("dense", model, task, text), vector, self._encode_dense)
+
+    def get_sparse(self, model: str, text: str) -> Dict[str, List] | None:
+        return self._get("sparse", self._key("sparse", model, "sparse", text), self._decode_sparse)
+
+    def set_sparse(self, model: str, text: str, sparse: Dict[str, List]):
+        self._set(self._key("sparse", model, "sparse", text), sparse, self._encode_sparse)
+
+    async def aget_dense(self, model: str, task: str, text: str) -> List[float] | None:
+        return await self._aget("dense", self._key("dense", model, task, text), self._decode_dense)
+
+    async def aset_dense(self, model: str, task: str, text: str, vector: List[float]):
+        await self._aset(self._key("dense", model, task, text), vector, self._encode_dense)
+
+    async def aget_sparse(self, model: str, text: str) -> Dict[str, List] | None:
+        return await self._aget("sparse", self._key("sparse", model, "sparse", text), self._decode_sparse)
+
+    async def aset_sparse(self, model: str, text: str, sparse: Dict[str, List]):
+        await self._aset(self._key("sparse", model, "sparse", text), sparse, self._encode_sparse)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return a snapshot of hit/miss counters per embedding kind."""
+        with self._lock:
+            return {kind: dict(counters) for kind, counters in self._counters.items()}
@@ -0,0 +1,406 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import List
+import httpx
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from constants.constants import DENSE_DIM
+
+
+class EmbeddingError(RuntimeError):
+    """Raised by a dense embedding backend that cannot embed right now: unreachable, failing or answering garbage."""
+
+
+class DenseEmbedder(ABC):
+    """Interface for dense embedding backends.
+
+    Every backend must produce ``dim``-dimensional vectors compatible with the
+    ``DENSE_FIELD`` vectors stored in Qdrant, and report any failure to do so
+    as ``EmbeddingError``: that is the signal on which retrieval falls back to
+    sparse only.
+    """
+
+    name: str = ""
+    dim: int = DENSE_DIM
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts.
+
+        Raises:
+            EmbeddingError: If the backend is unavailable.
+        """
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of ``embed``. Local backends run ``embed`` on the default executor."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed, texts)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class CircuitOpenError(EmbeddingError):
+    """Raised when the dense embedding circuit is open and requests are short-circuited."""
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and every
+    call is rejected for ``reset_timeout`` seconds. After that a single probe is
+    let through (half-open); its outcome closes or re-opens the circuit. Every
+    allowed call must report its outcome with ``record``, including one that was
+    cancelled, or a half-open circuit would wait for its probe forever.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logging.warning(f"Dense embedding circuit opened after {self._failures} failures.")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a half-open probe whose outcome is unknown, so the next call probes again."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record(self, healthy: bool | None):
+        """Report the outcome of an allowed call: True on success, False on failure, None if it was abandoned."""
+        if healthy is None:
+            self.release()
+        elif healthy:
+            self.record_success()
+        else:
+            self.record_failure()
+
+
+class JinaEmbeddingClient(DenseEmbedder):
+    """Pooled keep-alive client for the Jina embeddings API.
+
+    One instance is shared by every gRPC worker thread: the underlying
+    ``requests.Session`` keeps up to ``pool_size`` TLS connections open, so
+    queries do not pay a new handshake each time. ``aembed`` uses a pooled
+    ``httpx.AsyncClient`` with the same deadlines, retries and breaker.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    # A missing or expired key fails every call: count it so the breaker opens
+    AUTH_STATUS_CODES = {401, 403}
+
+    @classmethod
+    def _is_client_error(cls, status: int | None) -> bool:
+        # The API answered, but rejected this payload: says nothing about its health
+        return (
+            status is not None and 400 <= status < 500
+            and status not in cls.RETRY_STATUS_CODES and status not in cls.AUTH_STATUS_CODES
+        )
+
+    @classmethod
+    def _log_auth_error(cls, status: int | None):
+        if status in cls.AUTH_STATUS_CODES:
+            logging.error(f"Dense embedding request rejected with {status}: check JINAI_API_KEY.")
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "jina-embeddings-v3",
+        task: str = "text-matching",
+        api_url: str = "https://api.jina.ai/v1/embeddings",
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        pool_size: int = 10,
+        breaker: CircuitBreaker | None = None,
+    ):
+        """Initialize the client.
+
+        Args:
+            api_key (str): Jina AI API key.
+            model (str, optional): Embedding model name. Defaults to "jina-embeddings-v3".
+            task (str, optional): Jina task adapter. Defaults to "text-matching".
+            api_url (str, optional): Embeddings endpoint. Defaults to "https://api.jina.ai/v1/embeddings".
+            connect_timeout (float, optional): TCP/TLS connect deadline in seconds. Defaults to 3.0.
+            read_timeout (float, optional): Response read deadline in seconds. Defaults to 10.0.
+            max_retries (int, optional): Retries after the first attempt on timeouts, 429 and 5xx. Defaults to 2.
+            backoff_base (float, optional): Base of the exponential backoff in seconds. Defaults to 0.2.
+            backoff_max (float, optional): Upper bound of a single backoff in seconds. Defaults to 2.0.
+            pool_size (int, optional): Keep-alive connections kept in the pool. Defaults to 10.
+            breaker (CircuitBreaker, optional): Circuit breaker to use. Defaults to a new CircuitBreaker().
+        """
+        self.api_url = api_url
+        self.name = f"jina/{model}"
+        self.model = model
+        self.task = task
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        })
+        # Retries are handled below so that they share the deadline and breaker logic.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._headers = dict(self.session.headers)
+        self._pool_size = pool_size
+        self._async_client: httpx.AsyncClient | None = None
+
+    @classmethod
+    def from_env(cls, model: str = "jina-embeddings-v3", task: str = "text-matching") -> "JinaEmbeddingClient":
+        """Build a client configured from JINA_* environment variables."""
+        return cls(
+            api_key=os.getenv("JINAI_API_KEY"),
+            model=model,
+            task=task,
+            connect_timeout=float(os.getenv("JINA_CONNECT_TIMEOUT", 3.0)),
+            read_timeout=float(os.getenv("JINA_READ_TIMEOUT", 10.0)),
+            max_retries=int(os.getenv("JINA_MAX_RETRIES", 2)),
+            pool_size=int(os.getenv("JINA_POOL_SIZE", 10)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("JINA_BREAKER_THRESHOLD", 5)),
+                reset_timeout=float(os.getenv("JINA_BREAKER_RESET_SECONDS", 30.0)),
+            ),
+        )
+
+    @staticmethod
+    def _parse_embeddings(r, count: int) -> List[List[float]]:
+        """Vectors of a successful response, or EmbeddingError if its body is not what the API documents."""
+        try:
+            embeddings = [item["embedding"] for item in r.json()["data"]]
+        except (KeyError, TypeError, ValueError) as e:
+            raise EmbeddingError(f"Malformed dense embedding response: {e!r}") from e
+        if len(embeddings) != count:
+            raise EmbeddingError(f"Dense embedding response has {len(embeddings)} vectors for {count} texts.")
+        return embeddings
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads out retries from workers that failed together.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, retrying transient failures.
+
+        Non-retryable 4xx responses are raised without counting as breaker
+        failures, except 401 and 403; any other error, including a malformed
+        response, does.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            EmbeddingError: If every attempt failed, wrapping the last ``requests`` error, or the response body holds no usable vectors.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Dense embedding circuit is open.")
+
+        data = {"model": self.model, "task": self.task, "input": texts}
+        healthy = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    r = self.session.post(self.api_url, json=data, timeout=self.timeout)
+                    if r.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                        raise requests.HTTPError(f"Retryable status {r.status_code}", response=r)
+                    r.raise_for_status()
+                    embeddings = self._parse_embeddings(r, len(texts))
+                    healthy = True
+                    return embeddings
+                except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if self._is_client_error(status):
+                        healthy = True
+                        raise
+                    self._log_auth_error(status)
+                    if status is not None and status not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    logging.warning(f"Dense embedding attempt {attempt + 1} failed ({e}); retrying in {delay:.2f}s.")
+                    time.sleep(delay)
+        except requests.RequestException as e:
+            healthy = bool(healthy)
+            raise EmbeddingError(f"Dense embedding request failed: {e}") from e
+        except Exception:
+            healthy = bool(healthy)
+            raise
+        finally:
+            self.breaker.record(healthy)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of ``embed``.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+            EmbeddingError: If every attempt failed, wrapping the last ``httpx`` error, or the response body holds no usable vectors.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Dense embedding circuit is open.")
+        if self._async_client is None:
+            connect_timeout, read_timeout = self.timeout
+            self._async_client = httpx.AsyncClient(
+                headers=self._headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_keepalive_connections=self._pool_size),
+            )
+
+        data = {"model": self.model, "task": self.task, "input": texts}
+        # Cancellation is a BaseException: it releases a half-open probe instead of counting
+        healthy = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    r = await self._async_client.post(self.api_url, json=data)
+                    r.raise_for_status()
+                    embeddings = self._parse_embeddings(r, len(texts))
+                    healthy = True
+                    return embeddings
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    if self._is_client_error(status):
+                        healthy = True
+                        raise
+                    self._log_auth_error(status)
+                    if status is not None and status not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    logging.warning(f"Dense embedding attempt {attempt + 1} failed ({e}); retrying in {delay:.2f}s.")
+                    await asyncio.sleep(delay)
+        except httpx.HTTPError as e:
+            healthy = bool(healthy)
+            raise EmbeddingError(f"Dense embedding request failed: {e}") from e
+        except Exception:
+            healthy = bool(healthy)
+            raise
+        finally:
+            self.breaker.record(healthy)
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+
+
+class FastEmbedDenseEmbedder(DenseEmbedder):
+    """In-process ONNX backend running jina-embeddings-v3 through FastEmbed.
+
+    Uses the same weights and task adapters as the Jina API, so its vectors can
+    be queried against a collection seeded with API embeddings.
+    """
+
+    TASK_IDS = {
+        "retrieval.query": 0,
+        "retrieval.passage": 1,
+        "separation": 2,
+        "classification": 3,
+        "text-matching": 4,
+    }
+
+    def __init__(self, model: str = "jinaai/jina-embeddings-v3", task: str = "text-matching", threads: int | None = None):
+        """Initialize the local backend.
+
+        Args:
+            model (str, optional): FastEmbed model name. Defaults to "jinaai/jina-embeddings-v3".
+            task (str, optional): Jina task adapter. Defaults to "text-matching".
+            threads (int, optional): ONNX Runtime intra-op threads. Defaults to FastEmbed's choice.
+        """
+        from fastembed import TextEmbedding
+
+        self.name = f"fastembed/{model}"
+        self.model = TextEmbedding(model_name=model, threads=threads)
+        self.task_id = self.TASK_IDS[task]
+        dim = self.model.embedding_size
+        if dim != DENSE_DIM:
+            raise ValueError(f"Model {model} produces {dim}-dim vectors, collection expects {DENSE_DIM}.")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        try:
+            return [v.tolist() for v in self.model.embed(texts, task_id=self.task_id)]
+        except Exception as e:
+            # ONNX Runtime and tokenizer errors have no common base class
+            raise EmbeddingError(f"Local dense embedding failed: {e!r}") from e
+
+
+class StubDenseEmbedder(DenseEmbedder):
+    """Deterministic offline backend for tests and benchmarks.
+
+    Vectors are unit-norm pseudo-random noise seeded by the text, so identical
+    texts always map to identical vectors but carry no semantic meaning.
+    """
+
+    def __init__(self, dim: int = DENSE_DIM):
+        self.name = "stub"
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+            vectors.append((v / np.linalg.norm(v)).tolist())
+        return vectors
+
+
+DENSE_BACKENDS = ("jina", "fastembed", "stub")
+
+
+def build_dense_embedder(backend: str = "jina", model: str = "jina-embeddings-v3", task: str = "text-matching") -> DenseEmbedder:
+    """Create a dense embedder from its backend name ("jina", "fastembed" or "stub")."""
+    if backend == "jina":
+        return JinaEmbeddingClient.from_env(model=model, task=task)
+    if backend == "fastembed":
+        return FastEmbedDenseEmbedder(model=os.getenv("LOCAL_DENSE_MODEL", "jinaai/jina-embeddings-v3"), task=task)
+    if backend == "stub":
+        return StubDenseEmbedder()
+    raise ValueError(f"Unknown dense backend '{backend}', expected one of {DENSE_BACKENDS}.")
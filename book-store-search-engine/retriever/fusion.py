@@ -0,0 +1,76 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from qdrant_client import models
+
+RRF = "rrf"
+DBSF = "dbsf"
+FUSIONS = (RRF, DBSF)
+
+# Same k as Qdrant's server-side RRF, so equal weights reproduce its ranking
+RRF_K = 2
+
+Ranking = List[Tuple[Any, float]]
+
+
+def fusion_weights(dense_weight: float, has_dense: bool = True) -> List[float]:
+    """Weights of the (sparse, dense) rankings; equal weights are (1, 1), as in Qdrant."""
+    if not 0.0 <= dense_weight <= 1.0:
+        raise ValueError(f"dense_weight must be between 0 and 1, got {dense_weight}.")
+    if not has_dense:
+        return [1.0]
+    return [2 * (1 - dense_weight), 2 * dense_weight]
+
+
+def server_fusion_query(fusion: str, dense_weight: float) -> models.FusionQuery | None:
+    """Qdrant fusion query for ``fusion``, or None when the weights need client-side fusion."""
+    if fusion not in FUSIONS:
+        raise ValueError(f"Unknown fusion '{fusion}', expected one of {FUSIONS}.")
+    if dense_weight != 0.5:
+        return None
+    return models.FusionQuery(fusion=models.Fusion.RRF if fusion == RRF else models.Fusion.DBSF)
+
+
+def weighted_rrf(rankings: List[Ranking], weights: List[float], k: int = RRF_K) -> Ranking:
+    """Reciprocal rank fusion with per-ranking weights, as in Qdrant.
+
+    A point at 0-based ``rank`` scores ``1 / ((rank + 1) / weight + k - 1)``,
+    which is the plain ``1 / (k + rank)`` for a weight of 1; a larger weight
+    acts as if the point were ranked higher. Rankings with a weight of 0 are
+    left out, so their points do not pad the result.
+    """
+    fused: Dict[Any, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, (point_id, _) in enumerate(ranking):
+            fused[point_id] = fused.get(point_id, 0.0) + 1 / ((rank + 1) / weight + k - 1)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def dbsf(rankings: List[Ranking], weights: List[float]) -> Ranking:
+    """Distribution-based score fusion with per-ranking weights.
+
+    Each ranking's scores are scaled by their spread, mapping mean - 3 std to 0
+    and mean + 3 std to 1 as Qdrant does, then summed with the weights. Unlike
+    RRF the score gaps are kept, so a clear dense or sparse winner stays on top.
+    Rankings with a weight of 0 are left out, as in ``weighted_rrf``.
+    """
+    fused: Dict[Any, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        scores = np.asarray([score for _, score in ranking], dtype=np.float64)
+        std = scores.std(ddof=1) if len(scores) > 1 else 0.0
+        normalized = (scores - scores.mean() + 3 * std) / (6 * std) if std > 0 else np.full(len(scores), 0.5)
+        for (point_id, _), score in zip(ranking, normalized):
+            fused[point_id] = fused.get(point_id, 0.0) + weight * float(score)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def fuse(fusion: str, rankings: List[Ranking], weights: List[float]) -> Ranking:
+    """Fuse ``(id, score)`` rankings, best first, with ``fusion`` ("rrf" or "dbsf")."""
+    if fusion == RRF:
+        return weighted_rrf(rankings, weights)
+    if fusion == DBSF:
+        return dbsf(rankings, weights)
+    raise ValueError(f"Unknown fusion '{fusion}', expected one of {FUSIONS}.")
@@ -1,21 +1,34 @@
 import os
-from typing import List, Dict, Any
-import requests
+from typing import List, Dict, Any, Tuple
 from fastembed import SparseTextEmbedding, SparseEmbedding
 from sentence_transformers import CrossEncoder
 from qdrant_client import QdrantClient, models
 from query_processor.book_filter_extractor import BookFilterExtractor
+from query_processor.query_classifier import QueryClassifier, SKIP, SPECULATE, EXTRACT
+from query_processor.semantic_query_cache import SemanticQueryCache
+from retriever.embedding_client import DenseEmbedder, CircuitOpenError, EmbeddingError, build_dense_embedder
+from retriever.embedding_cache import EmbeddingCache
+from retriever.rerank_scheduler import RerankScheduler
+from retriever.onnx_reranker import OnnxCrossEncoder, DEFAULT_ONNX_DIR
+from retriever.book_text import format_book, RerankTextCache
+from retriever.search_cache import SearchCache, binary_client
+from retriever.single_flight import SingleFlight
+from retriever.adaptive_depth import AdaptiveDepth
+from retriever.fusion import RRF, fuse, fusion_weights, server_fusion_query
 import dotenv
 import logging
 from redis import Redis
 import json
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor
 from langsmith import traceable
 from constants.constants import (
     DENSE_FIELD,
     SPARSE_FIELD,
-    BOOK_COLLECTION_NAME
+    BOOK_COLLECTION_NAME,
+    RERANK_TEXT_FIELD,
+    RERANK_TEXT_VERSION_FIELD,
 )
 # from transformers import pipeline, AutoTokenizer
 # import transformers
@@ -35,6 +48,17 @@ logging.getLogger("qdrant_client").setLevel(logging.ERROR)
 
 dotenv.load_dotenv()
 
+# Payload fields each pipeline stage needs from Qdrant
+RERANK_STAGE_PAYLOAD = [RERANK_TEXT_VERSION_FIELD]
+RERANK_TEXT_PAYLOAD = [RERANK_TEXT_FIELD, RERANK_TEXT_VERSION_FIELD]
+LEGACY_RERANK_TEXT_PAYLOAD = ["title", "description_summary", "categories"]
+
+
+def _payload_bytes(points) -> int:
+    """Approximate payload size in bytes of points returned by Qdrant."""
+    return sum(len(json.dumps(p.payload, ensure_ascii=False).encode("utf-8")) for p in points if p.payload)
+
+
 class HybridRetriever:
     """Hybrid retriever for book search."""
     def __init__(
@@ -48,77 +72,471 @@ class HybridRetriever:
         reranker_model: str = "cross-encoder/ms-marco-MiniLM-L6-v2", #"jinaai/jina-reranker-v2-base-multilingual",
         # summarizer_model: str = "pszemraj/led-large-book-summary"
         task: str = "text-matching",
+        parallel_embedding: bool = True,
+        embedding_workers: int = 10,
+        dense_embedder: DenseEmbedder | None = None,
+        embedding_cache: EmbeddingCache | None = None,
+        reranker_backend: str = "torch",
+        rerank_batching: bool = True,
+        rerank_max_batch_pairs: int = 512,
+        rerank_max_wait_ms: float = 5.0,
+        rerank_text_cache_size: int = 50000,
+        query_classifier: QueryClassifier | None = None,
+        speculative_search: bool = True,
+        semantic_cache: SemanticQueryCache | None = None,
+        search_cache_ttl: int = 60 * 60,
+        search_cache_min_ttl: int = 10 * 60,
+        search_cache_max_ttl: int = 6 * 60 * 60,
+        single_flight: SingleFlight | None = None,
+        adaptive_depth: AdaptiveDepth | None = None,
+        dense_search_params: models.SearchParams | None = None,
     ):
         """Initialize the hybrid retriever with dense, sparse, and reranker models.
         
         Args:
             qdrant_client (QdrantClient): The Qdrant client to use.
+            redis_client (Redis): Redis client of the search cache, which stores results packed; if it decodes responses, a binary client with the same connection settings is used instead.
+            query_processor (BookFilterExtractor): LLM extractor of structured queries.
             collection_name (str, optional): The name of the collection to use. Defaults to "book_collection".
             dense_model (str, optional): The name of the dense model to use. Defaults to "jina-embeddings-v3" (Jina AI API).
             sparse_model (str, optional): The name of the sparse model to use. Defaults to "prithivida/Splade_PP_en_v1" (FastEmbed).
             reranker_model (str, optional): The name of the reranker model to use. Defaults to "jinaai/jina-reranker-v2-base-multilingual" (SentenceTransformers).
             task (str, optional): The task to use for the retriever. Defaults to "text-matching".
+            parallel_embedding (bool, optional): Overlap the remote dense request with local sparse inference. Defaults to True.
+            embedding_workers (int, optional): Threads available for in-flight dense requests. Defaults to 10 (one per gRPC worker).
+            dense_embedder (DenseEmbedder, optional): Dense embedding backend. Defaults to the one named by DENSE_BACKEND ("jina", "fastembed" or "stub"; default "jina").
+            embedding_cache (EmbeddingCache, optional): Cache for query embeddings. Defaults to an in-process only EmbeddingCache.
+            reranker_backend (str, optional): "torch" for the SentenceTransformers CrossEncoder or "onnx-int8" for the quantized ONNX Runtime export of the same model. Defaults to "torch".
+            rerank_batching (bool, optional): Micro-batch reranking across concurrent requests. Defaults to True.
+            rerank_max_batch_pairs (int, optional): Pairs after which a rerank batch is closed early. Defaults to 512.
+            rerank_max_wait_ms (float, optional): Longest a request waits for others to join its rerank batch. Defaults to 5.0.
+            rerank_text_cache_size (int, optional): Reranker document texts kept in memory, keyed by book id and version. Defaults to 50000.
+            query_classifier (QueryClassifier, optional): Decides per query whether LLM extraction is needed. Defaults to None (always extract).
+            speculative_search (bool, optional): For queries routed to SPECULATE, search the raw query while the LLM extracts and keep that result when no filters are extracted. Defaults to True.
+            semantic_cache (SemanticQueryCache, optional): Answers structured query extraction from similar past queries, matched on their dense embedding. Defaults to None (exact match only).
+            search_cache_ttl (int, optional): Expiry in seconds of cached structured queries. Defaults to one hour.
+            search_cache_min_ttl (int, optional): Fresh lifetime in seconds of a search result looked up once in the current hour; popular results get proportionally longer. Defaults to 10 minutes.
+            search_cache_max_ttl (int, optional): Longest fresh lifetime of a search result in seconds. Defaults to 6 hours.
+            single_flight (SingleFlight, optional): Coalesces concurrent cache misses for the same search. Defaults to an in-process SingleFlight.
+            adaptive_depth (AdaptiveDepth, optional): Starts retrieval shallow and widens it only when dense and sparse disagree or filters prune the candidates, and stops reranking once the top-N is stable. The request's depths become upper bounds. Defaults to None (fixed depths, every candidate reranked).
+            dense_search_params (models.SearchParams, optional): Params of the dense prefetch, e.g. oversampling and rescoring for a quantized collection (see ``retriever.quantization``). Defaults to None (Qdrant's defaults).
 
-        Note: JINAI_API_KEY is required to use the Jina AI API.
+        Note: JINAI_API_KEY is required to use the Jina AI API backend.
         """
         if not qdrant_client.collection_exists(collection_name):
             qdrant_client.create_collection(collection_name)
         self.client = qdrant_client
-        self.redis_client = redis_client
         self.collection_name = collection_name
         self.query_processor = query_processor
-        self.api_url = "https://api.jina.ai/v1/embeddings"
-        self.api_key = os.getenv("JINAI_API_KEY")
         self.model_name = dense_model
         self.task = task
+        self.dense_embedder = dense_embedder or build_dense_embedder(
+            os.getenv("DENSE_BACKEND", "jina"), model=dense_model, task=task
+        )
+        self.embedding_cache = embedding_cache or EmbeddingCache()
+        self.parallel_embedding = parallel_embedding
+        self._embed_executor = ThreadPoolExecutor(
+            max_workers=embedding_workers,
+            thread_name_prefix="dense-embed",
+        )
 
+        self.sparse_model_name = sparse_model
         self.sparse_model = SparseTextEmbedding(model_name=sparse_model)
         # self.tokenizer = AutoTokenizer.from_pretrained(summarizer_model)
         # self.summarizer = pipeline("summarization", model=summarizer_model, device=gpu_id)
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-        }
 
-        self.reranker = CrossEncoder(
-            reranker_model,
-            trust_remote_code=True,
+        if reranker_backend == "onnx-int8":
+            self.reranker = OnnxCrossEncoder(os.getenv("RERANKER_ONNX_DIR", DEFAULT_ONNX_DIR))
+        elif reranker_backend == "torch":
+            self.reranker = CrossEncoder(
+                reranker_model,
+                trust_remote_code=True,
+            )
+        else:
+            raise ValueError(f"Unknown reranker backend '{reranker_backend}', expected 'torch' or 'onnx-int8'.")
+        self.rerank_scheduler = RerankScheduler(
+            self.reranker,
+            max_batch_pairs=rerank_max_batch_pairs,
+            max_wait_ms=rerank_max_wait_ms,
+        ) if rerank_batching else None
+        self.rerank_text_cache = RerankTextCache(max_entries=rerank_text_cache_size)
+        # Set once a point without precomputed text is seen (collection seeded before rerank_text)
+        self._legacy_rerank_text = False
+        self.query_classifier = query_classifier
+        self.speculative_search = speculative_search
+        self.semantic_cache = semantic_cache
+        self.adaptive_depth = adaptive_depth
+        self.dense_search_params = dense_search_params
+        self.search_cache = SearchCache(
+            binary_client(redis_client),
+            identity={
+                "collection": collection_name,
+                "dense": self.dense_embedder.name,
+                "task": task,
+                "sparse": sparse_model,
+                "reranker": reranker_model if reranker_backend == "torch" else getattr(self.reranker, "model_name", reranker_model),
+                "reranker_backend": reranker_backend,
+                "extractor": getattr(query_processor, "model_name", type(query_processor).__name__),
+                "adaptive_depth": adaptive_depth.settings() if adaptive_depth is not None else None,
+                "dense_search_params": dense_search_params.model_dump(exclude_none=True) if dense_search_params is not None else None,
+            },
+            ttl=search_cache_ttl,
+            min_ttl=search_cache_min_ttl,
+            max_ttl=search_cache_max_ttl,
+        )
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self.single_flight = single_flight or SingleFlight()
+        self._extract_executor = ThreadPoolExecutor(
+            max_workers=embedding_workers,
+            thread_name_prefix="llm-extract",
         )
     
-    def _convert_numpy_types(self, obj):
-        """Convert numpy types to native Python types for JSON serialization."""
-        if isinstance(obj, (np.number, np.ndarray)):
-            return obj.item() if hasattr(obj, 'item') else obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: self._convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, tuple):
-            return tuple(self._convert_numpy_types(item) for item in obj)
-        else:
-            return obj
-
     def embed_sparse(self, text: str) -> Dict[str, List[float]]:
         result: List[SparseEmbedding] = list(self.sparse_model.embed(text))
-        return {"values": result[0].values, "indices": result[0].indices}
+        return {"values": result[0].values.tolist(), "indices": result[0].indices.tolist()}
 
     def embed_dense(self, text: str) -> List[float]:
-        data = {"model": self.model_name, "task": self.task, "input": [text]}
-        r = requests.post(self.api_url, headers=self.headers, json=data, timeout=180)
-        r.raise_for_status()
-        return r.json()["data"][0]["embedding"]
+        return self.dense_embedder.embed([text])[0]
+
+    def _embed_dense_or_none(self, text: str) -> List[float] | None:
+        """Cached dense embedding that degrades to None so retrieval can fall back to sparse only."""
+        dense = self.embedding_cache.get_dense(self.dense_embedder.name, self.task, text)
+        if dense is not None:
+            return dense
+        try:
+            dense = self.embed_dense(text)
+        except CircuitOpenError:
+            logging.warning("Dense embedding circuit open, using sparse-only retrieval.")
+            return None
+        except EmbeddingError as e:
+            logging.warning(f"Dense embedding failed ({e}), using sparse-only retrieval.")
+            return None
+        self.embedding_cache.set_dense(self.dense_embedder.name, self.task, text, dense)
+        return dense
+
+    def _embed_sparse_cached(self, text: str) -> Dict[str, List[float]]:
+        sparse = self.embedding_cache.get_sparse(self.sparse_model_name, text)
+        if sparse is None:
+            sparse = self.embed_sparse(text)
+            self.embedding_cache.set_sparse(self.sparse_model_name, text, sparse)
+        return sparse
+
+    @staticmethod
+    def _timed(fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
 
     def embed_hybrid(self, text: str) -> Dict[str, Any]:
-        dense = self.embed_dense(text)
-        sparse = self.embed_sparse(text)
-        return {"dense": dense, "sparse": sparse}
+        """Embed a text with both the dense and the sparse model.
+
+        With ``parallel_embedding`` the dense request is sent from a background
+        thread while SPLADE runs on the calling thread, so a cache miss costs
+        max(dense, sparse) instead of dense + sparse. Per-stage timings (seconds)
+        are returned under ``timings``. ``dense`` is None when the dense backend
+        is unavailable. Both vectors go through ``embedding_cache`` first.
+        """
+        start = time.perf_counter()
+        timings = {}
+        if self.parallel_embedding:
+            dense_future = self._embed_executor.submit(self._timed, self._embed_dense_or_none, text)
+            sparse, timings["sparse"] = self._timed(self._embed_sparse_cached, text)
+            dense, timings["dense"] = dense_future.result()
+        else:
+            dense, timings["dense"] = self._timed(self._embed_dense_or_none, text)
+            sparse, timings["sparse"] = self._timed(self._embed_sparse_cached, text)
+        timings["total"] = time.perf_counter() - start
+        logging.info(
+            f"Embedding took {timings['total']:.3f}s "
+            f"(dense {timings['dense']:.3f}s, sparse {timings['sparse']:.3f}s, parallel={self.parallel_embedding})."
+        )
+        return {"dense": dense, "sparse": sparse, "timings": timings}
+
+    def embed_sparse_batch(self, texts: List[str]) -> List[Dict[str, List[float]]]:
+        return [
+            {"values": e.values.tolist(), "indices": e.indices.tolist()}
+            for e in self.sparse_model.embed(texts)
+        ]
+
+    def _embed_dense_batch_or_none(self, texts: List[str]) -> List[List[float] | None]:
+        """Cached dense embeddings of many texts; cache misses go out in a single request."""
+        vectors = [self.embedding_cache.get_dense(self.dense_embedder.name, self.task, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if not missing:
+            return vectors
+        try:
+            embedded = self.dense_embedder.embed([texts[i] for i in missing])
+        except CircuitOpenError:
+            logging.warning("Dense embedding circuit open, using sparse-only retrieval.")
+            return vectors
+        except EmbeddingError as e:
+            logging.warning(f"Dense embedding failed ({e}), using sparse-only retrieval.")
+            return vectors
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+            self.embedding_cache.set_dense(self.dense_embedder.name, self.task, texts[i], vector)
+        return vectors
+
+    def _embed_sparse_batch_cached(self, texts: List[str]) -> List[Dict[str, List[float]]]:
+        """Cached sparse embeddings of many texts; cache misses share one SPLADE batch."""
+        vectors = [self.embedding_cache.get_sparse(self.sparse_model_name, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            for i, vector in zip(missing, self.embed_sparse_batch([texts[i] for i in missing])):
+                vectors[i] = vector
+                self.embedding_cache.set_sparse(self.sparse_model_name, texts[i], vector)
+        return vectors
+
+    def embed_hybrid_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Batched ``embed_hybrid``: one dense request and one SPLADE batch for all cache misses."""
+        start = time.perf_counter()
+        dense_future = self._embed_executor.submit(self._embed_dense_batch_or_none, texts)
+        sparse = self._embed_sparse_batch_cached(texts)
+        dense = dense_future.result()
+        logging.info(f"Batch embedding of {len(texts)} queries took {time.perf_counter() - start:.3f}s.")
+        return [{"dense": d, "sparse": s} for d, s in zip(dense, sparse)]
 
     def _format_book(self, payload: dict) -> str:
-        title = payload.get("title", "")
-        desc = payload.get("description_summary", "")
-        cats = payload.get("categories", [])
-        return f"Title: {title}. Description: {desc}. Categories: {', '.join(cats)}"
-    
+        return format_book(payload)
+
+    def _stage_payload(self, with_payload: bool | List[str]) -> bool | List[str]:
+        """Payload of the retrieval stage; on a legacy collection the reranking one also carries the fields ``_format_book`` needs."""
+        if self._legacy_rerank_text and with_payload == RERANK_STAGE_PAYLOAD:
+            return RERANK_STAGE_PAYLOAD + LEGACY_RERANK_TEXT_PAYLOAD
+        return with_payload
+
+    def _cached_rerank_texts(self, retrieved_points):
+        """Split points into texts served by ``rerank_text_cache`` or their own payload, and ids to fetch."""
+        texts = {}
+        missing = {}
+        for p in retrieved_points:
+            if p.id in texts or p.id in missing:
+                continue
+            payload = p.payload or {}
+            version = payload.get(RERANK_TEXT_VERSION_FIELD)
+            if version is None and "title" in payload:
+                texts[p.id] = self._format_book(payload)
+                continue
+            text = self.rerank_text_cache.get(p.id, version) if version else None
+            if text is None:
+                missing[p.id] = None
+            else:
+                texts[p.id] = text
+        return texts, list(missing)
+
+    def _absorb_rerank_text_records(self, records, texts: Dict[Any, str]) -> List[Any]:
+        """Cache fetched precomputed texts; return ids of points seeded without one.
+
+        The first such point switches later retrievals to returning the legacy
+        fields directly, so a collection without ``rerank_text`` costs the
+        extra fetches once, not on every search.
+        """
+        legacy = []
+        for r in records:
+            text = r.payload.get(RERANK_TEXT_FIELD)
+            if text is None:
+                legacy.append(r.id)
+                continue
+            texts[r.id] = text
+            self.rerank_text_cache.put(r.id, r.payload[RERANK_TEXT_VERSION_FIELD], text)
+        if legacy and not self._legacy_rerank_text:
+            self._legacy_rerank_text = True
+            logging.warning(
+                f"Collection '{self.collection_name}' has points without {RERANK_TEXT_FIELD}; retrieving their "
+                f"{LEGACY_RERANK_TEXT_PAYLOAD} with the candidates. Reseed the collection to precompute them."
+            )
+        return legacy
+
+    def _rerank_texts(self, retrieved_points, payload_bytes: Dict[str, int] | None = None) -> List[str]:
+        """Resolve the reranker document text of every point.
+
+        Points are retrieved with only their text version in the payload. Texts
+        come from ``rerank_text_cache`` when the version matches, otherwise they
+        are fetched from Qdrant by id: the precomputed ``rerank_text`` if the
+        collection was seeded with it, else the fields ``_format_book`` needs.
+        Once a collection is known to lack precomputed texts, those fields come
+        with the retrieved points and nothing is fetched.
+        Bytes fetched per step are added to ``payload_bytes`` if given.
+        """
+        payload_bytes = payload_bytes if payload_bytes is not None else {}
+        texts, missing = self._cached_rerank_texts(retrieved_points)
+
+        if missing:
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=missing,
+                with_payload=RERANK_TEXT_PAYLOAD,
+            )
+            payload_bytes["rerank_text"] = _payload_bytes(records)
+            legacy = self._absorb_rerank_text_records(records, texts)
+            if legacy:
+                records = self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=legacy,
+                    with_payload=LEGACY_RERANK_TEXT_PAYLOAD,
+                )
+                payload_bytes["rerank_text_legacy"] = _payload_bytes(records)
+                for r in records:
+                    texts[r.id] = self._format_book(r.payload)
+            logging.info(f"Rerank text cache: {len(texts) - len(missing)} hits, {len(missing)} fetched ({len(legacy)} without precomputed text).")
+
+        return [texts.get(p.id, "") for p in retrieved_points]
+
+    @staticmethod
+    def _build_prefetch(
+        query_emb: Dict[str, Any],
+        dense_field: str,
+        sparse_field: str,
+        dense_top_k: int,
+        sparse_top_k: int,
+        dense_params: models.SearchParams | None = None,
+    ) -> List[models.Prefetch]:
+        """Sparse and, when available, dense prefetch stages for hybrid fusion."""
+        prefetch = [
+            models.Prefetch(
+                query=models.SparseVector(
+                    indices=query_emb["sparse"]["indices"],
+                    values=query_emb["sparse"]["values"],
+                ),
+                using=sparse_field,
+                limit=sparse_top_k,
+            ),
+        ]
+        if query_emb["dense"] is not None:
+            prefetch.append(
+                models.Prefetch(
+                    query=query_emb["dense"],
+                    using=dense_field,
+                    limit=dense_top_k,
+                    params=dense_params,
+                )
+            )
+        return prefetch
+
+    def _ranking_requests(
+        self,
+        query_emb: Dict[str, Any],
+        dense_field: str,
+        sparse_field: str,
+        depth: Dict[str, int],
+        query_filter: models.Filter | None,
+        with_payload: bool | List[str],
+    ) -> List[models.QueryRequest]:
+        """The sparse and, when available, dense rankings on their own."""
+        requests = [
+            models.QueryRequest(
+                query=models.SparseVector(indices=query_emb["sparse"]["indices"], values=query_emb["sparse"]["values"]),
+                using=sparse_field,
+                limit=depth["sparse_top_k"],
+                filter=query_filter,
+                with_payload=with_payload,
+            ),
+        ]
+        if query_emb["dense"] is not None:
+            requests.append(
+                models.QueryRequest(
+                    query=query_emb["dense"],
+                    using=dense_field,
+                    limit=depth["dense_top_k"],
+                    params=self.dense_search_params,
+                    filter=query_filter,
+                    with_payload=with_payload,
+                )
+            )
+        return requests
+
+    def _round_requests(
+        self,
+        query_emb: Dict[str, Any],
+        dense_field: str,
+        sparse_field: str,
+        depth: Dict[str, int],
+        query_filter: models.Filter | None,
+        with_payload: bool | List[str],
+        fusion: str,
+        dense_weight: float,
+        with_rankings: bool = False,
+    ) -> List[models.QueryRequest]:
+        """Qdrant requests of one retrieval round.
+
+        When Qdrant can do the fusion, this is the fused query, followed by the
+        rankings (ids only) if ``with_rankings``. Otherwise it is the rankings
+        with payload, fused here by ``_round_points``; a ``dense_weight`` of 0
+        or 1 only asks for the sparse or dense ranking.
+        """
+        with_payload = self._stage_payload(with_payload)
+        fusion_query = server_fusion_query(fusion, dense_weight)
+        if fusion_query is None:
+            requests = self._ranking_requests(query_emb, dense_field, sparse_field, depth, query_filter, with_payload)
+            if len(requests) == 2 and dense_weight in (0.0, 1.0):
+                return [requests[int(dense_weight)]]
+            return requests
+        fused = models.QueryRequest(
+            prefetch=self._build_prefetch(query_emb, dense_field, sparse_field, depth["dense_top_k"], depth["sparse_top_k"], self.dense_search_params),
+            query=fusion_query,
+            limit=depth["top_k"],
+            filter=query_filter,
+            with_payload=with_payload,
+        )
+        if not with_rankings:
+            return [fused]
+        return [fused] + self._ranking_requests(query_emb, dense_field, sparse_field, depth, query_filter, False)
+
+    @staticmethod
+    def _round_points(responses, limit: int, fusion: str, dense_weight: float) -> Tuple[List[Any], List[List[Any]]]:
+        """Fused points of a round's responses, and the rankings they were fused from."""
+        if server_fusion_query(fusion, dense_weight) is not None:
+            return responses[0].points, [r.points for r in responses[1:]]
+        rankings = [r.points for r in responses]
+        points = {p.id: p for ranking in rankings for p in ranking}
+        fused = fuse(
+            fusion,
+            [[(p.id, p.score) for p in ranking] for ranking in rankings],
+            fusion_weights(dense_weight, has_dense=len(rankings) == 2),
+        )
+        return [points[i].model_copy(update={"score": score}) for i, score in fused[:limit]], rankings
+
+    def _next_depth(self, rounds: List[Dict[str, Any]], depth: Dict[str, int], limits: Dict[str, int], fused: int, rankings: List[List[Any]]) -> Dict[str, int] | None:
+        """Record an adaptive depth round and return the depths of the next one, if any."""
+        overlap = None
+        if len(rankings) == 2:
+            overlap = self.adaptive_depth.overlap([p.id for p in rankings[1]], [p.id for p in rankings[0]])
+        wider, reason = self.adaptive_depth.widen(depth, limits, overlap, fused, rounds[-1]["fused"] if rounds else None)
+        rounds.append({**depth, "overlap": round(overlap, 2) if overlap is not None else None, "fused": fused, "decision": reason})
+        return wider
+
+    def _retrieve_adaptive(
+        self,
+        query: str,
+        query_emb: Dict[str, Any],
+        dense_field: str,
+        sparse_field: str,
+        limits: Dict[str, int],
+        query_filter: models.Filter | None,
+        with_payload: bool | List[str],
+        fusion: str,
+        dense_weight: float,
+    ) -> List[Any]:
+        depth = self.adaptive_depth.initial(limits)
+        rounds: List[Dict[str, Any]] = []
+        while depth is not None:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=self._round_requests(
+                    query_emb, dense_field, sparse_field, depth, query_filter, with_payload, fusion, dense_weight, with_rankings=True
+                ),
+            )
+            points, rankings = self._round_points(responses, depth["top_k"], fusion, dense_weight)
+            depth = self._next_depth(rounds, depth, limits, len(points), rankings)
+        logging.info(f"Adaptive depth for '{query}' (limits {limits}): {rounds}")
+        return points
+
+    @staticmethod
+    def _rank_by_scores(retrieved_points, docs: List[str], scores, top_k: int) -> List[Dict[str, Any]]:
+        scores = np.asarray(scores)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [{"book_id": retrieved_points[i].id, "score": float(scores[i]), "text": docs[i]} for i in order]
+
     def _build_filter(
         self,
         **kwargs
@@ -245,87 +663,397 @@ class HybridRetriever:
         dense_top_k: int = 100,
         sparse_top_k: int = 100,
         top_k: int = 50,
+        with_payload: bool | List[str] = RERANK_STAGE_PAYLOAD,
+        fusion: str = RRF,
+        dense_weight: float = 0.5,
         **filters
     ):
-        """Perform hybrid retrieval with Reciprocal Rank Fusion."""
-        query_emb = self.embed_hybrid(query)
+        """Perform hybrid retrieval, fusing the dense and sparse rankings.
 
+        ``with_payload`` selects the payload fields Qdrant returns. It defaults to
+        what reranking needs; pass False to get ids and fusion scores only.
 
-        retrieved_points = self.client.query_points(
-            collection_name=self.collection_name,
-            prefetch=[
-                models.Prefetch(
-                    query=models.SparseVector(
-                        indices=query_emb["sparse"]["indices"],
-                        values=query_emb["sparse"]["values"],
-                    ),
-                    using=sparse_field,
-                    limit=sparse_top_k,
-                ),
-                models.Prefetch(
-                    query=query_emb["dense"],
-                    using=dense_field,
-                    limit=dense_top_k,
+        ``fusion`` is "rrf" (reciprocal rank fusion) or "dbsf" (distribution-based
+        score fusion), and ``dense_weight`` the share of the dense ranking in it,
+        from 0 (sparse only) to 1 (dense only). With equal weights Qdrant fuses;
+        otherwise the rankings with a non-zero weight are fetched and fused here.
+        """
+        query_emb = self.embed_hybrid(query)
+        query_filter = self._build_filter(**filters)
+        limits = {"dense_top_k": dense_top_k, "sparse_top_k": sparse_top_k, "top_k": top_k}
+
+        # Without reranking the depth costs next to nothing, so it stays fixed
+        if self.adaptive_depth is not None and with_payload is not False:
+            retrieved_points = self._retrieve_adaptive(
+                query, query_emb, dense_field, sparse_field, limits, query_filter, with_payload, fusion, dense_weight
+            )
+        else:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=self._round_requests(
+                    query_emb, dense_field, sparse_field, limits, query_filter, with_payload, fusion, dense_weight
                 ),
-            ],
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=top_k,
-            query_filter=self._build_filter(**filters),
-        )
+            )
+            retrieved_points, _ = self._round_points(responses, top_k, fusion, dense_weight)
 
-        return {"retrieved_points": retrieved_points.points, "used_filter": filters}
+        return {
+            "retrieved_points": retrieved_points,
+            "used_filter": filters,
+            "timings": query_emb["timings"],
+            "degraded": query_emb["dense"] is None,
+            "payload_bytes": {"retrieve": _payload_bytes(retrieved_points)},
+        }
 
     @traceable(run_type="chain", metadata={"reranker": "jinai-reranker-v2-base-multilingual"})
-    def rerank(self, query: str, retrieved_points, top_k: int = 10) -> List[Dict[str, Any]]:
+    def rerank(self, query: str, retrieved_points, top_k: int = 10, payload_bytes: Dict[str, int] | None = None) -> List[Dict[str, Any]]:
         """Rerank retrieved documents using CrossEncoder."""
-        docs = [self._format_book(p.payload) for p in retrieved_points]
+        docs = self._rerank_texts(retrieved_points, payload_bytes)
+        if self.adaptive_depth is not None:
+            return self._cascaded_rerank(query, retrieved_points, docs, top_k)
+        if self.rerank_scheduler is not None:
+            scores = self.rerank_scheduler.score(query, docs)
+            return self._rank_by_scores(retrieved_points, docs, scores, top_k)
         ranked = self.reranker.rank(query=query, documents=docs, return_documents=True, top_k=top_k)
-        return [{"book_id": retrieved_points[r['corpus_id']].id, 'score': r['score'], 'text': r['text']} for r in ranked]
+        return [{"book_id": retrieved_points[r['corpus_id']].id, 'score': float(r['score']), 'text': r['text']} for r in ranked]
+
+    def _cascaded_rerank(self, query: str, retrieved_points, docs: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """Score candidates in fused order, a chunk at a time, until the top-k stops changing."""
+        scores: List[float] = []
+        ranked: List[Dict[str, Any]] = []
+        unchanged = 0
+        chunk_size = self.adaptive_depth.first_chunk(top_k)
+        while len(scores) < len(docs):
+            scores.extend(self._score(query, docs[len(scores):len(scores) + chunk_size]))
+            chunk_size = self.adaptive_depth.rerank_chunk_size
+            previous, ranked = ranked, self._rank_by_scores(retrieved_points, docs, scores, top_k)
+            unchanged = unchanged + 1 if [r["book_id"] for r in ranked] == [r["book_id"] for r in previous] else 0
+            if self.adaptive_depth.settled(unchanged):
+                break
+        logging.info(f"Cascaded rerank scored {len(scores)}/{len(docs)} candidates.")
+        return ranked
+
+    def search(self, query: str, top_n: int = 10, rerank: bool = True, **kwargs) -> List[Dict[str, Any]]:
+        """Complete pipeline: hybrid retrieval + reranking with no filter and query rewritting
+
+        With ``rerank=False`` the fused ranking is returned as is, and Qdrant is
+        asked for ids only. ``search_with_filter`` passes it through, for the
+        ``skip_rerank`` field of the Retrieve RPC.
+        """
+        if rerank:
+            retrieved = self.retrieve(query, **kwargs)
+            payload_bytes = retrieved['payload_bytes']
+            results = self.rerank(query, retrieved['retrieved_points'], top_k=top_n, payload_bytes=payload_bytes)
+        else:
+            kwargs['top_k'] = top_n
+            retrieved = self.retrieve(query, with_payload=False, **kwargs)
+            payload_bytes = retrieved['payload_bytes']
+            results = [{"book_id": p.id, "score": p.score} for p in retrieved['retrieved_points']]
+        logging.info(f"Qdrant payload bytes per stage: {payload_bytes}")
+        return {"results": results, "used_query": query, "used_filter": retrieved['used_filter'], "degraded": retrieved['degraded']}
+
+    @traceable(run_type="retriever")
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        dense_field: str = DENSE_FIELD,
+        sparse_field: str = SPARSE_FIELD,
+        dense_top_k: int = 100,
+        sparse_top_k: int = 100,
+        top_k: int = 50,
+        with_payload: bool | List[str] = RERANK_STAGE_PAYLOAD,
+        fusion: str = RRF,
+        dense_weight: float = 0.5,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """Hybrid retrieval for many queries in one ``query_batch_points`` call."""
+        query_embs = self.embed_hybrid_batch(queries)
+        depth = {"dense_top_k": dense_top_k, "sparse_top_k": sparse_top_k, "top_k": top_k}
+        query_filter = self._build_filter(**filters)
+        requests = [
+            self._round_requests(emb, dense_field, sparse_field, depth, query_filter, with_payload, fusion, dense_weight)
+            for emb in query_embs
+        ]
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[request for group in requests for request in group],
+        )
+        return [
+            {"retrieved_points": self._round_points(group, top_k, fusion, dense_weight)[0], "degraded": emb["dense"] is None}
+            for emb, group in zip(query_embs, self._split(responses, [len(group) for group in requests]))
+        ]
+
+    @staticmethod
+    def _split(items: List[Any], sizes: List[int]) -> List[List[Any]]:
+        parts, offset = [], 0
+        for size in sizes:
+            parts.append(items[offset:offset + size])
+            offset += size
+        return parts
+
+    def rerank_batch(self, queries: List[str], points_per_query: List[List[Any]], top_k: int = 10) -> List[List[Dict[str, Any]]]:
+        """Rerank the candidates of many queries with one text fetch and one scoring pass."""
+        sizes = [len(points) for points in points_per_query]
+        all_points = [p for points in points_per_query for p in points]
+        docs_per_query = self._split(self._rerank_texts(all_points), sizes)
+        if self.rerank_scheduler is not None:
+            # Submitted together, so the scheduler scores them in the same batch
+            futures = [self.rerank_scheduler.submit(q, docs) for q, docs in zip(queries, docs_per_query)]
+            scores_per_query = [f.result() for f in futures]
+        else:
+            pairs = [(q, doc) for q, docs in zip(queries, docs_per_query) for doc in docs]
+            scores = self.reranker.predict(pairs, show_progress_bar=False) if pairs else []
+            scores_per_query = self._split(list(scores), sizes)
+        return [
+            self._rank_by_scores(points, docs, scores, top_k)
+            for points, docs, scores in zip(points_per_query, docs_per_query, scores_per_query)
+        ]
+
+    def search_batch(self, queries: List[str], top_n: int = 10, **kwargs) -> List[Dict[str, Any]]:
+        """Batched ``search``: hybrid retrieval + reranking for many queries, without query rewriting."""
+        start_time = time.time()
+        retrieved = self.retrieve_batch(queries, **kwargs)
+        reranked = self.rerank_batch(queries, [r["retrieved_points"] for r in retrieved], top_k=top_n)
+        logging.info(f"Batch search of {len(queries)} queries took {time.time() - start_time:.2f} seconds.")
+        return [
+            {"results": results, "used_query": query, "degraded": r["degraded"]}
+            for query, r, results in zip(queries, retrieved, reranked)
+        ]
+
+    def _cached_structured_query(self, query: str) -> Dict[str, Any] | None:
+        structured_query = self.search_cache.get_structured(query)
+        if structured_query is not None:
+            logging.info('Cache hit (structured query).')
+            return structured_query
+        if self.semantic_cache is not None:
+            vector = self._embed_dense_or_none(query)
+            hit = self.semantic_cache.get(query, vector) if vector is not None else None
+            if hit is not None:
+                logging.info('Semantic cache hit (structured query).')
+                structured_query, verify = hit
+                if verify:
+                    self._extract_executor.submit(self._verify_semantic_hit, query, structured_query)
+                return structured_query
+        logging.info('Cache miss (structured query).')
+        return None
+
+    def _remember_structured_query(self, query: str, structured_query: Dict[str, Any]):
+        self.search_cache.set_structured(query, structured_query)
+        if self.semantic_cache is not None:
+            vector = self._embed_dense_or_none(query)
+            if vector is not None:
+                self.semantic_cache.put(query, vector, structured_query)
+
+    def _extract_structured_query(self, query: str) -> Dict[str, Any]:
+        """Extract filters and a rewritten query with the LLM, cached in Redis for an hour."""
+        structured_query = self.query_processor.extract(query)
+        self._remember_structured_query(query, structured_query)
+        return structured_query
+
+    @staticmethod
+    def _filters_of(structured_query: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in structured_query.items() if k != "rewrite_query"}
+
+    def _verify_semantic_hit(self, query: str, cached: Dict[str, Any]):
+        """Compare a semantic cache hit with a fresh extraction; the rewrite is allowed to differ."""
+        try:
+            structured_query = self.query_processor.extract(query)
+        except Exception as e:
+            logging.warning(f"Semantic cache verification failed: {e}")
+            return
+        correct = self._filters_of(structured_query) == self._filters_of(cached)
+        self.semantic_cache.record_verification(correct)
+        if not correct:
+            logging.warning(f"Semantic cache false hit for '{query}': {cached} != {structured_query}")
+            self._remember_structured_query(query, structured_query)
+
+    def _route(self, query: str) -> str:
+        if self.query_classifier is None:
+            return EXTRACT
+        return self.query_classifier.classify(query)
+
+    @classmethod
+    def _has_filters(cls, structured_query: Dict[str, Any]) -> bool:
+        return bool(cls._filters_of(structured_query))
+
+    def _search_structured(self, query: str, structured_query: Dict[str, Any], top_n: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs.update(structured_query)
+        return self.search(structured_query.get("rewrite_query", query), top_n=top_n, **kwargs)
 
-    def search(self, query: str, top_n: int = 10, **kwargs) -> List[Dict[str, Any]]:
-        """Complete pipeline: hybrid retrieval + reranking with no filter and query rewritting"""
-        retrieved = self.retrieve(query, **kwargs)
-        reranked = self.rerank(query, retrieved['retrieved_points'], top_k=top_n)
-        return {"results": reranked, "used_query": query, "used_filter": retrieved['used_filter']}
+    def _score(self, query: str, docs: List[str]) -> List[float]:
+        if not docs:
+            return []
+        if self.rerank_scheduler is not None:
+            return list(self.rerank_scheduler.score(query, docs))
+        return list(self.reranker.predict([(query, doc) for doc in docs], show_progress_bar=False))
 
     def search_with_filter(self, query: str, top_n: int = 10, **kwargs) -> List[Dict[str, Any]]:
         """Complete pipeline: hybrid retrieval + reranking with filter and query rewriting."""
         logging.info('Start search with filter.')
         start_time = time.time()
         # Cache for final search results
-        cache_key = f"{query}_{top_n}_{json.dumps(kwargs, sort_keys=True)}"
-        cached_result = self.redis_client.get(cache_key)
-        if cached_result:
+        params = dict(kwargs)
+        cached_result = self._cached_result(query, top_n, kwargs, params)
+        if cached_result is not None:
+            return cached_result
+
+        # Concurrent misses for the same search wait for a single pipeline run
+        result = self.single_flight.do(
+            self.search_cache.result_key(query, top_n, params),
+            lambda: self._search_with_filter_uncached(query, top_n, kwargs, params),
+            lookup=lambda: self._published_result(query, top_n, params),
+        )
+        logging.info(f"Search cache stats: {self.search_cache.stats()}")
+        logging.info(f"Single-flight stats: {self.single_flight.stats()}")
+        logging.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
+        if self.semantic_cache is not None:
+            logging.info(f"Semantic query cache stats: {self.semantic_cache.stats()}")
+        logging.info('End search with filter.')
+        end_time = time.time()
+        logging.info(f"Search with filter took {end_time - start_time:.2f} seconds.")
+        return result
+
+    def _cached_result(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any] | None:
+        """Return a cached result, starting a background refresh when it is stale."""
+        cached = self.search_cache.get_result(query, top_n, params)
+        if cached is None:
+            return None
+        result, stale = cached
+        if stale and self.search_cache.claim_refresh(query, top_n, params):
+            logging.info('Cache hit (stale search result), refreshing in the background.')
+            self._refresh_executor.submit(self._refresh_result, query, top_n, dict(kwargs), params)
+        else:
             logging.info('Cache hit (search result).')
-            cached_data = json.loads(cached_result)
-            return self._convert_numpy_types(cached_data)
+        return result
 
-        # --- Cache for structured query ---
-        structured_cache_key = f"structured_query::{query}"
-        structured_cached = self.redis_client.get(structured_cache_key)
+    def _published_result(self, query: str, top_n: int, params: Dict[str, Any]) -> Dict[str, Any] | None:
+        cached = self.search_cache.get_result(query, top_n, params, record=False)
+        return cached[0] if cached is not None and not cached[1] else None
 
-        if structured_cached:
-            logging.info('Cache hit (structured query).')
-            structured_query = json.loads(structured_cached)
+    def _refresh_result(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]):
+        try:
+            self.single_flight.do(
+                self.search_cache.result_key(query, top_n, params),
+                lambda: self._search_with_filter_uncached(query, top_n, kwargs, params),
+            )
+        except Exception:
+            logging.exception(f"Background refresh of '{query}' failed.")
+
+    def warm_up(self, max_queries: int = 50) -> int:
+        """Precompute the most searched queries of the popularity window that are not fresh in the cache.
+
+        Args:
+            max_queries (int, optional): Number of top queries to consider. Defaults to 50.
+
+        Returns:
+            int: Number of searches computed.
+        """
+        start_time = time.time()
+        warmed = 0
+        for entry in self.search_cache.top_queries(max_queries):
+            query, top_n, params = entry["query"], entry["top_n"], entry["params"]
+            if self._published_result(query, top_n, params) is not None:
+                continue
+            try:
+                self.single_flight.do(
+                    self.search_cache.result_key(query, top_n, params),
+                    lambda: self._search_with_filter_uncached(query, top_n, dict(params), params),
+                )
+                warmed += 1
+            except Exception:
+                logging.exception(f"Warm-up of '{query}' failed.")
+        logging.info(f"Warmed up {warmed} searches in {time.time() - start_time:.2f} seconds.")
+        return warmed
+
+    def _search_with_filter_uncached(self, query: str, top_n: int, kwargs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        structured_query = self._cached_structured_query(query)
+        if structured_query is not None:
+            result = self._search_structured(query, structured_query, top_n, kwargs)
         else:
-            logging.info('Cache miss (structured query).')
-            structured_query = self.query_processor.extract(query)
-            self.redis_client.setex(structured_cache_key, 60 * 60, json.dumps(structured_query))
+            route = self._route(query)
+            if route == SKIP:
+                result = self.search(query, top_n=top_n, **kwargs)
+            elif route == SPECULATE and self.speculative_search:
+                # The LLM round trip overlaps with a search on the raw query, which
+                # is only redone if the extraction produced filters
+                extraction = self._extract_executor.submit(self._extract_structured_query, query)
+                result = self.search(query, top_n=top_n, **kwargs)
+                structured_query = extraction.result()
+                if self._has_filters(structured_query):
+                    logging.info('Speculative search discarded, filters were extracted.')
+                    result = self._search_structured(query, structured_query, top_n, kwargs)
+            else:
+                result = self._search_structured(query, self._extract_structured_query(query), top_n, kwargs)
+
+        # Cache final search results, unless they came from the sparse-only fallback
+        if not result["degraded"]:
+            self.search_cache.set_result(query, top_n, params, result)
+        return result
 
-        # Merge filters into kwargs
+    def search_with_filter_stream(self, query: str, top_n: int = 10, rerank_chunk_size: int = 16, **kwargs):
+        """Streaming ``search_with_filter`` that yields results as each stage completes.
+
+        Yields dicts with a ``stage`` and the current top ``results``:
+
+        - ``"fused"``: the RRF ranking straight from Qdrant, before any reranking.
+        - ``"reranking"``: the best of the candidates scored so far, after each
+          chunk of ``rerank_chunk_size`` candidates; ``scored`` and ``total`` give
+          the progress.
+        - ``"reranked"``: the final results, identical to ``search_with_filter``.
+
+        A cached search yields only the final message.
+
+        Args:
+            query (str): The user query.
+            top_n (int, optional): Number of results per message. Defaults to 10.
+            rerank_chunk_size (int, optional): Candidates scored between two partial messages. Defaults to 16.
+        """
+        start_time = time.time()
+        params = dict(kwargs)
+        cached_result = self._cached_result(query, top_n, kwargs, params)
+        if cached_result is not None:
+            yield {"stage": "reranked", **cached_result}
+            return
+
+        structured_query = self._cached_structured_query(query)
+        if structured_query is None:
+            structured_query = {} if self._route(query) == SKIP else self._extract_structured_query(query)
         kwargs.update(structured_query)
+        used_query = structured_query.get("rewrite_query", query)
 
-        # Perform retrieval and reranking
-        result = self.search(structured_query.get("rewrite_query", query), top_n=top_n, **kwargs)
-        result = self._convert_numpy_types(result)
+        retrieved = self.retrieve(used_query, **kwargs)
+        points = retrieved["retrieved_points"]
+        yield {
+            "stage": "fused",
+            "results": [{"book_id": p.id, "score": p.score} for p in points[:top_n]],
+            "used_query": used_query,
+            "used_filter": retrieved["used_filter"],
+            "degraded": retrieved["degraded"],
+        }
+        logging.info(f"Fused results streamed after {time.time() - start_time:.2f} seconds.")
 
-        # Cache final search results
-        self.redis_client.setex(cache_key, 60 * 60, json.dumps(result))
+        docs = self._rerank_texts(points, retrieved["payload_bytes"])
+        scores: List[float] = []
+        for chunk_start in range(0, len(docs), rerank_chunk_size):
+            scores.extend(self._score(used_query, docs[chunk_start:chunk_start + rerank_chunk_size]))
+            if len(scores) < len(docs):
+                yield {
+                    "stage": "reranking",
+                    "results": self._rank_by_scores(points, docs, scores, top_n),
+                    "scored": len(scores),
+                    "total": len(docs),
+                }
 
-        logging.info('End search with filter.')
-        end_time = time.time()
-        logging.info(f"Search with filter took {end_time - start_time:.2f} seconds.")
-        return result
+        result = {
+            "results": self._rank_by_scores(points, docs, scores, top_n),
+            "used_query": used_query,
+            "used_filter": retrieved["used_filter"],
+            "degraded": retrieved["degraded"],
+        }
+        if not result["degraded"]:
+            self.search_cache.set_result(query, top_n, params, result)
+        logging.info(f"Qdrant payload bytes per stage: {retrieved['payload_bytes']}")
+        logging.info(f"Streaming search with filter took {time.time() - start_time:.2f} seconds.")
+        yield {"stage": "reranked", **result}
 
     # def summarize_description(self, description: str):
     #     outputs = self.summarizer(
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+from typing import List, Tuple, Dict, Any
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L6-v2"
+DEFAULT_ONNX_DIR = os.path.join("models", "onnx", "ms-marco-MiniLM-L6-v2")
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+METADATA_FILE = "reranker_onnx.json"
+
+
+class OnnxCrossEncoder:
+    """CrossEncoder-compatible reranker running an int8 ONNX export on ONNX Runtime.
+
+    Exposes the ``predict`` and ``rank`` methods used by ``HybridRetriever`` and
+    ``RerankScheduler`` so it can replace ``sentence_transformers.CrossEncoder``.
+    Build the artifact with ``export_onnx_reranker`` (done by models/download_models.py).
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_ONNX_DIR, max_length: int = 512, threads: int | None = None):
+        """Load the quantized model and its tokenizer.
+
+        Args:
+            model_dir (str, optional): Directory written by ``export_onnx_reranker``. Defaults to models/onnx/ms-marco-MiniLM-L6-v2.
+            max_length (int, optional): Truncation length of (query, document) pairs. Defaults to 512.
+            threads (int, optional): ONNX Runtime intra-op threads. Defaults to ONNX Runtime's choice.
+        """
+        with open(os.path.join(model_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        self.model_name = metadata["model_name"]
+        self.apply_sigmoid = metadata["activation"] == "sigmoid"
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def predict(self, sentences: List[Tuple[str, str]], batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Score (query, document) pairs, matching ``CrossEncoder.predict``."""
+        scores = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            encoded = self.tokenizer(
+                [q for q, _ in batch],
+                [d for _, d in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(None, feed)[0][:, 0]
+            scores.append(logits)
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+        if self.apply_sigmoid:
+            scores = 1 / (1 + np.exp(-scores))
+        return scores
+
+    def rank(self, query: str, documents: List[str], top_k: int | None = None, return_documents: bool = False, batch_size: int = 32, **kwargs) -> List[Dict[str, Any]]:
+        """Rank documents for a query, matching ``CrossEncoder.rank``."""
+        scores = self.predict([(query, doc) for doc in documents], batch_size=batch_size)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        results = []
+        for i in order:
+            result = {"corpus_id": int(i), "score": float(scores[i])}
+            if return_documents:
+                result["text"] = documents[i]
+            results.append(result)
+        return results
+
+
+def export_onnx_reranker(model_name: str = DEFAULT_RERANKER_MODEL, output_dir: str = DEFAULT_ONNX_DIR) -> str:
+    """Export a CrossEncoder to ONNX and apply int8 dynamic quantization.
+
+    Returns the output directory. Export is skipped if the artifact already exists.
+    """
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from sentence_transformers import CrossEncoder
+
+    quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    if os.path.exists(quantized_path):
+        logging.info(f"ONNX reranker already exported at {quantized_path}")
+        return output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    cross_encoder = CrossEncoder(model_name, trust_remote_code=True)
+    model = cross_encoder.model.eval()
+    tokenizer = cross_encoder.tokenizer
+    # sentence-transformers 2.x/3.x and 4.x name the activation differently
+    activation = getattr(cross_encoder, "activation_fn", None) or getattr(cross_encoder, "default_activation_function", None)
+    activation_name = "sigmoid" if "Sigmoid" in type(activation).__name__ else "identity"
+
+    sample = tokenizer(["query"], ["document"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, "logits": {0: "batch"}},
+            opset_version=17,
+            # The TorchScript exporter keeps dynamic_axes and writes a single file
+            dynamo=False,
+        )
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, METADATA_FILE), "w") as f:
+        json.dump({"model_name": model_name, "activation": activation_name}, f)
+    logging.info(f"Exported int8 ONNX reranker to {quantized_path}")
+    return output_dir
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    rank_a = np.argsort(np.argsort(a)).astype(np.float64)
+    rank_b = np.argsort(np.argsort(b)).astype(np.float64)
+    if rank_a.std() == 0 or rank_b.std() == 0:
+        return 1.0
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def check_parity(onnx_model: OnnxCrossEncoder, torch_model, queries: List[str], documents: List[str]) -> Dict[str, float]:
+    """Compare ONNX and PyTorch reranker scores over every query x documents.
+
+    Returns the mean and minimum Spearman rank correlation per query, and the
+    fraction of queries whose top-1 document agrees.
+    """
+    correlations, top1 = [], []
+    for query in queries:
+        pairs = [(query, doc) for doc in documents]
+        onnx_scores = np.asarray(onnx_model.predict(pairs))
+        torch_scores = np.asarray(torch_model.predict(pairs, show_progress_bar=False))
+        correlations.append(_spearman(onnx_scores, torch_scores))
+        top1.append(int(np.argmax(onnx_scores) == np.argmax(torch_scores)))
+    return {
+        "spearman_mean": float(np.mean(correlations)),
+        "spearman_min": float(np.min(correlations)),
+        "top1_agreement": float(np.mean(top1)),
+    }
@@ -0,0 +1,50 @@
+from typing import Any, Dict
+from qdrant_client import models
+from constants.constants import DENSE_DIM
+
+NONE = "none"
+SCALAR = "scalar"
+BINARY = "binary"
+QUANTIZATIONS = (NONE, SCALAR, BINARY)
+
+
+def quantization_config(kind: str, always_ram: bool = True) -> models.QuantizationConfig | None:
+    """Qdrant quantization of the dense vectors: int8 scalar, 1-bit binary, or None.
+
+    Args:
+        kind (str): "none", "scalar" or "binary".
+        always_ram (bool, optional): Keep the quantized vectors in RAM even when the originals are on disk. Defaults to True.
+    """
+    if kind == NONE:
+        return None
+    if kind == SCALAR:
+        # The 0.99 quantile clips outlier components so the int8 range is not wasted on them
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=always_ram),
+        )
+    if kind == BINARY:
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    raise ValueError(f"Unknown quantization '{kind}', expected one of {QUANTIZATIONS}.")
+
+
+def dense_search_params(oversampling: float = 2.0, rescore: bool = True) -> models.SearchParams:
+    """Search params of a quantized dense prefetch.
+
+    The quantized vectors select ``oversampling`` times the requested
+    candidates, which are then rescored with the original vectors (read from
+    disk when they are stored there) before the limit is applied.
+    """
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling),
+    )
+
+
+def vector_ram_bytes(points: int, kind: str, on_disk: bool, dim: int = DENSE_DIM) -> Dict[str, Any]:
+    """Estimated RAM held by the dense vectors, without the HNSW graph.
+
+    Originals are float16 (2 bytes per component) and only count when kept in
+    RAM; scalar quantization adds 1 byte per component and binary 1 bit.
+    """
+    original = 0 if on_disk else points * dim * 2
+    quantized = {NONE: 0, SCALAR: points * dim, BINARY: points * dim // 8}[kind]
+    return {"original": original, "quantized": quantized, "total": original + quantized}
@@ -0,0 +1,124 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+
+class _RerankJob:
+    __slots__ = ("pairs", "future")
+
+    def __init__(self, pairs: List[Tuple[str, str]]):
+        self.pairs = pairs
+        self.future: Future = Future()
+
+
+class RerankScheduler:
+    """Micro-batching scheduler for a cross-encoder shared by concurrent requests.
+
+    Callers submit their (query, document) pairs and block on a future. A single
+    worker thread drains the queue, waiting at most ``max_wait_ms`` after the
+    first job for more work (or until ``max_batch_pairs`` is reached), scores
+    all pairs with one ``predict`` call and hands every caller its own slice.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_pairs: int = 512,
+        max_wait_ms: float = 5.0,
+        predict_batch_size: int = 32,
+    ):
+        """Initialize the scheduler and start its worker thread.
+
+        Args:
+            model: Model exposing ``predict(pairs, batch_size=..., show_progress_bar=...)``, e.g. a CrossEncoder.
+            max_batch_pairs (int, optional): Stop collecting once this many pairs are queued. Defaults to 512.
+            max_wait_ms (float, optional): Longest a job waits for others to join its batch. Defaults to 5.0.
+            predict_batch_size (int, optional): Forward-pass batch size inside ``predict``. Defaults to 32.
+        """
+        self.model = model
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000
+        self.predict_batch_size = predict_batch_size
+        self._queue: queue.Queue[_RerankJob | None] = queue.Queue()
+        # Guards _closed so no job is queued behind the shutdown sentinel
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="rerank-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, documents: List[str]) -> Future:
+        """Queue documents for scoring against a query.
+
+        Raises:
+            RuntimeError: If the scheduler has been closed.
+        """
+        job = _RerankJob([(query, doc) for doc in documents])
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Rerank scheduler is closed.")
+            if not job.pairs:
+                job.future.set_result([])
+                return job.future
+            self._queue.put(job)
+        return job.future
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """Score documents against a query, sharing a forward pass with concurrent callers."""
+        return self.submit(query, documents).result()
+
+    def _collect(self, first: _RerankJob) -> List[_RerankJob]:
+        jobs = [first]
+        n_pairs = len(first.pairs)
+        deadline = time.monotonic() + self.max_wait
+        while n_pairs < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                # Re-queue the shutdown sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            jobs.append(job)
+            n_pairs += len(job.pairs)
+        return jobs
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            jobs = self._collect(first)
+            pairs = [pair for job in jobs for pair in job.pairs]
+            try:
+                scores = self.model.predict(
+                    pairs,
+                    batch_size=self.predict_batch_size,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                logging.error(f"Rerank batch of {len(pairs)} pairs failed: {e}")
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+
+            logging.debug(f"Reranked {len(pairs)} pairs from {len(jobs)} requests in one batch.")
+            offset = 0
+            for job in jobs:
+                n = len(job.pairs)
+                job.future.set_result([float(s) for s in scores[offset:offset + n]])
+                offset += n
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
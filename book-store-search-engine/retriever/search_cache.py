@@ -0,0 +1,422 @@
+import hashlib
+import json
+import logging
+import re
+import struct
+import threading
+import time
+import unicodedata
+import uuid
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+# Bump when the layout of cached values changes, so old entries are ignored
+CACHE_SCHEMA_VERSION = 3
+
+# Punctuation that changes the meaning of a query ("$10", "4+", "4.5", "sci-fi") is kept
+NOISE_CHARS = re.compile(r"[^\w\s$+.\-]")
+
+# Result entries are packed as a header (fresh-until timestamp, id encoding,
+# result count), the book ids, then the scores as little-endian float32
+RESULT_HEADER = struct.Struct("<dBH")
+ID_INT, ID_UUID, ID_STR = 0, 1, 2
+STR_LENGTH = struct.Struct("<H")
+
+
+def _is_canonical_uuid(value: Any) -> bool:
+    try:
+        return str(uuid.UUID(value)) == value
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+def binary_client(client: Redis | AsyncRedis) -> Redis | AsyncRedis:
+    """``client`` if it returns raw bytes, else a client of the same kind and server that does."""
+    pool = client.connection_pool
+    if not pool.connection_kwargs.get("decode_responses", False):
+        return client
+    return type(client)(connection_pool=type(pool)(
+        connection_class=pool.connection_class,
+        max_connections=pool.max_connections,
+        **{**pool.connection_kwargs, "decode_responses": False},
+    ))
+
+
+def encode_results(results: List[Dict[str, Any]], fresh_until: float) -> bytes:
+    """Pack the book ids and scores of search results, dropping everything else.
+
+    Qdrant point ids are unsigned integers or UUIDs, stored as 8 and 16 bytes;
+    any other id falls back to length-prefixed UTF-8.
+    """
+    ids = [r["book_id"] for r in results]
+    if all(isinstance(i, (int, np.integer)) for i in ids):
+        kind, packed_ids = ID_INT, np.asarray(ids, dtype="<i8").tobytes()
+    elif all(_is_canonical_uuid(i) for i in ids):
+        kind, packed_ids = ID_UUID, b"".join(uuid.UUID(i).bytes for i in ids)
+    else:
+        kind = ID_STR
+        encoded = [str(i).encode("utf-8") for i in ids]
+        packed_ids = b"".join(STR_LENGTH.pack(len(e)) + e for e in encoded)
+    scores = np.asarray([r.get("score", 0.0) for r in results], dtype="<f4").tobytes()
+    return RESULT_HEADER.pack(fresh_until, kind, len(ids)) + packed_ids + scores
+
+
+def decode_results(data: bytes) -> Tuple[List[Dict[str, Any]], float]:
+    """Unpack ``encode_results`` output into ``([{"book_id", "score"}], fresh_until)``."""
+    fresh_until, kind, count = RESULT_HEADER.unpack_from(data)
+    offset = RESULT_HEADER.size
+    if kind == ID_INT:
+        ids = np.frombuffer(data, dtype="<i8", count=count, offset=offset).tolist()
+        offset += 8 * count
+    elif kind == ID_UUID:
+        ids = [str(uuid.UUID(bytes=data[offset + 16 * i:offset + 16 * (i + 1)])) for i in range(count)]
+        offset += 16 * count
+    else:
+        ids = []
+        for _ in range(count):
+            (length,) = STR_LENGTH.unpack_from(data, offset)
+            offset += STR_LENGTH.size
+            ids.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+    scores = np.frombuffer(data, dtype="<f4", count=count, offset=offset).tolist()
+    return [{"book_id": i, "score": s} for i, s in zip(ids, scores)], fresh_until
+
+
+class SearchCache:
+    """Redis cache of structured queries and final search results.
+
+    Keys are built from a normalized query (Unicode NFKC, case folded, noise
+    punctuation and extra whitespace removed) and hashed, under a namespace
+    that includes a version derived from the model and collection identity:
+
+        search:{version}:structured:{query hash}
+        search:{version}:result:{query hash}:{params hash}
+        search:{version}:popular:{hour}
+        search:{version}:popular:query:{search hash}
+
+    Changing a model or the collection switches to a fresh namespace instead of
+    serving results computed by another pipeline, while a restart or a rolling
+    deploy of the same configuration keeps reading the warm entries. Entries of
+    old versions simply expire. ``invalidate`` removes entries selectively with
+    SCAN, never touching keys outside the namespace.
+
+    Search results are served stale-while-revalidate. Every lookup counts the
+    search in an hourly popularity ZSET. A result stays fresh for ``min_ttl``
+    times its lookups in the current hour, clamped to ``max_ttl``. It is kept
+    for ``stale_ratio`` times longer as a stale entry, which is served
+    immediately while the caller refreshes it in the background. One-off
+    searches therefore expire quickly, and popular ones stay warm. The same
+    ZSETs give the most searched queries for warming up the cache at startup.
+    They count by normalized query, so the first original spelling of each
+    search is kept next to them and warm-up runs the query users typed.
+
+    Results are stored packed by ``encode_results``: only the book ids and
+    float32 scores the RPC returns, a few dozen bytes per result, with no
+    document text or filters. A cached search therefore returns just
+    ``results`` and ``degraded`` (always False, degraded results are never
+    cached). Structured queries are small and stay JSON.
+
+    ``redis_client`` and ``async_redis_client`` must be created with
+    ``decode_responses=False``; the ``a*`` methods use the async one.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis | None,
+        identity: Dict[str, Any],
+        async_redis_client: AsyncRedis | None = None,
+        ttl: int = 60 * 60,
+        min_ttl: int = 10 * 60,
+        max_ttl: int = 6 * 60 * 60,
+        stale_ratio: float = 1.0,
+        popularity_window_hours: int = 24,
+        key_prefix: str = "search",
+    ):
+        """Initialize the cache.
+
+        Args:
+            redis_client (Redis): Redis client used by the sync methods.
+            identity (dict): Model names, collection name and anything else that determines search results.
+            async_redis_client (AsyncRedis, optional): Redis client used by the async methods. Defaults to None.
+            ttl (int, optional): Expiry of cached structured queries in seconds. Defaults to one hour.
+            min_ttl (int, optional): Fresh lifetime in seconds of a result looked up once in the current hour. Defaults to 10 minutes.
+            max_ttl (int, optional): Longest fresh lifetime of a result in seconds. Defaults to 6 hours.
+            stale_ratio (float, optional): How long a result is kept after going stale, relative to its fresh lifetime. Defaults to 1.0.
+            popularity_window_hours (int, optional): Hours of lookups considered when picking queries to warm up. Defaults to 24.
+            key_prefix (str, optional): Prefix of all keys written by this cache. Defaults to "search".
+        """
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.stale_ratio = stale_ratio
+        self.popularity_window_hours = popularity_window_hours
+        self.key_prefix = key_prefix
+        self.identity = dict(identity, schema=CACHE_SCHEMA_VERSION)
+        self.version = hashlib.sha1(json.dumps(self.identity, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+        self.namespace = f"{key_prefix}:{self.version}"
+        self._lock = threading.Lock()
+        self._counters = {
+            kind: {"hits": 0, "misses": 0}
+            for kind in ("structured", "result")
+        }
+        self._counters["result"]["stale_hits"] = 0
+        logging.info(f"Search cache namespace {self.namespace} for {self.identity}")
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = unicodedata.normalize("NFKC", query).casefold()
+        return " ".join(NOISE_CHARS.sub(" ", query).split()).strip(".")
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def structured_key(self, query: str) -> str:
+        return f"{self.namespace}:structured:{self._digest(self.normalize(query))}"
+
+    def result_key(self, query: str, top_n: int, params: Dict[str, Any]) -> str:
+        params_digest = self._digest(json.dumps({"top_n": top_n, **params}, sort_keys=True))[:16]
+        return f"{self.namespace}:result:{self._digest(self.normalize(query))}:{params_digest}"
+
+    def _popularity_key(self, hour: int | None = None) -> str:
+        hour = int(time.time() // 3600) if hour is None else hour
+        return f"{self.namespace}:popular:{hour}"
+
+    def _popularity_member(self, query: str, top_n: int, params: Dict[str, Any]) -> str:
+        return json.dumps({"query": self.normalize(query), "top_n": top_n, "params": params}, sort_keys=True)
+
+    def _original_query_key(self, member: str) -> str:
+        return f"{self.namespace}:popular:query:{self._digest(member)}"
+
+    def _record_lookup(self, pipe, query: str, top_n: int, params: Dict[str, Any]):
+        member = self._popularity_member(query, top_n, params)
+        popularity_key = self._popularity_key()
+        window = (self.popularity_window_hours + 1) * 3600
+        pipe.zincrby(popularity_key, 1, member)
+        pipe.expire(popularity_key, window)
+        # The first spelling within the window is the one warm-up will run
+        pipe.set(self._original_query_key(member), query, nx=True, ex=window)
+
+    def _fresh_ttl(self, lookups: float | None) -> int:
+        return int(min(self.max_ttl, self.min_ttl * max(1.0, lookups or 1.0)))
+
+    def _envelope(self, result: Dict[str, Any], lookups: float | None) -> Tuple[bytes, int]:
+        fresh_ttl = self._fresh_ttl(lookups)
+        data = encode_results(result["results"], time.time() + fresh_ttl)
+        return data, fresh_ttl + int(fresh_ttl * self.stale_ratio)
+
+    @staticmethod
+    def _decode_envelope(data: bytes) -> Tuple[Dict[str, Any], bool]:
+        results, fresh_until = decode_results(data)
+        return {"results": results, "degraded": False}, time.time() > fresh_until
+
+    def _open_envelope(self, data: bytes | None) -> Tuple[Dict[str, Any], bool] | None:
+        if data is None:
+            self._count("result", False)
+            return None
+        result, stale = self._decode_envelope(data)
+        self._count("result", True)
+        if stale:
+            with self._lock:
+                self._counters["result"]["stale_hits"] += 1
+        return result, stale
+
+    def _count(self, kind: str, hit: bool):
+        with self._lock:
+            self._counters[kind]["hits" if hit else "misses"] += 1
+
+    def _get(self, kind: str, key: str) -> Any | None:
+        data = None
+        try:
+            data = self.redis_client.get(key)
+        except RedisError as e:
+            logging.warning(f"Search cache read failed: {e}")
+        self._count(kind, data is not None)
+        return json.loads(data) if data is not None else None
+
+    def _set(self, key: str, value: Any):
+        try:
+            self.redis_client.setex(key, self.ttl, json.dumps(value))
+        except RedisError as e:
+            logging.warning(f"Search cache write failed: {e}")
+
+    async def _aget(self, kind: str, key: str) -> Any | None:
+        data = None
+        try:
+            data = await self.async_redis_client.get(key)
+        except RedisError as e:
+            logging.warning(f"Search cache read failed: {e}")
+        self._count(kind, data is not None)
+        return json.loads(data) if data is not None else None
+
+    async def _aset(self, key: str, value: Any):
+        try:
+            await self.async_redis_client.setex(key, self.ttl, json.dumps(value))
+        except RedisError as e:
+            logging.warning(f"Search cache write failed: {e}")
+
+    # --- Public API ---
+    def get_structured(self, query: str) -> Dict[str, Any] | None:
+        return self._get("structured", self.structured_key(query))
+
+    def set_structured(self, query: str, structured_query: Dict[str, Any]):
+        self._set(self.structured_key(query), structured_query)
+
+    def get_result(self, query: str, top_n: int, params: Dict[str, Any], record: bool = True) -> Tuple[Dict[str, Any], bool] | None:
+        """Look up a search result and count the lookup towards the query's popularity.
+
+        Args:
+            record (bool, optional): Count the lookup in the popularity ZSET and the hit counters. Defaults to True.
+
+        Returns:
+            tuple | None: ``(result, stale)``, or None on a miss.
+        """
+        key = self.result_key(query, top_n, params)
+        try:
+            if not record:
+                data = self.redis_client.get(key)
+                return self._decode_envelope(data) if data is not None else None
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(key)
+            self._record_lookup(pipe, query, top_n, params)
+            data, *_ = pipe.execute()
+        except RedisError as e:
+            logging.warning(f"Search cache read failed: {e}")
+            data = None
+        return self._open_envelope(data)
+
+    def set_result(self, query: str, top_n: int, params: Dict[str, Any], result: Dict[str, Any]):
+        """Store a search result with a lifetime based on the query's lookups in the current hour."""
+        try:
+            lookups = self.redis_client.zscore(self._popularity_key(), self._popularity_member(query, top_n, params))
+            data, expiry = self._envelope(result, lookups)
+            self.redis_client.setex(self.result_key(query, top_n, params), expiry, data)
+        except RedisError as e:
+            logging.warning(f"Search cache write failed: {e}")
+
+    def claim_refresh(self, query: str, top_n: int, params: Dict[str, Any], lease: int = 60) -> bool:
+        """Take the right to refresh a stale result, so one caller across all replicas does it."""
+        try:
+            return bool(self.redis_client.set(f"{self.result_key(query, top_n, params)}:refresh", 1, nx=True, ex=lease))
+        except RedisError as e:
+            logging.warning(f"Search cache refresh lease failed: {e}")
+            return False
+
+    def top_queries(self, n: int) -> List[Dict[str, Any]]:
+        """Most looked-up searches over the popularity window, most popular first.
+
+        Returns:
+            list: Dicts with the original ``query`` (the normalized one if it has expired), ``top_n``, ``params`` and ``lookups``.
+        """
+        hour = int(time.time() // 3600)
+        buckets = [self._popularity_key(h) for h in range(hour - self.popularity_window_hours + 1, hour + 1)]
+        union_key = f"{self.namespace}:popular:union"
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zunionstore(union_key, buckets)
+            pipe.zrevrange(union_key, 0, n - 1, withscores=True)
+            pipe.delete(union_key)
+            _, ranked, _ = pipe.execute()
+            if not ranked:
+                return []
+            originals = self.redis_client.mget([self._original_query_key(member.decode("utf-8")) for member, _ in ranked])
+        except RedisError as e:
+            logging.warning(f"Search cache popularity read failed: {e}")
+            return []
+        entries = []
+        for (member, score), original in zip(ranked, originals):
+            entry = dict(json.loads(member), lookups=int(score))
+            if original is not None:
+                entry["query"] = original.decode("utf-8")
+            entries.append(entry)
+        return entries
+
+    async def aget_structured(self, query: str) -> Dict[str, Any] | None:
+        return await self._aget("structured", self.structured_key(query))
+
+    async def aset_structured(self, query: str, structured_query: Dict[str, Any]):
+        await self._aset(self.structured_key(query), structured_query)
+
+    async def aget_result(self, query: str, top_n: int, params: Dict[str, Any], record: bool = True) -> Tuple[Dict[str, Any], bool] | None:
+        key = self.result_key(query, top_n, params)
+        try:
+            if not record:
+                data = await self.async_redis_client.get(key)
+                return self._decode_envelope(data) if data is not None else None
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            pipe.get(key)
+            self._record_lookup(pipe, query, top_n, params)
+            data, *_ = await pipe.execute()
+        except RedisError as e:
+            logging.warning(f"Search cache read failed: {e}")
+            data = None
+        return self._open_envelope(data)
+
+    async def aset_result(self, query: str, top_n: int, params: Dict[str, Any], result: Dict[str, Any]):
+        try:
+            lookups = await self.async_redis_client.zscore(self._popularity_key(), self._popularity_member(query, top_n, params))
+            data, expiry = self._envelope(result, lookups)
+            await self.async_redis_client.setex(self.result_key(query, top_n, params), expiry, data)
+        except RedisError as e:
+            logging.warning(f"Search cache write failed: {e}")
+
+    async def aclaim_refresh(self, query: str, top_n: int, params: Dict[str, Any], lease: int = 60) -> bool:
+        try:
+            return bool(await self.async_redis_client.set(f"{self.result_key(query, top_n, params)}:refresh", 1, nx=True, ex=lease))
+        except RedisError as e:
+            logging.warning(f"Search cache refresh lease failed: {e}")
+            return False
+
+    def invalidate(self, query: str | None = None, kinds: List[str] = ("structured", "result")) -> int:
+        """Delete cached entries of one query, or of every query, in the current namespace.
+
+        Args:
+            query (str, optional): Query whose entries are removed, for all search parameters. Defaults to None (all queries).
+            kinds (list, optional): Entry kinds to remove, "structured" and/or "result". Defaults to both.
+
+        Returns:
+            int: Number of keys deleted.
+        """
+        query_digest = self._digest(self.normalize(query)) if query is not None else None
+        deleted = 0
+        for kind in kinds:
+            if query_digest is None:
+                pattern = f"{self.namespace}:{kind}:*"
+            elif kind == "result":
+                pattern = f"{self.namespace}:result:{query_digest}:*"
+            else:
+                pattern = f"{self.namespace}:structured:{query_digest}"
+            deleted += self._delete_matching(pattern)
+        logging.info(f"Search cache invalidated {deleted} keys (query={query!r}, kinds={list(kinds)}).")
+        return deleted
+
+    def purge_other_versions(self) -> int:
+        """Delete entries written under other namespace versions instead of waiting for them to expire."""
+        return self._delete_matching(f"{self.key_prefix}:*", keep_prefix=f"{self.namespace}:")
+
+    def _delete_matching(self, pattern: str, keep_prefix: str | None = None) -> int:
+        deleted = 0
+        batch = []
+        for key in self.redis_client.scan_iter(match=pattern, count=1000):
+            if keep_prefix is not None and key.startswith(keep_prefix.encode("utf-8")):
+                continue
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += self.redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self.redis_client.unlink(*batch)
+        return deleted
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return hit/miss counters and hit rate per entry kind."""
+        with self._lock:
+            stats = {kind: dict(counters) for kind, counters in self._counters.items()}
+        for counters in stats.values():
+            total = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = counters["hits"] / total if total else 0.0
+        return stats
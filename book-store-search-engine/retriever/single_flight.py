@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+# Deletes the lock only if it still holds our token, so an expired lock taken
+# over by another replica is never released by the previous holder
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for its result instead of running it again.
+    Exceptions are shared the same way. In ``ado`` the work runs in its own
+    task, so a leader that is cancelled hands it over to the followers instead
+    of cancelling them too.
+
+    With a Redis client, leaders on different replicas also coordinate through
+    a ``SET NX PX`` lock per key. A replica that finds the lock taken polls
+    ``lookup`` (normally the result cache) until the holder publishes the
+    result, and runs the function itself if the lock is released or expires
+    without one, or after ``wait_timeout``.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis | None = None,
+        async_redis_client: AsyncRedis | None = None,
+        lock_timeout: float = 30.0,
+        wait_timeout: float = 30.0,
+        poll_interval: float = 0.05,
+        key_prefix: str = "singleflight",
+    ):
+        """Initialize the coalescer.
+
+        Args:
+            redis_client (Redis, optional): Redis client for cross-replica locks in ``do``. Defaults to None (in-process only).
+            async_redis_client (AsyncRedis, optional): Redis client for cross-replica locks in ``ado``. Defaults to None.
+            lock_timeout (float, optional): Seconds after which a lock expires if its holder died. Defaults to 30.
+            wait_timeout (float, optional): Longest a replica waits for another one's result. Defaults to 30.
+            poll_interval (float, optional): Seconds between result lookups while waiting. Defaults to 0.05.
+            key_prefix (str, optional): Prefix of the Redis lock keys. Defaults to "singleflight".
+        """
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.lock_timeout_ms = int(lock_timeout * 1000)
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._calls: Dict[str, Future] = {}
+        self._async_calls: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0, "remote_coalesced": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key: str, fn: Callable[[], Any], lookup: Callable[[], Any | None] | None = None) -> Any:
+        """Run ``fn`` once per key across concurrent callers and return its result.
+
+        Args:
+            key (str): Identity of the call, e.g. a cache key.
+            fn (Callable): Function computing the result.
+            lookup (Callable, optional): Returns the result published by another replica, or None. Needed for cross-replica coalescing. Defaults to None.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self._count("coalesced")
+            return future.result()
+        try:
+            result = self._lead(key, fn, lookup)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _lead(self, key: str, fn: Callable[[], Any], lookup: Callable[[], Any | None] | None) -> Any:
+        self._count("leaders")
+        if self.redis_client is None or lookup is None:
+            return fn()
+        lock_key = f"{self.key_prefix}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(lock_key, token, nx=True, px=self.lock_timeout_ms)
+        except RedisError as e:
+            logging.warning(f"Single-flight lock failed, running without it: {e}")
+            return fn()
+        if acquired:
+            try:
+                return fn()
+            finally:
+                try:
+                    self.redis_client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+                except RedisError as e:
+                    logging.warning(f"Single-flight unlock failed: {e}")
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                self._count("remote_coalesced")
+                return result
+            try:
+                if not self.redis_client.exists(lock_key):
+                    break
+            except RedisError as e:
+                logging.warning(f"Single-flight lock check failed, running without it: {e}")
+                break
+        return fn()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], lookup: Callable[[], Awaitable[Any | None]] | None = None) -> Any:
+        """Async variant of ``do``; ``fn`` and ``lookup`` return awaitables.
+
+        The call runs in a task of its own, which every caller awaits shielded:
+        cancelling any of them, the leader included, leaves the call running
+        for the others.
+        """
+        task = self._async_calls.get(key)
+        if task is None:
+            task = self._async_calls[key] = asyncio.ensure_future(self._alead(key, fn, lookup))
+            task.add_done_callback(lambda done: self._async_done(key, done))
+        else:
+            self._count("coalesced")
+        return await asyncio.shield(task)
+
+    def _async_done(self, key: str, task: asyncio.Task):
+        if self._async_calls.get(key) is task:
+            del self._async_calls[key]
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _alead(self, key: str, fn: Callable[[], Awaitable[Any]], lookup: Callable[[], Awaitable[Any | None]] | None) -> Any:
+        self._count("leaders")
+        if self.async_redis_client is None or lookup is None:
+            return await fn()
+        lock_key = f"{self.key_prefix}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.async_redis_client.set(lock_key, token, nx=True, px=self.lock_timeout_ms)
+        except RedisError as e:
+            logging.warning(f"Single-flight lock failed, running without it: {e}")
+            return await fn()
+        if acquired:
+            try:
+                return await fn()
+            finally:
+                try:
+                    await self.async_redis_client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+                except RedisError as e:
+                    logging.warning(f"Single-flight unlock failed: {e}")
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            result = await lookup()
+            if result is not None:
+                self._count("remote_coalesced")
+                return result
+            try:
+                if not await self.async_redis_client.exists(lock_key):
+                    break
+            except RedisError as e:
+                logging.warning(f"Single-flight lock check failed, running without it: {e}")
+                break
+        return await fn()
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many calls ran, and how many were served by another caller's run."""
+        with self._lock:
+            return dict(self._counters)
@@ -4,26 +4,107 @@ import pandas as pd
 import json
 import psycopg
 from qdrant_client import QdrantClient, models
-from constants.constants import BOOK_COLLECTION_NAME, SPARSE_FIELD, DENSE_FIELD
+from constants.constants import BOOK_COLLECTION_NAME, SPARSE_FIELD, DENSE_FIELD, DENSE_DIM, RERANK_TEXT_FIELD, RERANK_TEXT_VERSION_FIELD, SOURCE_UPDATED_AT_FIELD
+from retriever.book_text import format_book, rerank_text_version
+from retriever.quantization import quantization_config
 import dotenv
 import os
+import re
+import resource
+import sys
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Tuple
+from seeds.embedding_store import EmbeddingJoin, EmbeddingStore
+from seeds.sparse_csr import SparseCSR
 
 dotenv.load_dotenv()
 QDRANT_URL = os.getenv('QDRANT_URL')
+DENSE_EMBEDDINGS_PATH = "seeds/title_des_cat_dense_embeddings.npy"
+SPARSE_EMBEDDINGS_PATH = "seeds/description_embeddings.json"
+# Memory-mapped CSR copy of SPARSE_EMBEDDINGS_PATH (seeds/convert_sparse_embeddings.py), used when present
+SPARSE_CSR_DIR = "seeds/description_embeddings_csr"
+# Dense vector storage of a newly created collection
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")
+DENSE_ON_DISK = os.getenv("QDRANT_DENSE_ON_DISK", "false").lower() == "true"
+# Written by seeds/embed_books.py; preferred over the positional files above when present
+EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR", "seeds/embeddings")
 
-def add_data_to_qdrant():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-    logging.info("Starting Qdrant data upload script")
+# Authors and categories of book b, aggregated in SQL. Names are sorted by
+# code point (COLLATE "C"), like Python's sorted() in the legacy mode.
+AUTHORS_AGG = """COALESCE((
+            SELECT array_agg(DISTINCT a.name COLLATE "C" ORDER BY a.name COLLATE "C")
+            FROM book_authors ba
+            JOIN authors a ON a.id = ba.author_id
+            WHERE ba.book_id = b.id
+        ), '{}')"""
+CATEGORIES_AGG = """COALESCE((
+            SELECT array_agg(DISTINCT c.name COLLATE "C" ORDER BY c.name COLLATE "C")
+            FROM book_categories bc
+            JOIN categories c ON c.id = bc.category_id
+            WHERE bc.book_id = b.id
+        ), '{}')"""
+INDEXED_BOOKS = """
+    FROM books b
+    JOIN products p ON b.product_id = p.id
+    WHERE p.description_summary IS NOT NULL
+    AND LENGTH(p.description_summary) > 10"""
+BOOK_COLUMNS = f"""
+        b.id AS book_id,
+        p.title,
+        p.description_summary,
+        p.price,
+        p.rating,
+        p.rating_count,
+        {AUTHORS_AGG} AS authors,
+        {CATEGORIES_AGG} AS categories,
+        p.updated_at"""
 
-    client = QdrantClient(url=QDRANT_URL)
+# One row per book, in the order of the embedding files
+STREAMING_BOOKS_QUERY = f"""
+    SELECT {BOOK_COLUMNS}
+    {INDEXED_BOOKS}
+    ORDER BY b.id;
+"""
+
+STREAMING_COUNT_QUERY = f"""
+    SELECT COUNT(*)
+    {INDEXED_BOOKS};
+"""
 
+STREAMING_IDS_QUERY = f"""
+    SELECT b.id
+    {INDEXED_BOOKS}
+    ORDER BY b.id;
+"""
+
+
+def connect_postgres() -> psycopg.Connection:
+    return psycopg.connect(
+        dbname=os.getenv('POSTGRES_DB'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        host=os.getenv('POSTGRES_HOST'),
+        port=os.getenv('POSTGRES_PORT')
+    )
+
+
+def prepare_collection(client: QdrantClient, quantization: str = QUANTIZATION, on_disk: bool = DENSE_ON_DISK) -> bool:
+    """Create the book collection if needed. Returns False when it already holds points.
+
+    Args:
+        client (QdrantClient): The Qdrant client to use.
+        quantization (str, optional): Dense vector quantization, "none", "scalar" (int8) or "binary". Defaults to QDRANT_QUANTIZATION.
+        on_disk (bool, optional): Keep the original dense vectors on disk, the quantized ones staying in RAM. Defaults to QDRANT_DENSE_ON_DISK.
+    """
     # --- Create collection if it doesn't exist ---
     if client.collection_exists(BOOK_COLLECTION_NAME):
         count = client.count(collection_name=BOOK_COLLECTION_NAME)
         if count.count > 0:
             logging.info(f"Collection '{BOOK_COLLECTION_NAME}' already has {count.count} points. Skipping seeding.")
-            return
+            return False
         else:
             logging.info(f"Collection '{BOOK_COLLECTION_NAME}' exists but is empty. Deleting and recreating to ensure correct schema.")
             client.delete_collection(BOOK_COLLECTION_NAME)
@@ -34,14 +115,16 @@ def add_data_to_qdrant():
             collection_name=BOOK_COLLECTION_NAME,
             vectors_config={
                 DENSE_FIELD: models.VectorParams(
-                    size=1024,
+                    size=DENSE_DIM,
                     distance=models.Distance.COSINE,
-                    datatype=models.Datatype.FLOAT16
+                    datatype=models.Datatype.FLOAT16,
+                    on_disk=on_disk,
                 ),
             },
             sparse_vectors_config={
                 SPARSE_FIELD: models.SparseVectorParams(),
             },
+            quantization_config=quantization_config(quantization),
         )
 
         client.create_payload_index(
@@ -54,16 +137,20 @@ def add_data_to_qdrant():
                 phrase_matching=True,
             ),
         )
+    return True
+
+
+def add_data_to_qdrant():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info("Starting Qdrant data upload script")
+
+    client = QdrantClient(url=QDRANT_URL)
+    if not prepare_collection(client):
+        return
 
     # --- Database connection ---
     logging.info("Connecting to PostgreSQL database")
-    conn = psycopg.connect(
-        dbname=os.getenv('POSTGRES_DB'),
-        user=os.getenv('POSTGRES_USER'),
-        password=os.getenv('POSTGRES_PASSWORD'),
-        host=os.getenv('POSTGRES_HOST'),
-        port=os.getenv('POSTGRES_PORT')
-    )
+    conn = connect_postgres()
 
     # --- SQL queries ---
     query_books = """
@@ -171,8 +258,8 @@ def add_data_to_qdrant():
                 description_sparse = description_sparse_embeddings[idx]
                 
                 # Validate dense vector
-                if len(dense_vector) != 1024:
-                    logging.warning(f"Skipping book_id {row['book_id']}: dense vector size is {len(dense_vector)}, expected 1024")
+                if len(dense_vector) != DENSE_DIM:
+                    logging.warning(f"Skipping book_id {row['book_id']}: dense vector size is {len(dense_vector)}, expected {DENSE_DIM}")
                     batch_skipped += 1
                     continue
                 
@@ -189,6 +276,9 @@ def add_data_to_qdrant():
                 
                 # Convert float64 to float32 to save memory
                 dense_vector_list = dense_vector.astype(np.float32).tolist()
+
+                # Precompute the reranker document so search does not rebuild it per request
+                rerank_text = format_book(row)
                 
                 point = models.PointStruct(
                     id=str(row["book_id"]),
@@ -208,6 +298,8 @@ def add_data_to_qdrant():
                         "rating_count": int(row["rating_count"]) if pd.notna(row["rating_count"]) else None,
                         "authors": row["authors"],
                         "categories": row["categories"],
+                        RERANK_TEXT_FIELD: rerank_text,
+                        RERANK_TEXT_VERSION_FIELD: rerank_text_version(rerank_text),
                     },
                 )
                 batch_points.append(point)
@@ -245,5 +337,265 @@ def add_data_to_qdrant():
     total_count = client.count(collection_name=BOOK_COLLECTION_NAME)
     logging.info(f"Final count in collection: {total_count.count}")
 
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Yield the objects of a top-level JSON array, reading the file in chunks."""
+    decoder = json.JSONDecoder()
+    separators = re.compile(r"[\s,]*")
+    with open(path, "r") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos = 1
+        while True:
+            pos = separators.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield element
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def book_payload(row: Tuple) -> Dict[str, Any]:
+    """Qdrant payload of a ``STREAMING_BOOKS_QUERY`` row."""
+    book_id, title, description_summary, price, rating, rating_count, authors, categories, updated_at = row
+    payload = {
+        "book_id": int(book_id),
+        "title": str(title),
+        "description_summary": str(description_summary),
+        "price": float(price) if price is not None else None,
+        "rating": float(rating) if rating is not None else None,
+        "rating_count": int(rating_count) if rating_count is not None else None,
+        "authors": list(authors),
+        "categories": list(categories),
+        # Watermark of the incremental sync (seeds/sync_qdrant.py)
+        SOURCE_UPDATED_AT_FIELD: updated_at.timestamp(),
+    }
+    rerank_text = format_book(payload)
+    payload[RERANK_TEXT_FIELD] = rerank_text
+    payload[RERANK_TEXT_VERSION_FIELD] = rerank_text_version(rerank_text)
+    return payload
+
+
+def build_batch(rows: List[Tuple], dense: np.ndarray, sparse: List[Dict[str, List]]) -> Tuple[models.Batch, int]:
+    """Build a columnar point batch from aligned book rows and embeddings.
+
+    Dense vectors are validated and converted for the whole batch at once;
+    rows with NaNs or mismatched sparse vectors are skipped, and so is any row
+    whose payload or sparse vector cannot be built, without failing the batch.
+
+    Returns:
+        tuple: The batch and the number of skipped rows.
+    """
+    valid = ~np.isnan(dense).any(axis=1)
+    valid &= np.array([len(v["indices"]) == len(v["values"]) for v in sparse], dtype=bool)
+    for i in np.flatnonzero(~valid):
+        logging.warning(f"Skipping book_id {rows[i][0]}: NaN values in dense vector or sparse vector length mismatch")
+
+    keep, ids, payloads, sparse_vectors = [], [], [], []
+    for i in np.flatnonzero(valid):
+        try:
+            payload = book_payload(rows[i])
+            sparse_vector = models.SparseVector(indices=sparse[i]["indices"], values=sparse[i]["values"])
+        except (AttributeError, TypeError, ValueError) as e:
+            logging.warning(f"Skipping book_id {rows[i][0]}: {e}")
+            continue
+        keep.append(i)
+        ids.append(str(rows[i][0]))
+        payloads.append(payload)
+        sparse_vectors.append(sparse_vector)
+
+    batch = models.Batch(
+        ids=ids,
+        vectors={
+            DENSE_FIELD: dense[keep].astype(np.float32).tolist(),
+            SPARSE_FIELD: sparse_vectors,
+        },
+        payloads=payloads,
+    )
+    return batch, len(rows) - len(keep)
+
+
+def upload_batch(client: QdrantClient, batch: models.Batch, max_retries: int = 3) -> int:
+    for attempt in range(1, max_retries + 1):
+        try:
+            client.upsert(collection_name=BOOK_COLLECTION_NAME, points=batch, wait=True)
+            return len(batch.ids)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            logging.warning(f"Upload attempt {attempt} failed, retrying: {e}")
+            time.sleep(2 ** attempt)
+
+
+def sparse_csr_matches(cur, sparse_csr: SparseCSR, chunk_size: int = 100_000) -> bool:
+    """Whether the CSR rows are the books of ``STREAMING_IDS_QUERY``, in order."""
+    cur.itersize = chunk_size
+    cur.execute(STREAMING_IDS_QUERY)
+    offset = 0
+    while rows := cur.fetchmany(chunk_size):
+        if sparse_csr.ids(offset, offset + len(rows)) != [str(row[0]) for row in rows]:
+            logging.error(f"Sparse embeddings in {SPARSE_CSR_DIR} do not match the books from row {offset} on; reconvert them")
+            return False
+        offset += len(rows)
+    return offset == len(sparse_csr)
+
+
+def add_data_to_qdrant_streaming(batch_size: int = 1000, upload_workers: int = 4) -> bool:
+    """Seed Qdrant with memory bounded by the batch size rather than the catalogue size.
+
+    Books are read through a server-side cursor with authors and categories
+    aggregated in SQL, dense embeddings are memory-mapped, and sparse
+    embeddings are parsed incrementally. While ``upload_workers`` threads
+    upload, the next batches are prepared; at most two batches per worker are
+    in flight. Throughput and peak RSS are logged per batch.
+
+    Embeddings are checked against the books before the collection is
+    created. If a batch still fails, the collection is deleted: a partial one
+    would make later runs skip seeding.
+
+    Args:
+        batch_size (int, optional): Points per upsert. Defaults to 1000.
+        upload_workers (int, optional): Concurrent upserts. Defaults to 4.
+
+    Returns:
+        bool: False if seeding failed, True if it succeeded or the collection was already seeded.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info("Starting streaming Qdrant data upload")
+
+    store = EmbeddingStore(EMBEDDINGS_DIR)
+    keyed = store.exists()
+    if keyed:
+        # Vectors are matched by book id, so books embedded since or not yet are not an error
+        logging.info(f"Using {store.count()} embeddings keyed by book id from {EMBEDDINGS_DIR}")
+        embedding_join = EmbeddingJoin(iter(store))
+    else:
+        dense_embeddings = np.load(DENSE_EMBEDDINGS_PATH, mmap_mode="r")
+        if dense_embeddings.ndim != 2 or dense_embeddings.shape[1] != DENSE_DIM:
+            logging.error(f"Dense embeddings have shape {dense_embeddings.shape}, expected (n, {DENSE_DIM})")
+            return False
+        sparse_csr = SparseCSR(SPARSE_CSR_DIR) if SparseCSR.exists(SPARSE_CSR_DIR) else None
+        if sparse_csr is not None:
+            logging.info(f"Memory-mapping {len(sparse_csr)} sparse embeddings from {SPARSE_CSR_DIR}")
+            sparse_count = len(sparse_csr)
+        else:
+            sparse_count = sum(1 for _ in iter_json_array(SPARSE_EMBEDDINGS_PATH))
+
+    client = QdrantClient(url=QDRANT_URL)
+    conn = connect_postgres()
+    created = seeded = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(STREAMING_COUNT_QUERY)
+            n_books = cur.fetchone()[0]
+        if not keyed and (dense_embeddings.shape[0] != n_books or sparse_count != n_books):
+            logging.error("Length mismatch detected!")
+            logging.error(f"Number of books: {n_books}, Dense embeddings: {dense_embeddings.shape[0]}, Sparse embeddings: {sparse_count}")
+            return False
+        if not keyed and sparse_csr is not None:
+            with conn.cursor(name="seed_book_ids") as cur:
+                if not sparse_csr_matches(cur, sparse_csr):
+                    return False
+        if not prepare_collection(client):
+            return True
+        created = True
+        logging.info(f"Streaming {n_books} books in batches of {batch_size} with {upload_workers} upload workers")
+
+        if not keyed and sparse_csr is None:
+            sparse_embeddings = iter_json_array(SPARSE_EMBEDDINGS_PATH)
+        total_batches = (n_books - 1) // batch_size + 1
+        start_time = time.time()
+        offset = total_uploaded = total_skipped = total_missing = failed_batches = 0
+        in_flight: deque[Tuple[int, Future]] = deque()
+
+        def collect(batch_num: int, future: Future):
+            nonlocal total_uploaded, failed_batches
+            try:
+                total_uploaded += future.result()
+            except Exception as e:
+                failed_batches += 1
+                logging.error(f"Failed to upload batch {batch_num}: {str(e)}")
+                return
+            elapsed = time.time() - start_time
+            logging.info(
+                f"Batch {batch_num}/{total_batches} uploaded: {total_uploaded} points, "
+                f"{total_uploaded / elapsed:.0f} points/s, peak RSS {peak_rss_mb():.0f} MB"
+            )
+
+        # A named cursor keeps the result set on the server and fetches it in batches
+        with conn.cursor(name="seed_books") as cur, ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="qdrant-upload") as executor:
+            cur.itersize = batch_size
+            cur.execute(STREAMING_BOOKS_QUERY)
+            batch_num = 0
+            while rows := cur.fetchmany(batch_size):
+                batch_num += 1
+                if keyed:
+                    found = embedding_join.lookup([str(row[0]) for row in rows])
+                    total_missing += sum(1 for e in found if e is None)
+                    rows = [row for row, e in zip(rows, found) if e is not None]
+                    found = [e for e in found if e is not None]
+                    if not rows:
+                        continue
+                    dense = np.stack([e[1] for e in found])
+                    sparse = [e[2] for e in found]
+                else:
+                    dense = np.asarray(dense_embeddings[offset:offset + len(rows)])
+                    if sparse_csr is None:
+                        sparse = list(islice(sparse_embeddings, len(rows)))
+                    elif sparse_csr.ids(offset, offset + len(rows)) != [str(row[0]) for row in rows]:
+                        # Checked up front, so the catalogue changed while seeding
+                        logging.error(f"Sparse embeddings in {SPARSE_CSR_DIR} do not match the books of batch {batch_num}; reconvert them")
+                        return False
+                    else:
+                        sparse = sparse_csr.slice(offset, offset + len(rows))
+                    offset += len(rows)
+                batch, skipped = build_batch(rows, dense, sparse)
+                total_skipped += skipped
+                if not batch.ids:
+                    logging.warning(f"Batch {batch_num} has no valid points to upload")
+                    continue
+                while len(in_flight) >= 2 * upload_workers:
+                    collect(*in_flight.popleft())
+                in_flight.append((batch_num, executor.submit(upload_batch, client, batch)))
+            while in_flight:
+                collect(*in_flight.popleft())
+
+        if total_missing:
+            logging.warning(f"{total_missing} books have no embeddings yet; run python -m seeds.embed_books or python -m seeds.sync_qdrant to add them")
+        elapsed = time.time() - start_time
+        logging.info(
+            f"Streaming upload completed in {elapsed:.1f}s. Total uploaded: {total_uploaded}, Total skipped: {total_skipped}, "
+            f"Failed batches: {failed_batches}, Throughput: {total_uploaded / elapsed:.0f} points/s, Peak RSS: {peak_rss_mb():.0f} MB"
+        )
+        seeded = failed_batches == 0
+        if seeded:
+            total_count = client.count(collection_name=BOOK_COLLECTION_NAME)
+            logging.info(f"Final count in collection: {total_count.count}")
+        return seeded
+    finally:
+        conn.close()
+        if created and not seeded:
+            logging.error(f"Seeding failed; deleting collection '{BOOK_COLLECTION_NAME}' so the next run seeds it again")
+            client.delete_collection(BOOK_COLLECTION_NAME)
+
+
 if __name__ == "__main__":
-    add_data_to_qdrant()
\ No newline at end of file
+    if os.getenv("SEED_MODE", "streaming") == "legacy":
+        add_data_to_qdrant()
+    elif not add_data_to_qdrant_streaming(
+        batch_size=int(os.getenv("SEED_BATCH_SIZE", 1000)),
+        upload_workers=int(os.getenv("SEED_UPLOAD_WORKERS", 4)),
+    ):
+        sys.exit(1)
@@ -0,0 +1,58 @@
+import argparse
+import logging
+import time
+import dotenv
+from seeds.add_data_to_qdrant import INDEXED_BOOKS, SPARSE_CSR_DIR, SPARSE_EMBEDDINGS_PATH, connect_postgres, iter_json_array, peak_rss_mb
+from seeds.sparse_csr import SparseCSR, write_csr
+
+dotenv.load_dotenv()
+
+# Ids of the books the positional JSON file was built from, in its order
+BOOK_IDS_QUERY = f"""
+    SELECT b.id
+    {INDEXED_BOOKS}
+    ORDER BY b.id;
+"""
+
+
+def convert_sparse_embeddings(json_path: str = SPARSE_EMBEDDINGS_PATH, directory: str = SPARSE_CSR_DIR):
+    """Convert the positional sparse embeddings JSON into a memory-mappable CSR directory.
+
+    The JSON file has no ids: vector ``i`` is assumed to belong to the ``i``-th
+    book of the seeding query, so the ids are read from today's Postgres in
+    that order and stored alongside the vectors. Nothing checks that the JSON
+    was built from this catalogue: if books were added or removed since, the
+    vectors are silently paired with the wrong ids, and the seeder's id check
+    cannot notice because it compares against the same query. Only the vector
+    count is verified. Convert right after building the JSON, from the same
+    database. The JSON is parsed incrementally, twice.
+
+    Args:
+        json_path (str, optional): JSON array of ``{"indices", "values"}`` objects. Defaults to SPARSE_EMBEDDINGS_PATH.
+        directory (str, optional): Output directory. Defaults to SPARSE_CSR_DIR.
+    """
+    start_time = time.time()
+    conn = connect_postgres()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(BOOK_IDS_QUERY)
+            book_ids = [str(row[0]) for row in cur]
+    finally:
+        conn.close()
+
+    write_csr(directory, lambda: iter_json_array(json_path), book_ids)
+    csr = SparseCSR(directory)
+    logging.info(
+        f"Converted {len(csr)} sparse vectors ({len(csr.indices)} non-zeros) from {json_path} to {directory} "
+        f"in {time.time() - start_time:.1f}s, peak RSS {peak_rss_mb():.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Convert sparse seed embeddings from JSON to memory-mapped CSR.")
+    parser.add_argument("--input", default=SPARSE_EMBEDDINGS_PATH, help="JSON file to convert.")
+    parser.add_argument("--output", default=SPARSE_CSR_DIR, help="Directory to write the CSR arrays to.")
+    args = parser.parse_args()
+
+    convert_sparse_embeddings(args.input, args.output)
@@ -0,0 +1,167 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import dotenv
+import numpy as np
+from fastembed import SparseTextEmbedding
+from constants.constants import DENSE_DIM, RERANK_TEXT_FIELD
+from retriever.book_text import format_book
+from retriever.embedding_client import build_dense_embedder
+from seeds.add_data_to_qdrant import BOOK_COLUMNS, EMBEDDINGS_DIR, INDEXED_BOOKS, book_payload, connect_postgres, peak_rss_mb
+from seeds.embedding_store import EmbeddingStore
+
+dotenv.load_dotenv()
+
+# Books after the resume point of the catalogue scan, in the id order the shards are written in
+BOOKS_AFTER_QUERY = f"""
+    SELECT {BOOK_COLUMNS}
+    {INDEXED_BOOKS}
+    AND (%(after)s::uuid IS NULL OR b.id > %(after)s::uuid)
+    ORDER BY b.id;
+"""
+
+REMAINING_COUNT_QUERY = f"""
+    SELECT COUNT(*)
+    {INDEXED_BOOKS}
+    AND (%(after)s::uuid IS NULL OR b.id > %(after)s::uuid);
+"""
+
+BOOK_IDS_QUERY = f"""
+    SELECT b.id
+    {INDEXED_BOOKS};
+"""
+
+# Books missing from a finished store; random UUIDs of new books can sort anywhere
+BOOKS_BY_ID_QUERY = f"""
+    SELECT {BOOK_COLUMNS}
+    {INDEXED_BOOKS}
+    AND b.id = ANY(%(ids)s::uuid[])
+    ORDER BY b.id;
+"""
+
+
+def embed_dense(embedder, texts: List[str], batch_size: int, workers: int) -> np.ndarray:
+    """Embed ``texts`` in requests of ``batch_size``, ``workers`` requests at a time, keeping their order."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dense-embed") as executor:
+        vectors = [v for batch in executor.map(embedder.embed, batches) for v in batch]
+    dense = np.asarray(vectors, dtype=np.float32)
+    if dense.shape != (len(texts), DENSE_DIM):
+        raise ValueError(f"Dense embeddings have shape {dense.shape}, expected ({len(texts)}, {DENSE_DIM})")
+    return dense
+
+
+def embed_books(
+    directory: str = EMBEDDINGS_DIR,
+    shard_size: int = 4096,
+    dense_backend: str = "jina",
+    dense_batch_size: int = 64,
+    dense_workers: int = 4,
+    sparse_model: str = "prithivida/Splade_PP_en_v1",
+    sparse_parallel: int = 0,
+    restart: bool = False,
+):
+    """Embed the catalogue into an ``EmbeddingStore``, then any book it is missing.
+
+    The first run scans every book in id order through a server-side cursor.
+    For each shard, the dense vectors of the reranker text (``format_book``)
+    are requested in batches on threads while SPLADE embeds the description
+    summaries with FastEmbed's data-parallel mode, one worker process per core.
+    Every finished shard is a checkpoint, so an interrupted scan restarts after
+    its last id.
+
+    Once the scan is finished, the last id means nothing: new books get random
+    UUIDs that may sort below it. Every run then compares the ids in Postgres
+    with those in the store and embeds the missing books into new shards.
+
+    Args:
+        directory (str, optional): Where shards and the manifest are written. Defaults to "seeds/embeddings".
+        shard_size (int, optional): Books per shard and checkpoint. Defaults to 4096.
+        dense_backend (str, optional): Dense embedding backend, as for the server. Defaults to "jina".
+        dense_batch_size (int, optional): Texts per dense embedding request. Defaults to 64.
+        dense_workers (int, optional): Concurrent dense embedding requests. Defaults to 4.
+        sparse_model (str, optional): FastEmbed sparse model. Defaults to "prithivida/Splade_PP_en_v1".
+        sparse_parallel (int, optional): FastEmbed worker processes; 0 uses every core, None runs in-process. Defaults to 0.
+        restart (bool, optional): Discard existing shards and embed everything again. Defaults to False.
+    """
+    dense_embedder = build_dense_embedder(dense_backend)
+    sparse_embedder = SparseTextEmbedding(model_name=sparse_model)
+    store = EmbeddingStore(directory)
+    # The format probe changes whenever format_book does, which invalidates the dense vectors
+    config = {
+        "dense": dense_embedder.name,
+        "sparse": sparse_model,
+        "dense_text": format_book({"title": "{title}", "description_summary": "{description}", "categories": ["{category}"]}),
+    }
+    store.open(config, restart=restart)
+
+    def embed_rows(query: str, params: dict, remaining: int, run: int):
+        total_shards = (remaining - 1) // shard_size + 1 if remaining else 0
+        start_time = time.time()
+        embedded = 0
+        # A named cursor keeps the result set on the server and fetches it in batches
+        with conn.cursor(name="embed_books") as cur, ThreadPoolExecutor(max_workers=1, thread_name_prefix="dense-shard") as executor:
+            cur.itersize = shard_size
+            cur.execute(query, params)
+            shard_num = 0
+            while rows := cur.fetchmany(shard_size):
+                shard_num += 1
+                payloads = [book_payload(row) for row in rows]
+                dense_future = executor.submit(
+                    embed_dense, dense_embedder, [p[RERANK_TEXT_FIELD] for p in payloads], dense_batch_size, dense_workers,
+                )
+                sparse = [
+                    (e.indices, e.values)
+                    for e in sparse_embedder.embed([p["description_summary"] for p in payloads], parallel=sparse_parallel)
+                ]
+                store.append([str(row[0]) for row in rows], dense_future.result(), sparse, run=run)
+                embedded += len(rows)
+                elapsed = time.time() - start_time
+                logging.info(
+                    f"Shard {shard_num}/{total_shards} of run {run} written: {embedded}/{remaining} books, "
+                    f"{embedded / elapsed:.0f} books/s, peak RSS {peak_rss_mb():.0f} MB"
+                )
+
+    conn = connect_postgres()
+    try:
+        if not store.scanned():
+            after = store.last_id()
+            logging.info(f"Embedding into {directory}: {store.count()} books already done, resuming the scan after {after}")
+            with conn.cursor() as cur:
+                cur.execute(REMAINING_COUNT_QUERY, {"after": after})
+                remaining = cur.fetchone()[0]
+            embed_rows(BOOKS_AFTER_QUERY, {"after": after}, remaining, run=0)
+            store.finish_scan()
+
+        # Books added while the scan ran, or since the last run
+        with conn.cursor(name="book_ids") as cur:
+            cur.itersize = 100_000
+            cur.execute(BOOK_IDS_QUERY)
+            missing = sorted({str(row[0]) for row in cur} - store.ids())
+        logging.info(f"{len(missing)} books are not in {directory} yet")
+        if missing:
+            embed_rows(BOOKS_BY_ID_QUERY, {"ids": missing}, len(missing), run=store.new_run())
+    finally:
+        conn.close()
+        dense_embedder.close()
+
+    logging.info(f"Embedding completed: {store.count()} books in {directory}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Embed the catalogue for seeding, resuming from the last checkpoint.")
+    parser.add_argument("--restart", action="store_true", help="Discard existing embeddings and start over.")
+    args = parser.parse_args()
+
+    embed_books(
+        directory=EMBEDDINGS_DIR,
+        shard_size=int(os.getenv("EMBED_SHARD_SIZE", 4096)),
+        dense_backend=os.getenv("DENSE_BACKEND", "jina"),
+        dense_batch_size=int(os.getenv("EMBED_DENSE_BATCH_SIZE", 64)),
+        dense_workers=int(os.getenv("EMBED_DENSE_WORKERS", 4)),
+        restart=args.restart,
+    )
@@ -0,0 +1,153 @@
+import heapq
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Set, Tuple
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+
+# (book id, dense vector, sparse vector as {"indices", "values"})
+Embedding = Tuple[str, np.ndarray, Dict[str, List]]
+
+
+class EmbeddingStore:
+    """Book embeddings on disk, keyed by book id, written in append-only shards.
+
+    Each shard is an ``.npz`` file with the book ids, a float32 dense matrix
+    and the sparse vectors in CSR form (``indptr``, ``indices``, ``values``).
+    Shards belong to runs, each written in ascending id order. Run 0 is the
+    scan of the whole catalogue: until it is marked finished, the last id of
+    its last shard is the resume point. Later runs hold books added since
+    (``ids`` gives what is stored); their ids interleave with run 0, so
+    iteration merges the runs. The manifest lists finished shards and the
+    models that produced them; a shard is only listed once it is fully
+    written, so an interrupted job loses at most the shard it was writing.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self) -> Dict[str, Any]:
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def open(self, config: Dict[str, str], restart: bool = False) -> Dict[str, Any]:
+        """Open the store for writing, checking that it was built with ``config``.
+
+        Args:
+            config (dict): Models and text format the embeddings are computed with.
+            restart (bool, optional): Discard existing shards and start over. Defaults to False.
+
+        Raises:
+            ValueError: If existing shards were built with a different config.
+
+        Returns:
+            dict: The manifest.
+        """
+        if restart and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        if not self.exists():
+            os.makedirs(self.directory, exist_ok=True)
+            manifest = {"config": config, "shards": [], "scanned": False}
+            self._write_manifest(manifest)
+            return manifest
+        manifest = self.manifest()
+        if manifest["config"] != config:
+            raise ValueError(
+                f"Embeddings in {self.directory} were built with {manifest['config']}, not {config}. "
+                "Restart the job to rebuild them."
+            )
+        return manifest
+
+    def last_id(self) -> str | None:
+        """Resume point of the catalogue scan: the last id of run 0, or None if it has no shard."""
+        shards = [shard for shard in self.manifest()["shards"] if shard.get("run", 0) == 0]
+        return shards[-1]["last_id"] if shards else None
+
+    def scanned(self) -> bool:
+        return self.manifest().get("scanned", False)
+
+    def finish_scan(self):
+        manifest = self.manifest()
+        manifest["scanned"] = True
+        self._write_manifest(manifest)
+
+    def new_run(self) -> int:
+        return max((shard.get("run", 0) for shard in self.manifest()["shards"]), default=0) + 1
+
+    def ids(self) -> Set[str]:
+        """Ids of every stored book, read without loading the vectors."""
+        ids = set()
+        for shard in self.manifest()["shards"]:
+            with np.load(os.path.join(self.directory, shard["file"])) as data:
+                ids.update(str(book_id) for book_id in data["ids"])
+        return ids
+
+    def count(self) -> int:
+        return sum(shard["count"] for shard in self.manifest()["shards"])
+
+    def append(self, ids: List[str], dense: np.ndarray, sparse: List[Tuple[np.ndarray, np.ndarray]], run: int = 0):
+        """Write one shard of ``run``, then record it in the manifest."""
+        manifest = self.manifest()
+        name = f"shard-{len(manifest['shards']):05d}.npz"
+        lengths = [len(indices) for indices, _ in sparse]
+        tmp_path = os.path.join(self.directory, f".{name}")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=np.asarray(ids, dtype=str),
+                dense=np.asarray(dense, dtype=np.float32),
+                indptr=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                indices=np.concatenate([indices for indices, _ in sparse]).astype(np.int32) if sparse else np.empty(0, np.int32),
+                values=np.concatenate([values for _, values in sparse]).astype(np.float32) if sparse else np.empty(0, np.float32),
+            )
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        manifest["shards"].append({"file": name, "count": len(ids), "last_id": ids[-1], "run": run})
+        self._write_manifest(manifest)
+
+    def __iter__(self) -> Iterator[Embedding]:
+        """Yield every stored embedding in ascending book id order, one shard per run in memory at a time."""
+        runs: Dict[int, List[Dict[str, Any]]] = {}
+        for shard in self.manifest()["shards"]:
+            runs.setdefault(shard.get("run", 0), []).append(shard)
+        return heapq.merge(*(self._iter_shards(shards) for shards in runs.values()), key=lambda embedding: embedding[0])
+
+    def _iter_shards(self, shards: List[Dict[str, Any]]) -> Iterator[Embedding]:
+        for shard in shards:
+            with np.load(os.path.join(self.directory, shard["file"])) as data:
+                ids, dense, indptr, indices, values = (data[k] for k in ("ids", "dense", "indptr", "indices", "values"))
+            for i, book_id in enumerate(ids):
+                start, end = indptr[i], indptr[i + 1]
+                yield str(book_id), dense[i], {"indices": indices[start:end].tolist(), "values": values[start:end].tolist()}
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class EmbeddingJoin:
+    """Merge-join of id-ordered book rows with an ``EmbeddingStore``.
+
+    Both sides are sorted by book id (Postgres orders UUIDs like their
+    lowercase hex strings), so each embedding is read once.
+    """
+
+    def __init__(self, embeddings: Iterator[Embedding]):
+        self._embeddings = embeddings
+        self._current = next(self._embeddings, None)
+
+    def lookup(self, book_ids: List[str]) -> List[Embedding | None]:
+        """Embedding of each of ``book_ids`` (ascending), or None for books that were not embedded."""
+        found = []
+        for book_id in book_ids:
+            while self._current is not None and self._current[0] < book_id:
+                self._current = next(self._embeddings, None)
+            found.append(self._current if self._current is not None and self._current[0] == book_id else None)
+        return found
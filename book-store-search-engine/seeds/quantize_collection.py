@@ -0,0 +1,38 @@
+import argparse
+import logging
+import dotenv
+from qdrant_client import QdrantClient, models
+from constants.constants import BOOK_COLLECTION_NAME, DENSE_FIELD
+from retriever.quantization import QUANTIZATIONS, quantization_config
+from seeds.add_data_to_qdrant import DENSE_ON_DISK, QDRANT_URL, QUANTIZATION
+
+dotenv.load_dotenv()
+
+
+def quantize_collection(quantization: str = QUANTIZATION, on_disk: bool = DENSE_ON_DISK):
+    """Change the dense vector storage of the existing book collection, without reseeding.
+
+    Qdrant rebuilds the quantized vectors and moves the originals in the
+    background; search keeps working meanwhile.
+
+    Args:
+        quantization (str, optional): "none", "scalar" (int8) or "binary". Defaults to QDRANT_QUANTIZATION.
+        on_disk (bool, optional): Keep the original dense vectors on disk. Defaults to QDRANT_DENSE_ON_DISK.
+    """
+    client = QdrantClient(url=QDRANT_URL)
+    client.update_collection(
+        collection_name=BOOK_COLLECTION_NAME,
+        vectors_config={DENSE_FIELD: models.VectorParamsDiff(on_disk=on_disk)},
+        quantization_config=quantization_config(quantization) or models.Disabled.DISABLED,
+    )
+    logging.info(f"Collection '{BOOK_COLLECTION_NAME}' updated: quantization={quantization}, dense vectors on disk={on_disk}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Change the dense vector quantization of the book collection.")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=QUANTIZATION)
+    parser.add_argument("--on-disk", action=argparse.BooleanOptionalAction, default=DENSE_ON_DISK, help="Keep the original dense vectors on disk.")
+    args = parser.parse_args()
+
+    quantize_collection(args.quantization, args.on_disk)
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterable, List
+import numpy as np
+
+# One .npy file per column, so each can be memory-mapped on its own
+CSR_FILES = ("indptr", "indices", "values", "book_ids")
+
+
+class SparseCSR:
+    """Sparse vectors in CSR form, memory-mapped from a directory of ``.npy`` files.
+
+    Row ``i`` holds the book ``book_ids[i]`` and the entries
+    ``indices[indptr[i]:indptr[i + 1]]`` / ``values[...]``. Opening the
+    directory reads only the array headers; slices are served from the page
+    cache, so memory stays bounded by the slice size, not the catalogue.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.indptr, self.indices, self.values, self.book_ids = (
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in CSR_FILES
+        )
+        if len(self.indptr) != len(self.book_ids) + 1 or not self.indptr[-1] == len(self.indices) == len(self.values):
+            raise ValueError(f"{directory} is not a consistent CSR matrix.")
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in CSR_FILES)
+
+    def __len__(self) -> int:
+        return len(self.book_ids)
+
+    def ids(self, start: int, stop: int) -> List[str]:
+        return [book_id.decode("utf-8") for book_id in self.book_ids[start:stop]]
+
+    def slice(self, start: int, stop: int) -> List[Dict[str, List]]:
+        """Rows ``start`` to ``stop`` as ``{"indices", "values"}`` dicts, as stored in the JSON file."""
+        bounds = np.asarray(self.indptr[start:stop + 1]) - self.indptr[start]
+        indices = np.asarray(self.indices[self.indptr[start]:self.indptr[stop]]).tolist()
+        values = np.asarray(self.values[self.indptr[start]:self.indptr[stop]]).tolist()
+        return [
+            {"indices": indices[lo:hi], "values": values[lo:hi]}
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+
+
+def write_csr(directory: str, vectors: Callable[[], Iterable[Dict[str, List]]], book_ids: List[str]):
+    """Write sparse vectors to ``directory`` in the format read by ``SparseCSR``.
+
+    ``vectors`` is called twice: a first pass sizes the arrays, a second fills
+    them through ``np.lib.format.open_memmap``. Neither pass holds more than
+    one vector in memory.
+
+    The arrays are written to a temporary sibling directory that replaces
+    ``directory`` only once complete, so an interrupted or failed conversion
+    never leaves a partial CSR directory that ``SparseCSR.exists`` accepts.
+
+    Args:
+        directory (str): Output directory, replaced if it exists.
+        vectors (callable): Returns a fresh iterable of ``{"indices", "values"}`` dicts, in ``book_ids`` order.
+        book_ids (list): Book id of each vector.
+
+    Raises:
+        ValueError: If the number of vectors differs from the number of book ids, or a vector is malformed.
+    """
+    lengths = []
+    for vector in vectors():
+        if len(vector["indices"]) != len(vector["values"]):
+            raise ValueError(f"Vector {len(lengths)} has {len(vector['indices'])} indices but {len(vector['values'])} values.")
+        lengths.append(len(vector["indices"]))
+    if len(lengths) != len(book_ids):
+        raise ValueError(f"Got {len(lengths)} vectors for {len(book_ids)} book ids.")
+
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{name}.", dir=parent)
+    os.chmod(staging, 0o755)
+    try:
+        _write_arrays(staging, vectors, book_ids, lengths)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    # A non-empty directory cannot be replaced in one rename: move the old one aside first
+    previous = None
+    if os.path.exists(directory):
+        previous = tempfile.mkdtemp(prefix=f".{name}.old.", dir=parent)
+        os.replace(directory, os.path.join(previous, name))
+    os.replace(staging, directory)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def _write_arrays(directory: str, vectors: Callable[[], Iterable[Dict[str, List]]], book_ids: List[str], lengths: List[int]):
+    encoded_ids = [str(book_id).encode("utf-8") for book_id in book_ids]
+    np.save(os.path.join(directory, "book_ids.npy"), np.array(encoded_ids, dtype=f"S{max(map(len, encoded_ids), default=1)}"))
+    indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    np.save(os.path.join(directory, "indptr.npy"), indptr)
+
+    nnz = int(indptr[-1])
+    indices = np.lib.format.open_memmap(os.path.join(directory, "indices.npy"), mode="w+", dtype=np.int32, shape=(nnz,))
+    values = np.lib.format.open_memmap(os.path.join(directory, "values.npy"), mode="w+", dtype=np.float32, shape=(nnz,))
+    written = 0
+    for i, vector in enumerate(vectors()):
+        if i >= len(lengths) or len(vector["indices"]) != lengths[i]:
+            raise ValueError(f"Vector {i} changed between the two passes.")
+        indices[indptr[i]:indptr[i + 1]] = vector["indices"]
+        values[indptr[i]:indptr[i + 1]] = vector["values"]
+        written += 1
+    if written != len(lengths):
+        raise ValueError(f"Second pass yielded {written} vectors, expected {len(lengths)}.")
+    indices.flush()
+    values.flush()
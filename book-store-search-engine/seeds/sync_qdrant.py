@@ -0,0 +1,291 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Set, Tuple
+import dotenv
+from fastembed import SparseTextEmbedding
+from qdrant_client import QdrantClient, models
+from redis import Redis
+from constants.constants import BOOK_COLLECTION_NAME, SPARSE_FIELD, DENSE_FIELD, RERANK_TEXT_FIELD, RERANK_TEXT_VERSION_FIELD, SOURCE_UPDATED_AT_FIELD
+from retriever.embedding_client import DenseEmbedder, build_dense_embedder
+from seeds.add_data_to_qdrant import (
+    AUTHORS_AGG,
+    BOOK_COLUMNS,
+    CATEGORIES_AGG,
+    INDEXED_BOOKS,
+    QDRANT_URL,
+    book_payload,
+    connect_postgres,
+    prepare_collection,
+    upload_batch,
+)
+
+dotenv.load_dotenv()
+
+# Link tables (book_authors, book_categories) carry no timestamps, so the
+# authors and categories of every indexed book are compared with Qdrant.
+BOOK_LINKS_QUERY = f"""
+    SELECT
+        b.id AS book_id,
+        {AUTHORS_AGG} AS authors,
+        {CATEGORIES_AGG} AS categories
+    {INDEXED_BOOKS};
+"""
+
+# Full rows of books whose product changed after the watermark, plus the
+# books found new or relinked by BOOK_LINKS_QUERY
+CHANGED_BOOKS_QUERY = f"""
+    SELECT {BOOK_COLUMNS}
+    {INDEXED_BOOKS}
+    AND (
+        %(since)s::timestamp IS NULL
+        OR p.updated_at > %(since)s::timestamp
+        OR b.id = ANY(%(ids)s::uuid[])
+    );
+"""
+
+# Payload read back from Qdrant to diff against Postgres
+INDEX_STATE_PAYLOAD = ["price", "rating", "rating_count", "authors", "categories", RERANK_TEXT_VERSION_FIELD, SOURCE_UPDATED_AT_FIELD]
+
+# Fields that can change without re-embedding; everything the embeddings are
+# computed from is covered by the rerank text version
+PAYLOAD_ONLY_FIELDS = ["price", "rating", "rating_count", "authors", SOURCE_UPDATED_AT_FIELD]
+
+# Cached search results hold book ids and scores, so they go stale when the index changes
+SEARCH_RESULT_KEYS = "search:*:result:*"
+
+
+def load_index_state(client: QdrantClient, page_size: int = 1000) -> Dict[str, Dict[str, Any]]:
+    """Scroll the collection and return the diffed payload fields of every point, by point id."""
+    state: Dict[str, Dict[str, Any]] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=BOOK_COLLECTION_NAME,
+            limit=page_size,
+            offset=offset,
+            with_payload=INDEX_STATE_PAYLOAD,
+            with_vectors=False,
+        )
+        for point in points:
+            state[str(point.id)] = point.payload or {}
+        if offset is None:
+            return state
+
+
+def watermark(state: Dict[str, Dict[str, Any]], overlap: timedelta) -> datetime | None:
+    """Latest source update already indexed, minus ``overlap``; None when any point predates the sync."""
+    if not state:
+        return None
+    timestamps = [payload.get(SOURCE_UPDATED_AT_FIELD) for payload in state.values()]
+    if any(ts is None for ts in timestamps):
+        return None
+    # products.updated_at is a naive TIMESTAMP; fromtimestamp() inverts the
+    # datetime.timestamp() that book_payload() stored
+    return datetime.fromtimestamp(max(timestamps)) - overlap
+
+
+def classify(payload: Dict[str, Any], current: Dict[str, Any] | None) -> str:
+    """How a point must change: "embed" (new or text changed), "payload" (set_payload only) or "unchanged"."""
+    if current is None or current.get(RERANK_TEXT_VERSION_FIELD) != payload[RERANK_TEXT_VERSION_FIELD]:
+        return "embed"
+    if any(current.get(field) != payload[field] for field in PAYLOAD_ONLY_FIELDS):
+        return "payload"
+    return "unchanged"
+
+
+def embed_batch(
+    items: List[Tuple[str, Dict[str, Any]]],
+    dense_embedder: DenseEmbedder,
+    sparse_model: SparseTextEmbedding,
+) -> models.Batch:
+    """Embed new or changed books: the dense vector from the reranker text, the sparse one from the summary."""
+    payloads = [payload for _, payload in items]
+    dense = dense_embedder.embed([payload[RERANK_TEXT_FIELD] for payload in payloads])
+    sparse = sparse_model.embed([payload["description_summary"] for payload in payloads])
+    return models.Batch(
+        ids=[point_id for point_id, _ in items],
+        vectors={
+            DENSE_FIELD: [list(map(float, vector)) for vector in dense],
+            SPARSE_FIELD: [models.SparseVector(indices=e.indices.tolist(), values=e.values.tolist()) for e in sparse],
+        },
+        payloads=payloads,
+    )
+
+
+def update_payloads(client: QdrantClient, items: List[Tuple[str, Dict[str, Any]]]):
+    """Apply payload-only changes in one request, without touching the vectors."""
+    client.batch_update_points(
+        collection_name=BOOK_COLLECTION_NAME,
+        update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in items
+        ],
+        wait=True,
+    )
+
+
+def chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def invalidate_search_results(redis_client: Redis) -> int:
+    deleted = 0
+    batch = []
+    for key in redis_client.scan_iter(match=SEARCH_RESULT_KEYS, count=1000):
+        batch.append(key)
+        if len(batch) >= 500:
+            deleted += redis_client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += redis_client.unlink(*batch)
+    return deleted
+
+
+def sync_qdrant(
+    batch_size: int = 64,
+    full: bool = False,
+    dry_run: bool = False,
+    overlap_seconds: int = 300,
+    dense_backend: str = "jina",
+    sparse_model: str = "prithivida/Splade_PP_en_v1",
+    redis_client: Redis | None = None,
+) -> Dict[str, int]:
+    """Bring the Qdrant collection in line with Postgres, touching only what changed.
+
+    1. The payload of every point is scrolled from Qdrant. The watermark is the
+       latest ``source_updated_at`` indexed, minus ``overlap_seconds`` to catch
+       transactions that committed late.
+    2. The authors and categories of every indexed book are compared with the
+       points, which finds new, relinked and deleted books.
+    3. Books updated after the watermark, and those found in 2., are read in
+       full and diffed: new books and books whose title, summary or categories
+       changed are re-embedded and upserted; price, rating and author changes
+       are applied with ``set_payload``.
+    4. Points of deleted books, or books no longer eligible, are deleted.
+
+    Args:
+        batch_size (int, optional): Books per embedding call and per Qdrant request. Defaults to 64.
+        full (bool, optional): Diff every book, ignoring the watermark. Defaults to False.
+        dry_run (bool, optional): Log what would change without writing. Defaults to False.
+        overlap_seconds (int, optional): How far before the watermark changes are re-read. Defaults to 300.
+        dense_backend (str, optional): Dense embedding backend, as for the server. Defaults to "jina".
+        sparse_model (str, optional): FastEmbed sparse model. Defaults to "prithivida/Splade_PP_en_v1".
+        redis_client (Redis, optional): When given, cached search results are dropped after a change. Defaults to None.
+
+    Returns:
+        dict: Number of embedded, payload-updated, deleted and unchanged points.
+    """
+    start_time = time.time()
+    client = QdrantClient(url=QDRANT_URL)
+    if not client.collection_exists(BOOK_COLLECTION_NAME):
+        prepare_collection(client)
+
+    state = load_index_state(client)
+    since = None if full else watermark(state, timedelta(seconds=overlap_seconds))
+    logging.info(f"Loaded {len(state)} indexed points; syncing changes since {since.isoformat() if since else 'the beginning (full diff)'}")
+
+    counts = {"embedded": 0, "payload_updated": 0, "deleted": 0, "unchanged": 0}
+    dense_embedder = sparse_embedder = None
+    to_embed: List[Tuple[str, Dict[str, Any]]] = []
+    to_update: List[Tuple[str, Dict[str, Any]]] = []
+
+    def flush(force: bool = False):
+        nonlocal dense_embedder, sparse_embedder
+        if to_update and (force or len(to_update) >= batch_size):
+            if not dry_run:
+                update_payloads(client, to_update)
+            counts["payload_updated"] += len(to_update)
+            to_update.clear()
+        if to_embed and (force or len(to_embed) >= batch_size):
+            if not dry_run:
+                if dense_embedder is None:
+                    dense_embedder = build_dense_embedder(dense_backend)
+                    sparse_embedder = SparseTextEmbedding(model_name=sparse_model)
+                upload_batch(client, embed_batch(to_embed, dense_embedder, sparse_embedder))
+            counts["embedded"] += len(to_embed)
+            logging.info(f"Embedded {counts['embedded']} books, updated {counts['payload_updated']} payloads")
+            to_embed.clear()
+
+    conn = connect_postgres()
+    try:
+        eligible: Set[str] = set()
+        relinked: List[str] = []
+        # Named cursors keep the result sets on the server and fetch them in batches
+        with conn.cursor(name="sync_book_links") as cur:
+            cur.itersize = 1000
+            cur.execute(BOOK_LINKS_QUERY)
+            for book_id, authors, categories in cur:
+                point_id = str(book_id)
+                eligible.add(point_id)
+                current = state.get(point_id)
+                if current is None or current.get("authors") != list(authors) or current.get("categories") != list(categories):
+                    relinked.append(point_id)
+        deleted = [point_id for point_id in state if point_id not in eligible]
+        logging.info(f"{len(eligible)} eligible books; {len(relinked)} new or relinked, {len(deleted)} to delete")
+
+        with conn.cursor(name="sync_changed_books") as cur:
+            cur.itersize = batch_size
+            cur.execute(CHANGED_BOOKS_QUERY, {"since": since, "ids": relinked})
+            while rows := cur.fetchmany(batch_size):
+                for row in rows:
+                    point_id = str(row[0])
+                    payload = book_payload(row)
+                    action = classify(payload, state.get(point_id))
+                    if action == "embed":
+                        to_embed.append((point_id, payload))
+                    elif action == "payload":
+                        to_update.append((point_id, payload))
+                    else:
+                        counts["unchanged"] += 1
+                flush()
+            flush(force=True)
+    finally:
+        conn.close()
+        if dense_embedder is not None:
+            dense_embedder.close()
+
+    for batch in chunks(deleted, batch_size):
+        if not dry_run:
+            client.delete(
+                collection_name=BOOK_COLLECTION_NAME,
+                points_selector=models.PointIdsList(points=batch),
+                wait=True,
+            )
+        counts["deleted"] += len(batch)
+
+    changed = counts["embedded"] + counts["payload_updated"] + counts["deleted"]
+    if changed and redis_client is not None and not dry_run:
+        logging.info(f"Invalidated {invalidate_search_results(redis_client)} cached search results")
+
+    logging.info(
+        f"Sync {'dry run ' if dry_run else ''}completed in {time.time() - start_time:.1f}s. "
+        f"Embedded: {counts['embedded']}, Payload updated: {counts['payload_updated']}, "
+        f"Deleted: {counts['deleted']}, Unchanged: {counts['unchanged']}"
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Incrementally sync the Qdrant book collection from Postgres.")
+    parser.add_argument("--full", action="store_true", help="Diff every book, ignoring the updated-at watermark.")
+    parser.add_argument("--dry-run", action="store_true", help="Log what would change without writing.")
+    args = parser.parse_args()
+
+    redis_client = Redis(
+        host=os.getenv("REDIS_HOST"),
+        port=int(os.getenv("REDIS_PORT")),
+        decode_responses=False,
+    ) if os.getenv("REDIS_HOST") and os.getenv("SYNC_INVALIDATE_CACHE", "true").lower() == "true" else None
+    sync_qdrant(
+        batch_size=int(os.getenv("SYNC_BATCH_SIZE", 64)),
+        full=args.full,
+        dry_run=args.dry_run,
+        overlap_seconds=int(os.getenv("SYNC_OVERLAP_SECONDS", 300)),
+        dense_backend=os.getenv("DENSE_BACKEND", "jina"),
+        redis_client=redis_client,
+    )
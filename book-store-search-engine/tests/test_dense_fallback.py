@@ -0,0 +1,132 @@
+import asyncio
+import httpx
+import numpy as np
+import pytest
+import requests
+from retriever.async_hybrid_retriever import AsyncHybridRetriever
+from retriever.embedding_cache import EmbeddingCache
+from retriever.embedding_client import CircuitBreaker, DenseEmbedder, EmbeddingError, FastEmbedDenseEmbedder, JinaEmbeddingClient
+from retriever.hybrid_retriever import HybridRetriever
+
+BAD_BODIES = [b'{"detail": "quota exceeded"}', b'{"data": [{"index": 0}]}', b'{"data": []}', b"<html>maintenance</html>"]
+
+
+class FakeSparse:
+    def embed(self, texts, **kwargs):
+        for _ in [texts] if isinstance(texts, str) else texts:
+            yield type("Embedding", (), {"indices": np.array([1, 2]), "values": np.array([0.5, 0.5])})()
+
+
+def _client(body: bytes, status: int = 200) -> JinaEmbeddingClient:
+    client = JinaEmbeddingClient(api_key="test", max_retries=0, breaker=CircuitBreaker(failure_threshold=1))
+
+    def post(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = status
+        response._content = body
+        return response
+
+    async def apost(url, **kwargs):
+        return httpx.Response(status, content=body, request=httpx.Request("POST", url))
+
+    client.session.post = post
+    client._async_client = type("AsyncClient", (), {"post": staticmethod(apost)})()
+    return client
+
+
+def _retriever(client: JinaEmbeddingClient) -> HybridRetriever:
+    retriever = HybridRetriever.__new__(HybridRetriever)
+    retriever.dense_embedder = client
+    retriever.embedding_cache = EmbeddingCache()
+    retriever.task = "text-matching"
+    retriever.sparse_model_name = "sparse"
+    retriever.sparse_model = FakeSparse()
+    retriever.parallel_embedding = False
+    return retriever
+
+
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_malformed_response_is_an_embedding_error_and_opens_the_breaker(body):
+    client = _client(body)
+    with pytest.raises(EmbeddingError):
+        client.embed(["fantasy"])
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_malformed_response_falls_back_to_sparse(body):
+    retriever = _retriever(_client(body))
+    embeddings = retriever.embed_hybrid("fantasy")
+    assert embeddings["dense"] is None
+    assert embeddings["sparse"] == {"indices": [1, 2], "values": [0.5, 0.5]}
+    assert retriever._embed_dense_batch_or_none(["fantasy", "horror"]) == [None, None]
+
+
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_malformed_response_falls_back_to_sparse_async(body):
+    async_retriever = AsyncHybridRetriever.__new__(AsyncHybridRetriever)
+    async_retriever.retriever = _retriever(_client(body))
+
+    async def embed():
+        return await async_retriever._embed_dense_or_none("fantasy"), await async_retriever._embed_dense_batch_or_none(["horror"])
+
+    assert asyncio.run(embed()) == (None, [None])
+
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_auth_error_opens_the_breaker(status):
+    client = _client(b'{"detail": "invalid api key"}', status)
+    with pytest.raises(EmbeddingError):
+        client.embed(["fantasy"])
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_auth_error_opens_the_breaker_async(status):
+    client = _client(b'{"detail": "invalid api key"}', status)
+    with pytest.raises(EmbeddingError):
+        asyncio.run(client.aembed(["fantasy"]))
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("status", [400, 422])
+def test_payload_rejection_keeps_the_breaker_closed(status):
+    client = _client(b'{"detail": "input too long"}', status)
+    with pytest.raises(EmbeddingError):
+        client.embed(["fantasy"])
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+class BrokenOnnxModel:
+    def embed(self, texts, **kwargs):
+        raise RuntimeError("[ONNXRuntimeError] : 6 : RUNTIME_EXCEPTION")
+        yield
+
+
+def test_local_backend_failure_falls_back_to_sparse():
+    embedder = FastEmbedDenseEmbedder.__new__(FastEmbedDenseEmbedder)
+    embedder.name, embedder.model, embedder.task_id = "fastembed/test", BrokenOnnxModel(), 4
+    with pytest.raises(EmbeddingError):
+        embedder.embed(["fantasy"])
+    retriever = _retriever(embedder)
+    assert retriever.embed_hybrid("fantasy")["dense"] is None
+    assert retriever._embed_dense_batch_or_none(["fantasy"]) == [None]
+
+
+def test_transport_error_is_an_embedding_error():
+    client = JinaEmbeddingClient(api_key="test", max_retries=0)
+
+    def post(*args, **kwargs):
+        raise requests.ConnectionError("connection refused")
+
+    client.session.post = post
+    with pytest.raises(EmbeddingError):
+        client.embed(["fantasy"])
+
+
+def test_backend_without_embed_fails_at_construction():
+    class NoEmbed(DenseEmbedder):
+        name = "broken"
+
+    with pytest.raises(TypeError):
+        NoEmbed()
@@ -0,0 +1,36 @@
+import numpy as np
+from retriever.embedding_cache import EmbeddingCache
+
+
+class DictRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+
+def test_local_and_redis_hits_return_the_same_vector():
+    redis = DictRedis()
+    vector = np.random.default_rng(0).standard_normal(1024).tolist()
+    writer, reader = EmbeddingCache(redis), EmbeddingCache(redis)
+    writer.set_dense("jina", "text-matching", "fantasy", vector)
+
+    local_hit = writer.get_dense("jina", "text-matching", "fantasy")
+    redis_hit = reader.get_dense("jina", "text-matching", "fantasy")
+    assert writer.stats()["dense"]["lru_hits"] == 1
+    assert reader.stats()["dense"]["redis_hits"] == 1
+    assert local_hit == redis_hit
+    assert np.allclose(local_hit, vector, atol=1e-2)
+
+
+def test_local_tier_keeps_compact_bytes():
+    cache = EmbeddingCache()
+    cache.set_dense("jina", "text-matching", "fantasy", [0.25] * 1024)
+    cache.set_sparse("splade", "fantasy", {"indices": [3, 7], "values": [0.5, 1.5]})
+    assert all(isinstance(data, bytes) for data in cache._lru.values())
+    assert len(next(iter(cache._lru.values()))) == 2 * 1024
+    assert cache.get_sparse("splade", "fantasy") == {"indices": [3, 7], "values": [0.5, 1.5]}
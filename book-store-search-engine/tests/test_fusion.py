@@ -0,0 +1,15 @@
+import pytest
+from retriever.fusion import DBSF, RRF, fuse, fusion_weights
+
+SPARSE = [("s1", 9.0), ("both", 7.0), ("s2", 3.0)]
+DENSE = [("d1", 0.9), ("both", 0.8), ("d2", 0.4)]
+
+
+@pytest.mark.parametrize("fusion", [RRF, DBSF])
+def test_dense_only_weight_drops_sparse_ids(fusion):
+    assert {i for i, _ in fuse(fusion, [SPARSE, DENSE], fusion_weights(1.0))} == {"d1", "both", "d2"}
+
+
+@pytest.mark.parametrize("fusion", [RRF, DBSF])
+def test_sparse_only_weight_drops_dense_ids(fusion):
+    assert {i for i, _ in fuse(fusion, [SPARSE, DENSE], fusion_weights(0.0))} == {"s1", "both", "s2"}
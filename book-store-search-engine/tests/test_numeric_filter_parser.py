@@ -0,0 +1,47 @@
+import json
+import os
+import pytest
+from query_processor.numeric_filter_parser import is_resolved, parse_numeric_filters
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(__file__), "..", "benchmarks")
+QUERY_FILES = [
+    os.path.join(BENCHMARKS_DIR, "numeric_filter_queries.jsonl"),
+    os.path.join(BENCHMARKS_DIR, "numeric_filter_queries_heldout.jsonl"),
+]
+
+
+def _rows():
+    for path in QUERY_FILES:
+        with open(path) as f:
+            yield from (json.loads(line) for line in f if line.strip())
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("fantasy books under $15", {"price_max": 15}),
+    ("romance between 10 and 20 dollars", {"price_min": 10, "price_max": 20}),
+    ("horror with 2k+ reviews", {"rating_count_min": 2000}),
+    ("books rated 3 to 4", {"rating_min": 3, "rating_max": 4}),
+    ("fahrenheit 451", {}),
+])
+def test_parse_numeric_filters(query, expected):
+    filters, _ = parse_numeric_filters(query)
+    assert filters == expected
+
+
+@pytest.mark.parametrize("query", ["fantasy books under $15", "cozy mysteries with 3000+ reviews and under $9", "books below 3 stars"])
+def test_generic_remainder_is_resolved(query):
+    _, remainder = parse_numeric_filters(query)
+    assert is_resolved(remainder)
+
+
+@pytest.mark.parametrize("query", ["stephen king under $10", "stephen king novels 4 stars and up", "tolkien books under 10 dollars", "books by tolkien under $10"])
+def test_remainder_that_may_name_an_author_is_not_resolved(query):
+    _, remainder = parse_numeric_filters(query)
+    assert not is_resolved(remainder)
+
+
+def test_no_labelled_author_is_resolved_locally():
+    for row in _rows():
+        filters, remainder = parse_numeric_filters(row["query"])
+        if row.get("authors"):
+            assert not (filters and is_resolved(remainder)), row["query"]
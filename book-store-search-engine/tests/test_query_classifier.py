@@ -0,0 +1,28 @@
+import pytest
+from query_processor.query_classifier import EXTRACT, SKIP, SPECULATE, QueryClassifier, name_like_tokens
+
+
+@pytest.fixture
+def classifier():
+    return QueryClassifier()
+
+
+@pytest.mark.parametrize("query", ["stephen king", "tolkien books", "dune frank herbert", "harry potter"])
+def test_short_queries_that_may_name_an_author_are_not_skipped(classifier, query):
+    assert classifier.classify(query) == SPECULATE
+
+
+@pytest.mark.parametrize("query", ["fantasy books", "cozy mysteries", "children's books", "sci-fi classics"])
+def test_short_generic_queries_are_skipped(classifier, query):
+    assert classifier.classify(query) == SKIP
+
+
+@pytest.mark.parametrize("query", ["books by tolkien", "fantasy under $10", "highly rated thrillers"])
+def test_constraint_cues_are_extracted(classifier, query):
+    assert classifier.classify(query) == EXTRACT
+
+
+def test_name_like_tokens():
+    assert name_like_tokens("Stephen King's novels") == ["stephen", "king"]
+    assert name_like_tokens("dystopian fiction with a") == []
+    assert name_like_tokens("history books about the war") == []
@@ -0,0 +1,57 @@
+import threading
+import pytest
+from retriever.rerank_scheduler import RerankScheduler
+
+
+class LengthModel:
+    def predict(self, pairs, **kwargs):
+        return [len(doc) for _, doc in pairs]
+
+
+def test_scores_are_returned_per_caller():
+    scheduler = RerankScheduler(LengthModel())
+    try:
+        assert scheduler.score("q", ["a", "abc"]) == [1.0, 3.0]
+    finally:
+        scheduler.close()
+
+
+class CountingModel(LengthModel):
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, **kwargs):
+        self.calls += 1
+        return super().predict(pairs, **kwargs)
+
+
+def test_concurrent_callers_share_a_batch():
+    model = CountingModel()
+    scheduler = RerankScheduler(model, max_wait_ms=200)
+    callers = 8
+    documents = [["x" * (10 * i + j + 1) for j in range(i + 1)] for i in range(callers)]
+    results = [None] * callers
+    barrier = threading.Barrier(callers)
+
+    def call(i):
+        barrier.wait()
+        results[i] = scheduler.score(f"q{i}", documents[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+    finally:
+        scheduler.close()
+    assert model.calls < callers
+    assert results == [[float(len(doc)) for doc in docs] for docs in documents]
+
+
+def test_submit_after_close_raises_instead_of_hanging():
+    scheduler = RerankScheduler(LengthModel())
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.score("q", ["a"])
+    scheduler.close()
@@ -0,0 +1,51 @@
+import uuid
+import pytest
+from redis import ConnectionError as RedisConnectionError
+from retriever.search_cache import SearchCache, decode_results, encode_results
+
+UUIDS = [str(uuid.uuid4()) for _ in range(3)]
+
+
+@pytest.mark.parametrize("ids", [
+    [3, 1, 2**40],
+    UUIDS,
+    ["isbn-978", "é-unicode", UUIDS[0]],
+    [],
+])
+def test_results_round_trip(ids):
+    results = [{"book_id": book_id, "score": 0.5 * i, "text": "dropped"} for i, book_id in enumerate(ids)]
+    decoded, fresh_until = decode_results(encode_results(results, 123.5))
+    assert fresh_until == 123.5
+    assert decoded == [{"book_id": book_id, "score": 0.5 * i} for i, book_id in enumerate(ids)]
+
+
+def test_non_canonical_uuid_is_kept_verbatim():
+    book_id = UUIDS[0].upper()
+    decoded, _ = decode_results(encode_results([{"book_id": book_id, "score": 1.0}], 0.0))
+    assert decoded[0]["book_id"] == book_id
+
+
+class FailingRedis:
+    """Redis client whose every command fails, as when Redis is down."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RedisConnectionError("Connection refused")
+        return fail
+
+    def pipeline(self, transaction=True):
+        return self
+
+
+@pytest.fixture
+def failing_cache():
+    return SearchCache(FailingRedis(), identity={"collection": "books"})
+
+
+def test_top_queries_degrades_when_redis_is_down(failing_cache):
+    assert failing_cache.top_queries(10) == []
+
+
+def test_result_cache_degrades_when_redis_is_down(failing_cache):
+    assert failing_cache.get_result("fantasy", 10, {}) is None
+    failing_cache.set_result("fantasy", 10, {}, {"results": []})
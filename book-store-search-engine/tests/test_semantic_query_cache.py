@@ -0,0 +1,22 @@
+from query_processor.semantic_query_cache import SemanticQueryCache, constraint_signature
+
+
+def test_signature_ignores_wording_but_not_names_or_numbers():
+    assert constraint_signature("Tolkien books under 10 dollars") == constraint_signature("books by tolkien under $10")
+    assert constraint_signature("books by stephen king") != constraint_signature("books by stephen fry")
+    assert constraint_signature("fantasy under $10") != constraint_signature("fantasy over $10")
+
+
+def test_similar_query_naming_another_author_is_rejected():
+    cache = SemanticQueryCache(threshold=0.9)
+    cache.put("books by stephen king", [1.0, 0.0], {"authors": ["Stephen King"]})
+    assert cache.get("books by stephen fry", [1.0, 0.01]) is None
+    assert cache.stats()["guard_rejections"] == 1
+
+
+def test_match_below_the_nearest_candidate_is_used():
+    cache = SemanticQueryCache(threshold=0.9)
+    cache.put("books by stephen fry", [1.0, 0.01], {"authors": ["Stephen Fry"]})
+    cache.put("books by stephen king", [1.0, 0.05], {"authors": ["Stephen King"]})
+    structured_query, _ = cache.get("stephen king books", [1.0, 0.0])
+    assert structured_query == {"authors": ["Stephen King"]}
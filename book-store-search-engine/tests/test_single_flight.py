@@ -0,0 +1,63 @@
+import threading
+import time
+import pytest
+from retriever.single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def _run_concurrently(flight: SingleFlight, fn):
+    barrier = threading.Barrier(CALLERS)
+    outcomes = [None] * CALLERS
+
+    def call(i):
+        barrier.wait()
+        try:
+            outcomes[i] = flight.do("search:fantasy", fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_run():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["book-1", "book-2"]
+
+    outcomes = _run_concurrently(flight, fn)
+    assert len(calls) == 1
+    assert outcomes == [["book-1", "book-2"]] * CALLERS
+    assert flight.stats() == {"leaders": 1, "coalesced": CALLERS - 1, "remote_coalesced": 0}
+
+
+def test_leader_exception_reaches_waiters():
+    flight = SingleFlight()
+
+    def fn():
+        time.sleep(0.2)
+        raise ValueError("qdrant down")
+
+    outcomes = _run_concurrently(flight, fn)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.stats()["leaders"] == 1
+
+
+def test_key_is_released_after_a_failed_call():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("search:fantasy", fail)
+    assert flight.do("search:fantasy", lambda: "fresh") == "fresh"